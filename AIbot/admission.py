@@ -0,0 +1,110 @@
+# admission.py
+import math
+import time
+from collections import OrderedDict
+from typing import Hashable
+
+from response_cache import normalize_prompt
+
+ADMITTED = "admitted"
+USER_LIMITED = "user_limited"       # 使用者超過上限 (剛超過時回覆一次罐頭訊息)
+USER_LIMITED_SILENT = "user_limited_silent" # 使用者持續超過上限，直接忽略
+CHANNEL_LIMITED = "channel_limited" # 頻道超過上限，直接忽略
+DUPLICATE = "duplicate"             # 重複的相同內容，直接忽略
+
+class SlidingWindowLimiter:
+    """
+    以滑動視窗估計每個鍵最近 window 秒內的次數。
+    每個鍵只保存 [目前視窗的開始時間, 目前視窗次數, 上一個視窗次數]，
+    估計值 = 上一個視窗次數 × 尚未滑出的比例 + 目前視窗次數，每次記錄都是 O(1)。
+    鍵依最後一次記錄的時間排序，閒置超過一個視窗的鍵從最舊的一端清除。
+    """
+
+    def __init__(self, window: float, max_keys: int):
+        self.window = window
+        self.max_keys = max_keys
+        self._windows: OrderedDict[Hashable, list] = OrderedDict()
+
+    def hit(self, key: Hashable, now: float) -> float:
+        """記錄一次並返回包含這次在內的估計次數。"""
+        start = math.floor(now / self.window) * self.window
+        state = self._windows.get(key)
+        if state is None:
+            state = self._windows[key] = [start, 0, 0]
+        elif state[0] != start:
+            state[2] = state[1] if start - state[0] == self.window else 0
+            state[0], state[1] = start, 0
+        state[1] += 1
+        self._windows.move_to_end(key)
+        while self._windows:
+            oldest = next(iter(self._windows.values()))
+            if len(self._windows) <= self.max_keys and oldest[0] >= start - self.window:
+                break
+            self._windows.popitem(last=False)
+        return state[2] * (1 - (now - start) / self.window) + state[1]
+
+    def __len__(self) -> int:
+        return len(self._windows)
+
+class AdmissionController:
+    """
+    在呼叫 Gemini 之前決定是否處理一則訊息：每位使用者和每個頻道的滑動視窗上限，
+    以及同一位使用者短時間內重複相同內容的訊息。被擋下的訊息不會排隊，也不消耗 API 額度。
+    """
+
+    def __init__(self, user_limit: int, user_window: float, channel_limit: int, channel_window: float,
+                 duplicate_window: float, max_tracked: int):
+        self.user_limit = user_limit
+        self.channel_limit = channel_limit
+        self.duplicate_window = duplicate_window
+        self.max_tracked = max_tracked
+        self.users = SlidingWindowLimiter(user_window, max_tracked)
+        self.channels = SlidingWindowLimiter(channel_window, max_tracked)
+        self._recent_prompts: OrderedDict[tuple, float] = OrderedDict() # (使用者, 提示雜湊) -> 時間
+        self.counts = dict.fromkeys((ADMITTED, USER_LIMITED, USER_LIMITED_SILENT, CHANNEL_LIMITED, DUPLICATE), 0)
+
+    def check(self, user_id: int, channel_id: int, prompt: str, rerun: bool = False) -> str:
+        """
+        rerun=True 表示訊息被修改後重新處理：只修改大小寫或標點時，正規化後的內容和原本相同，
+        所以不做重複內容檢查 (否則永遠得不到回覆)；但仍然計入使用者和頻道的視窗，
+        連續修改同一則訊息不能繞過上限、無限制地呼叫 Gemini。
+        """
+        decision = self._decide(user_id, channel_id, prompt, time.monotonic(), rerun)
+        self.counts[decision] += 1
+        return decision
+
+    def _decide(self, user_id: int, channel_id: int, prompt: str, now: float, rerun: bool) -> str:
+        user_count = self.users.hit(user_id, now)
+        if user_count > self.user_limit:
+            # 只有剛超過上限的那一則回覆，持續洗版時不再回應 (避免 Bot 自己也跟著洗版)
+            return USER_LIMITED if user_count - 1 <= self.user_limit else USER_LIMITED_SILENT
+        if self.channels.hit(channel_id, now) > self.channel_limit:
+            return CHANNEL_LIMITED
+        key = (user_id, hash(normalize_prompt(prompt)))
+        if rerun:
+            self._remember(key, now)
+        elif self._is_duplicate(key, now):
+            return DUPLICATE
+        return ADMITTED
+
+    def _is_duplicate(self, key: tuple, now: float) -> bool:
+        seen = self._recent_prompts.get(key)
+        if seen is not None and now - seen < self.duplicate_window:
+            return True
+        self._remember(key, now)
+        return False
+
+    def _remember(self, key: tuple, now: float):
+        self._recent_prompts[key] = now
+        self._recent_prompts.move_to_end(key)
+        while self._recent_prompts:
+            oldest = next(iter(self._recent_prompts.values()))
+            if len(self._recent_prompts) <= self.max_tracked and now - oldest < self.duplicate_window:
+                break
+            self._recent_prompts.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {
+            **{f"admission_{decision}": count for decision, count in self.counts.items()},
+            "admission_tracked_users": len(self.users),
+        }
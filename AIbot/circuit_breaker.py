@@ -0,0 +1,128 @@
+# circuit_breaker.py
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable
+
+import aiohttp
+
+from gemini_scheduler import RETRYABLE_STATUSES
+
+CLOSED = "closed"       # 正常：請求照常送出
+OPEN = "open"           # 故障：請求不送出，直接使用備用回應
+HALF_OPEN = "half_open" # 探測中：只有背景探測請求會送出
+
+class CircuitOpenError(Exception):
+    """斷路器開啟中，請求沒有送出。"""
+
+def is_backend_failure(error: Exception) -> bool:
+    """表示 Gemini 本身有問題的錯誤 (過載、連線失敗、逾時)，不包括提示被拒絕之類的 4xx。"""
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status in RETRYABLE_STATUSES
+    return isinstance(error, (aiohttp.ClientError, asyncio.TimeoutError))
+
+class CircuitBreaker:
+    """
+    Gemini 的斷路器。
+    - closed：記錄最近 window_seconds 秒內每次請求的結果，錯誤率或緩慢請求的比例超過門檻時開啟。
+    - open：新的請求立刻失敗 (改用備用回應)，不必等到逾時；open_seconds 秒後進入 half_open。
+    - half_open：在背景送出一個探測請求，成功就恢復為 closed，失敗則再開啟 open_seconds 秒。
+    """
+
+    def __init__(self, window_seconds: float, min_calls: int, failure_rate: float, slow_call_seconds: float,
+                 slow_call_rate: float, open_seconds: float, probe: Callable[[], Awaitable[None]] | None = None):
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.probe = probe # 探測用的請求，失敗時拋出例外
+        self.state = CLOSED
+        self._calls: deque[tuple[float, bool, bool]] = deque() # (時間, 是否失敗, 是否緩慢)
+        self._failures = 0
+        self._slow_calls = 0
+        self._recover_task: asyncio.Task | None = None
+        self.trips = 0    # 開啟過的次數
+        self.rejected = 0 # 開啟期間直接拒絕的請求數量
+
+    def allow(self) -> bool:
+        if self.state == CLOSED:
+            return True
+        self.rejected += 1
+        return False
+
+    def record(self, latency: float, error: Exception | None = None):
+        """記錄一次請求的結果；latency 是請求本身花費的時間 (不含排隊)。"""
+        if self.state != CLOSED:
+            return # 開啟期間由探測決定何時恢復
+        now = time.monotonic()
+        call = (now, error is not None and is_backend_failure(error), latency >= self.slow_call_seconds)
+        self._calls.append(call)
+        self._failures += call[1]
+        self._slow_calls += call[2]
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            _, failed, slow = self._calls.popleft()
+            self._failures -= failed
+            self._slow_calls -= slow
+        if len(self._calls) < self.min_calls:
+            return
+        failure_rate, slow_rate = self._rates()
+        if failure_rate >= self.failure_rate or slow_rate >= self.slow_call_rate:
+            self._trip(f"錯誤率 {failure_rate:.0%}，緩慢請求 {slow_rate:.0%}")
+
+    def record_cancelled(self, latency: float):
+        """請求在完成前被取消 (例如超過總時限)；已經花了很久的話仍記為緩慢請求。"""
+        if latency >= self.slow_call_seconds:
+            self.record(latency)
+
+    def _rates(self) -> tuple[float, float]:
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        return self._failures / total, self._slow_calls / total
+
+    def _reset(self):
+        self._calls.clear()
+        self._failures = self._slow_calls = 0
+
+    def _trip(self, reason: str):
+        self.state = OPEN
+        self.trips += 1
+        self._reset()
+        print(f"[斷路器] Gemini 斷路器開啟 ({reason})，{self.open_seconds:.0f} 秒後開始探測。")
+        if self._recover_task is None:
+            self._recover_task = asyncio.create_task(self._recover())
+
+    async def _recover(self):
+        try:
+            while True:
+                await asyncio.sleep(self.open_seconds)
+                self.state = HALF_OPEN
+                if self.probe is not None:
+                    try:
+                        await asyncio.wait_for(self.probe(), self.slow_call_seconds)
+                    except Exception as e:
+                        self.state = OPEN
+                        print(f"[斷路器] 探測失敗: {e!r}，{self.open_seconds:.0f} 秒後再試。")
+                        continue
+                self.state = CLOSED
+                print("[斷路器] Gemini 已恢復，斷路器關閉。")
+                return
+        finally:
+            self._recover_task = None
+
+    async def close(self):
+        if self._recover_task is not None:
+            self._recover_task.cancel()
+            await asyncio.gather(self._recover_task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        failure_rate, slow_rate = self._rates()
+        return {
+            "gemini_breaker_state": self.state,
+            "gemini_breaker_failure_rate": round(failure_rate, 3),
+            "gemini_breaker_slow_rate": round(slow_rate, 3),
+            "gemini_breaker_trips": self.trips,
+            "gemini_breaker_rejected": self.rejected,
+        }
@@ -5,7 +5,8 @@ from dotenv import load_dotenv
 load_dotenv() # 載入 .env 檔案中的環境變數
 
 # --- 環境變數設定 ---
-DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+# 合併模式下若各子系統使用不同的 Bot，可用 AIBOT_DISCORD_TOKEN 指定 AIbot 專屬的 token
+DISCORD_TOKEN = os.getenv("AIBOT_DISCORD_TOKEN") or os.getenv("DISCORD_TOKEN")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
 
 if not DISCORD_TOKEN:
@@ -13,12 +14,85 @@ if not DISCORD_TOKEN:
 if not GEMINI_API_KEY:
     raise ValueError("錯誤：GEMINI_API_KEY 環境變數未設定。請檢查 .env 檔案。")
 
-# Gemini API URL
-GEMINI_URL = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.5-flash:generateContent?key={GEMINI_API_KEY}"
+# Gemini API URL (GEMINI_API_BASE 可以指向本地的測試伺服器)
+GEMINI_API_BASE = os.getenv("GEMINI_API_BASE", "https://generativelanguage.googleapis.com/v1beta").rstrip("/")
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-flash")
+GEMINI_MODEL_URL = f"{GEMINI_API_BASE}/models/{GEMINI_MODEL}"
+GEMINI_URL = f"{GEMINI_MODEL_URL}:generateContent?key={GEMINI_API_KEY}"
+GEMINI_STREAM_URL = f"{GEMINI_MODEL_URL}:streamGenerateContent?alt=sse&key={GEMINI_API_KEY}"
+
+# --- Gemini 連線設定 ---
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "30"))        # 單次請求的總逾時
+GEMINI_CONNECT_TIMEOUT_SECONDS = float(os.getenv("GEMINI_CONNECT_TIMEOUT_SECONDS", "5")) # 建立連線的逾時
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))           # 同時進行的請求上限 (也是連線池大小)
+GEMINI_KEEPALIVE_SECONDS = float(os.getenv("GEMINI_KEEPALIVE_SECONDS", "120"))   # 閒置連線保留時間
+
+# --- Gemini 請求排程設定 ---
+GEMINI_REQUESTS_PER_MINUTE = float(os.getenv("GEMINI_REQUESTS_PER_MINUTE", "60")) # 每分鐘最多送出的請求數量
+GEMINI_BURST = int(os.getenv("GEMINI_BURST", "10"))                               # 允許的突發請求數量
+GEMINI_MAX_RETRIES = int(os.getenv("GEMINI_MAX_RETRIES", "3"))                    # 429/5xx/連線錯誤時的最多重試次數
+GEMINI_RETRY_BASE_SECONDS = float(os.getenv("GEMINI_RETRY_BASE_SECONDS", "1.0"))  # 第一次重試前的基本等待時間
+GEMINI_DEADLINE_SECONDS = float(os.getenv("GEMINI_DEADLINE_SECONDS", "25"))       # 排隊加重試的總時限，超過就改用忙碌回應
+
+# --- Gemini 斷路器設定 (故障時立刻改用備用回應，不讓每個人都等到逾時) ---
+GEMINI_BREAKER_WINDOW_SECONDS = float(os.getenv("GEMINI_BREAKER_WINDOW_SECONDS", "60"))       # 計算錯誤率的時間範圍
+GEMINI_BREAKER_MIN_CALLS = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "5"))                    # 時間範圍內至少要有幾個請求才會判斷
+GEMINI_BREAKER_FAILURE_RATE = float(os.getenv("GEMINI_BREAKER_FAILURE_RATE", "0.5"))          # 錯誤率達到此值時開啟
+GEMINI_BREAKER_SLOW_CALL_SECONDS = float(os.getenv("GEMINI_BREAKER_SLOW_CALL_SECONDS", "15")) # 超過此時間的請求視為緩慢
+GEMINI_BREAKER_SLOW_CALL_RATE = float(os.getenv("GEMINI_BREAKER_SLOW_CALL_RATE", "0.8"))      # 緩慢請求的比例達到此值時開啟
+GEMINI_BREAKER_OPEN_SECONDS = float(os.getenv("GEMINI_BREAKER_OPEN_SECONDS", "30"))           # 開啟後多久送出探測請求
+
+# --- Gemini 上下文快取設定 (性格和風格只上傳一次，之後的請求直接引用) ---
+# 注意：Gemini 要求快取至少 GEMINI_CONTEXT_CACHE_MIN_TOKENS 個 token，目前附帶的 personality.txt
+# 組成的系統提示只有約 530 個 token，所以不會建立任何快取 (stats 的 context_cache_below_threshold 會持續增加)；
+# 性格設定加長到超過門檻後才會生效
+GEMINI_CONTEXT_CACHE = os.getenv("GEMINI_CONTEXT_CACHE", "1") == "1"
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))         # 快取在 Gemini 上的有效時間
+GEMINI_CONTEXT_CACHE_REFRESH_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_SECONDS", "300"))  # 剩餘時間少於此值時延長有效時間
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))           # Gemini 不接受太短的快取，較短的性格直接附在請求中
+GEMINI_CONTEXT_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_CONTEXT_CACHE_MAX_ENTRIES", "32"))           # 最多同時保留的 (性格, 風格) 組合
+
+# --- 串流回覆設定 ---
+GEMINI_STREAMING = os.getenv("GEMINI_STREAMING", "1") == "1" # 收到第一段文字就發送，之後逐步編輯訊息
+STREAM_EDIT_INTERVAL_SECONDS = float(os.getenv("STREAM_EDIT_INTERVAL_SECONDS", "1.0")) # 兩次編輯之間的最短間隔 (避免觸發速率限制)
+DISCORD_MESSAGE_LIMIT = 2000 # 單則 Discord 訊息的字數上限，超過時接續發送新訊息
+
+# --- 回應快取設定 ---
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))                  # 最多快取的提示數量
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "21600")) # 快取回應的有效時間 (預設 6 小時)
+RESPONSE_CACHE_VARIETY = int(os.getenv("RESPONSE_CACHE_VARIETY", "3"))              # 每個提示輪流使用的回應數量
+RESPONSE_CACHE_MAX_PROMPT_CHARS = 40 # 只快取短提示 (打招呼、晚安、表情符號等)，長提示幾乎不會重複
+RESPONSE_CACHE_FILE = os.getenv("RESPONSE_CACHE_FILE") # 設定後在關閉時寫入磁碟，重新啟動時載入
+
+# --- 對話記憶設定 ---
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "10"))             # 每段對話保留的最近來回次數
+CONVERSATION_TOKEN_BUDGET = int(os.getenv("CONVERSATION_TOKEN_BUDGET", "1200"))     # 放入提示的對話紀錄 token 上限 (估計值)
+CONVERSATION_TURN_MAX_TOKENS = 200 # 單則發言保存的 token 上限，過長的發言會被截斷
+CONVERSATION_IDLE_SECONDS = float(os.getenv("CONVERSATION_IDLE_SECONDS", "1800"))   # 閒置超過此秒數的對話會被清除
+CONVERSATION_MAX_CONVERSATIONS = int(os.getenv("CONVERSATION_MAX_CONVERSATIONS", "1000")) # 同時保存的對話數量上限
+
+# --- 流量控制設定 (在呼叫 Gemini 之前擋下洗版的訊息) ---
+ADMISSION_USER_LIMIT = int(os.getenv("ADMISSION_USER_LIMIT", "6"))                          # 每位使用者在時間範圍內最多的訊息數量
+ADMISSION_USER_WINDOW_SECONDS = float(os.getenv("ADMISSION_USER_WINDOW_SECONDS", "60"))
+ADMISSION_CHANNEL_LIMIT = int(os.getenv("ADMISSION_CHANNEL_LIMIT", "30"))                    # 每個頻道在時間範圍內最多的訊息數量
+ADMISSION_CHANNEL_WINDOW_SECONDS = float(os.getenv("ADMISSION_CHANNEL_WINDOW_SECONDS", "60"))
+ADMISSION_DUPLICATE_WINDOW_SECONDS = float(os.getenv("ADMISSION_DUPLICATE_WINDOW_SECONDS", "30")) # 同一位使用者重複相同內容時忽略的時間範圍
+ADMISSION_MAX_TRACKED = 10000 # 每種計數最多追蹤的使用者/頻道數量，超過時淘汰最久沒有發言的
+
+# 記住 Bot 最近發送的訊息 ID 數量，判斷「是否在回覆 Bot」時不必呼叫 API
+BOT_MESSAGE_ID_CACHE_SIZE = int(os.getenv("BOT_MESSAGE_ID_CACHE_SIZE", "5000"))
+
+# 文字指令前綴 (以此開頭的訊息不會被當成聊天內容)
+COMMAND_PREFIX = "!"
 
 # --- 檔案路徑設定 ---
 PERSONALITY_FILE_PATH = "AIbot/assets/personality.txt"
 SPECIAL_USERS_DATA_PATH = "AIbot/data/special_users.json"
+MODERATION_DATA_PATH = "AIbot/data/moderation.json" # 惡徒用戶 ID 和關鍵字，修改後自動重新載入
+
+# --- 設定檔熱重載 (人格設定、特別使用者、回應範本、審核資料) ---
+CONFIG_RELOAD_POLL_SECONDS = float(os.getenv("CONFIG_RELOAD_POLL_SECONDS", "2"))         # 無法使用 inotify 時檢查修改時間的間隔
+CONFIG_RELOAD_DEBOUNCE_SECONDS = float(os.getenv("CONFIG_RELOAD_DEBOUNCE_SECONDS", "0.5")) # 檔案變動後等編輯器寫完再讀取
 
 # --- 預設值設定 ---
 DEFAULT_PERSONALITY = "色氣的兔女郎，今年26歲，成天想和別人性愛。"
@@ -40,6 +114,21 @@ EMPTY_PROMPT_RESPONSES = [
 GEMINI_HTTP_ERROR_RESPONSE = "哼！你是不是做了什麼奇怪的事啊？不然握才不會壞掉呢！討厭啦～ (撇頭)"
 GEMINI_GENERIC_ERROR_RESPONSE = "真是的！怎麼又出問題了啦～ 我才不是故意的喔！笨蛋… (嘟嘴)"
 GEMINI_EMPTY_RESPONSE = "哼…我才不想回答你呢！"
+GEMINI_BUSY_RESPONSE = "等、等一下啦！現在好多人找我，我忙不過來了…晚點再來找我嘛～ (慌張)"
+# 斷路器開啟 (Gemini 故障) 時立刻隨機使用的備用回應
+GEMINI_OUTAGE_RESPONSES = [
+    "唔…人家的腦袋突然一片空白了啦！等一下再來找我好不好？(揉眼睛)",
+    "哼！我現在不想說話…才、才不是壞掉了呢！晚點再來啦～",
+    "嗚…好像有什麼東西卡住了，讓我休息一下嘛…你會等我的吧？(眨眼)",
+    "現在不行啦！人家正在補妝…過一會兒再叫我喔♡",
+]
+
+# 使用者訊息太頻繁時的回應 (每次超過上限只回一次，之後直接忽略)
+ADMISSION_THROTTLED_RESPONSES = [
+    "你、你說太多話了啦！讓我喘口氣嘛…等一下再理你！(摀耳朵)",
+    "哼！一直 @ 我很煩欸！安靜一分鐘再來找我啦～",
+    "慢、慢一點啦！人家又不是只陪你一個人…(鼓臉)",
+]
 
 # Bot 狀態訊息
 BOT_ACTIVITY_STATUS = "在等你呼喚我呢...哼！"
\ No newline at end of file
@@ -0,0 +1,161 @@
+# context_cache.py
+import asyncio
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+import aiohttp
+
+from conversation import estimate_tokens
+
+# 建立快取失敗 (例如模型不支援、內容太短) 後，同一段系統提示多久之後才再次嘗試
+CREATE_RETRY_SECONDS = 600
+# 快取剩餘時間少於此值時就不再引用，避免請求送到時快取剛好過期
+EXPIRY_SAFETY_SECONDS = 10
+
+@lru_cache(maxsize=64)
+def prefix_tokens(prefix: str) -> int:
+    return estimate_tokens(prefix)
+
+class CachedPrefix:
+    def __init__(self, name: str, expires_at: float):
+        self.name = name # Gemini 返回的資源名稱，例如 "cachedContents/abc123"
+        self.expires_at = expires_at # time.monotonic() 時間
+
+class ContextCache:
+    """
+    Gemini 的上下文快取 (cachedContents)。
+    每種 (性格, 風格) 組成的系統提示只上傳一次，之後的請求只需引用快取名稱，
+    長的性格設定不必每次重新傳送，節省輸入 token 的延遲和費用。
+    - 快取還不存在時，這次請求先使用內嵌提示，同時在背景建立快取 (不增加回覆延遲)。
+    - 快取快要到期時在背景延長有效時間；沒有人使用的快取會自然過期。
+    - 建立失敗時一段時間內繼續使用內嵌提示。
+    """
+
+    def __init__(self, api_base: str, model: str, api_key: str, ttl: int, refresh_margin: int,
+                 min_tokens: int, max_entries: int, enabled: bool = True):
+        self.api_base = api_base
+        self.model = model
+        self.api_key = api_key
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.min_tokens = min_tokens
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: OrderedDict[str, CachedPrefix] = OrderedDict() # 系統提示 -> 快取 (LRU)
+        self._skipped: dict[str, float] = {} # 建立失敗的系統提示 -> 可以再次嘗試的時間
+        self._pending: dict[str, asyncio.Task] = {} # 正在建立或延長的快取，同一段提示同時只有一個
+        self._tasks: set[asyncio.Task] = set()
+        self._reported_short: set[str] = set() # 已經記錄過太短而不建立快取的系統提示
+        self.hits = 0
+        self.inline = 0
+        self.below_threshold = 0 # 因為系統提示太短 (少於 min_tokens) 而使用內嵌提示的次數
+
+    def lookup(self, session: aiohttp.ClientSession, prefix: str) -> str | None:
+        """返回可以引用的快取名稱；沒有時返回 None (使用內嵌提示)，並視情況在背景建立快取。"""
+        if not self.enabled or not prefix:
+            return None
+        now = time.monotonic()
+        entry = self._entries.get(prefix)
+        if entry is not None and entry.expires_at - now > EXPIRY_SAFETY_SECONDS:
+            self._entries.move_to_end(prefix)
+            if entry.expires_at - now < self.refresh_margin:
+                self._spawn(prefix, self._refresh, session, prefix, entry)
+            self.hits += 1
+            return entry.name
+        if entry is not None:
+            del self._entries[prefix]
+        self.inline += 1
+        tokens = prefix_tokens(prefix)
+        if tokens < self.min_tokens:
+            self.below_threshold += 1
+            if prefix not in self._reported_short and len(self._reported_short) < self.max_entries:
+                self._reported_short.add(prefix)
+                print(f"Gemini 上下文快取：系統提示只有約 {tokens} tokens，少於下限 {self.min_tokens}，使用內嵌提示。")
+            return None
+        if self._skipped.get(prefix, 0.0) <= now:
+            self._spawn(prefix, self._create, session, prefix)
+        return None
+
+    def invalidate(self, prefix: str, name: str):
+        """Gemini 表示快取已經不存在時呼叫，下次使用時重新建立。"""
+        entry = self._entries.get(prefix)
+        if entry is not None and entry.name == name:
+            del self._entries[prefix]
+
+    def _spawn(self, prefix: str, func, *args):
+        if prefix in self._pending:
+            return
+        task = asyncio.create_task(func(*args))
+        self._pending[prefix] = task
+        self._tasks.add(task)
+        task.add_done_callback(lambda _: self._pending.pop(prefix, None))
+        task.add_done_callback(self._tasks.discard)
+
+    def _skip(self, prefix: str):
+        now = time.monotonic()
+        self._skipped = {key: until for key, until in self._skipped.items() if until > now}
+        self._skipped[prefix] = now + CREATE_RETRY_SECONDS
+
+    async def _create(self, session: aiohttp.ClientSession, prefix: str):
+        payload = {
+            "model": f"models/{self.model}",
+            "systemInstruction": {"parts": [{"text": prefix}]},
+            "ttl": f"{self.ttl}s",
+        }
+        started = time.monotonic()
+        try:
+            async with session.post(f"{self.api_base}/cachedContents", params={"key": self.api_key}, json=payload) as response:
+                if response.status >= 400:
+                    print(f"建立 Gemini 上下文快取失敗: {response.status} - 回應: {await response.text()}，暫時使用內嵌提示。")
+                    self._skip(prefix)
+                    return
+                data = await response.json(content_type=None)
+            name = data["name"]
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError, KeyError) as e:
+            print(f"建立 Gemini 上下文快取失敗: {e}，暫時使用內嵌提示。")
+            self._skip(prefix)
+            return
+        self._skipped.pop(prefix, None)
+        self._entries[prefix] = CachedPrefix(name, started + self.ttl)
+        print(f"Gemini 上下文快取已建立: {name} (約 {prefix_tokens(prefix)} tokens)")
+        while len(self._entries) > self.max_entries:
+            _, evicted = self._entries.popitem(last=False)
+            task = asyncio.create_task(self._delete(session, evicted.name))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _refresh(self, session: aiohttp.ClientSession, prefix: str, entry: CachedPrefix):
+        started = time.monotonic()
+        try:
+            async with session.patch(f"{self.api_base}/{entry.name}", params={"key": self.api_key, "updateMask": "ttl"},
+                                     json={"ttl": f"{self.ttl}s"}) as response:
+                if response.status == 404:
+                    self.invalidate(prefix, entry.name)
+                    return
+                response.raise_for_status()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"延長 Gemini 上下文快取 {entry.name} 失敗: {e}")
+            return
+        entry.expires_at = started + self.ttl
+
+    async def _delete(self, session: aiohttp.ClientSession, name: str):
+        """刪除不再使用的快取 (例如性格設定修改後的舊版本)，不必等它過期。"""
+        try:
+            async with session.delete(f"{self.api_base}/{name}", params={"key": self.api_key}) as response:
+                await response.read()
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"刪除 Gemini 上下文快取 {name} 失敗: {e}")
+
+    async def close(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "context_cache_entries": len(self._entries),
+            "context_cache_hits": self.hits,
+            "context_cache_inline": self.inline,
+            "context_cache_below_threshold": self.below_threshold,
+        }
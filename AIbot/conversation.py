@@ -0,0 +1,128 @@
+# conversation.py
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+
+from response_cache import MENTION_PATTERN
+
+def is_cjk(char: str) -> bool:
+    code = ord(char)
+    return (
+        0x3040 <= code <= 0x30FF     # 日文假名
+        or 0x3400 <= code <= 0x9FFF  # 中日韓統一表意文字
+        or 0xAC00 <= code <= 0xD7AF  # 韓文
+        or 0xF900 <= code <= 0xFAFF  # 相容表意文字
+        or 0xFF00 <= code <= 0xFFEF  # 全形符號
+    )
+
+def estimate_tokens(text: str) -> int:
+    """
+    在本地粗略估計 token 數量 (不呼叫 API)：
+    中日韓文字大約一字一個 token，其他文字大約四個字元一個 token。
+    """
+    cjk = sum(1 for char in text if is_cjk(char))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """把文字截斷到大約 max_tokens 個 token 以內。"""
+    if estimate_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if estimate_tokens(text[:mid]) < max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low] + "…"
+
+@dataclass
+class Turn:
+    """對話中的一則發言。"""
+    speaker: str
+    text: str
+    tokens: int
+
+    def render(self) -> str:
+        return f"{self.speaker}：{self.text}"
+
+@dataclass
+class Conversation:
+    turns: deque
+    last_active: float = field(default_factory=time.monotonic)
+
+class ConversationStore:
+    """
+    每個 (頻道, 使用者) 的對話記憶。
+    每段對話是固定長度的環形緩衝區；對話數量有上限 (LRU)，閒置過久的對話會被清除，
+    因此記憶體用量有界。
+    """
+
+    def __init__(self, max_turns: int, turn_max_tokens: int, idle_seconds: float, max_conversations: int):
+        self.max_turns = max_turns
+        self.turn_max_tokens = turn_max_tokens
+        self.idle_seconds = idle_seconds
+        self.max_conversations = max_conversations
+        self._conversations: OrderedDict[tuple, Conversation] = OrderedDict()
+        self._last_sweep = time.monotonic()
+
+    def add_exchange(self, key: tuple, user_name: str, prompt: str, answer: str, bot_name: str):
+        """記錄一次來回 (使用者的發言和 Bot 的回覆)。"""
+        now = time.monotonic()
+        conversation = self._conversations.get(key)
+        if conversation is None:
+            # 每次來回有兩則發言
+            conversation = self._conversations[key] = Conversation(deque(maxlen=self.max_turns * 2))
+        for speaker, text in ((user_name, MENTION_PATTERN.sub("", prompt).strip()), (bot_name, answer)):
+            text = truncate_to_tokens(text, self.turn_max_tokens)
+            conversation.turns.append(Turn(speaker, text, estimate_tokens(text) + 2))
+        conversation.last_active = now
+        self._conversations.move_to_end(key)
+        while len(self._conversations) > self.max_conversations:
+            self._conversations.popitem(last=False)
+        if now - self._last_sweep > 60:
+            self.evict_idle(now)
+
+    def evict_idle(self, now: float | None = None):
+        now = now or time.monotonic()
+        self._last_sweep = now
+        # OrderedDict 依最後活動時間排序，從最舊的開始清除
+        while self._conversations:
+            key, conversation = next(iter(self._conversations.items()))
+            if now - conversation.last_active <= self.idle_seconds:
+                break
+            del self._conversations[key]
+
+    def turns(self, key: tuple) -> list[Turn]:
+        conversation = self._conversations.get(key)
+        if conversation is None or time.monotonic() - conversation.last_active > self.idle_seconds:
+            return []
+        return list(conversation.turns)
+
+    def __len__(self):
+        return len(self._conversations)
+
+def budget_history(turns: list[Turn], max_tokens: int) -> str:
+    """
+    在 max_tokens 的預算內挑選對話紀錄：從最新的發言往回保留完整發言，
+    放不下的較舊發言壓縮成一行摘要 (只保留每則發言的開頭)，預算不夠時直接捨棄。
+    返回可放入提示的文字，沒有紀錄時返回空字串。
+    """
+    kept = []
+    used = 0
+    index = len(turns)
+    while index > 0 and used + turns[index - 1].tokens <= max_tokens:
+        index -= 1
+        kept.append(turns[index])
+        used += turns[index].tokens
+    kept.reverse()
+
+    lines = []
+    older = turns[:index]
+    if older:
+        remaining = max_tokens - used
+        summary = "更早之前聊過：" + "／".join(truncate_to_tokens(turn.text, 12) for turn in older)
+        if remaining > 20:
+            lines.append(truncate_to_tokens(summary, remaining))
+    lines.extend(turn.render() for turn in kept)
+    return "\n".join(lines)
@@ -0,0 +1,138 @@
+# gemini_scheduler.py
+import asyncio
+import random
+import time
+from collections import OrderedDict, deque
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+# 這些狀態碼表示 Gemini 暫時無法處理 (速率限制或過載)，稍後重試通常會成功
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+def parse_retry_after(value: str | None) -> float | None:
+    """解析 Retry-After 標頭 (秒數或 HTTP 日期)，返回需等待的秒數。"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+class GeminiScheduler:
+    """
+    送往 Gemini 的請求排程器。
+    - 令牌桶：每分鐘最多 requests_per_minute 個請求，允許 burst 個突發。
+    - 公平佇列：先在頻道之間輪流，再在同一頻道的使用者之間輪流，
+      一個一直發言的使用者 (或頻道) 不會讓其他人一直排不到。
+    - 收到 429/5xx 或連線錯誤時以帶抖動的指數退避重試；有 Retry-After 時暫停所有請求直到指定時間。
+    """
+
+    def __init__(self, requests_per_minute: float, burst: int, max_retries: int, retry_base_seconds: float):
+        self.rate = requests_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0 # Retry-After 指定的暫停時間 (time.monotonic)
+        # 頻道 -> 使用者 -> 等待中的 future；兩層都以 OrderedDict 的順序輪流
+        self._queues: OrderedDict[object, OrderedDict[object, deque]] = OrderedDict()
+        self._queued = 0 # 佇列中還在等待的 future 數量 (取消的會立刻移除)
+        self._dispatcher: asyncio.Task | None = None
+        self.retries = 0
+        self.throttled = 0 # 收到 429 的次數
+
+    async def acquire(self, owner: tuple = ("", "")):
+        """等待輪到 owner (頻道, 使用者) 並取得一個令牌。"""
+        channel, user = owner
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(channel, OrderedDict()).setdefault(user, deque()).append(future)
+        self._queued += 1
+        future.add_done_callback(lambda _: self._discard(channel, user, future) if future.cancelled() else None)
+        if self._dispatcher is None or self._dispatcher.done():
+            self._dispatcher = asyncio.create_task(self._dispatch())
+        await future
+
+    def retry_delay(self, attempt: int, error: Exception) -> float | None:
+        """
+        第 attempt 次 (從 0 開始) 嘗試失敗後，返回重試前應等待的秒數；不應重試時返回 None。
+        """
+        if attempt >= self.max_retries:
+            return None
+        retry_after = None
+        if isinstance(error, aiohttp.ClientResponseError):
+            if error.status not in RETRYABLE_STATUSES:
+                return None
+            if error.status == 429:
+                self.throttled += 1
+            retry_after = parse_retry_after((error.headers or {}).get("Retry-After"))
+        elif not isinstance(error, (aiohttp.ClientConnectionError, asyncio.TimeoutError)):
+            return None
+        self.retries += 1
+        if retry_after is not None:
+            # 速率限制是整個 API 金鑰共用的，所有請求都要暫停
+            self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+            return retry_after
+        return self.retry_base_seconds * 2 ** attempt * random.uniform(0.5, 1.5)
+
+    def queued(self) -> int:
+        return self._queued
+
+    def _discard(self, channel, user, future: asyncio.Future):
+        """等待中的請求被取消時從佇列移除 (已經被 _next_waiter 取出的不用處理)。"""
+        users = self._queues.get(channel)
+        waiters = users.get(user) if users is not None else None
+        if waiters is None:
+            return
+        try:
+            waiters.remove(future)
+        except ValueError:
+            return
+        self._queued -= 1
+        if not waiters:
+            del users[user]
+        if not users:
+            del self._queues[channel]
+
+    def stats(self) -> dict:
+        return {"gemini_queued": self.queued(), "gemini_retries": self.retries, "gemini_throttled": self.throttled}
+
+    def _next_waiter(self) -> asyncio.Future | None:
+        """依輪流順序取出下一個等待中的 future (略過已取消的)。"""
+        while self._queues:
+            channel, users = next(iter(self._queues.items()))
+            user, waiters = next(iter(users.items()))
+            future = waiters.popleft()
+            self._queued -= 1
+            # 輪到的使用者和頻道移到隊尾，沒有等待者時移除
+            if waiters:
+                users.move_to_end(user)
+            else:
+                del users[user]
+            if users:
+                self._queues.move_to_end(channel)
+            else:
+                del self._queues[channel]
+            if not future.done():
+                return future
+        return None
+
+    async def _dispatch(self):
+        while self._queued:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(self._paused_until - now, (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+            future = self._next_waiter()
+            if future is None:
+                break
+            self._tokens -= 1
+            future.set_result(None)
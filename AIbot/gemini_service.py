@@ -1,49 +1,496 @@
 # gemini_service.py
-import requests
+import asyncio
 import json
-from typing import Dict, Any
+import random
+import threading
+import time
 
-from config import GEMINI_URL, GEMINI_HTTP_ERROR_RESPONSE, GEMINI_GENERIC_ERROR_RESPONSE, GEMINI_EMPTY_RESPONSE
-from utils import build_gemini_prompt
+import aiohttp
 
-def query_gemini_api(
-    bot_personality: str, 
-    user_prompt: str, 
-    user_name: str, 
-    user_style: str = None
+from config import (
+    GEMINI_URL, GEMINI_STREAM_URL, GEMINI_MODEL_URL, GEMINI_API_KEY, GEMINI_API_BASE, GEMINI_MODEL,
+    GEMINI_TIMEOUT_SECONDS, GEMINI_CONNECT_TIMEOUT_SECONDS, GEMINI_MAX_CONCURRENCY, GEMINI_KEEPALIVE_SECONDS,
+    GEMINI_REQUESTS_PER_MINUTE, GEMINI_BURST, GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_SECONDS, GEMINI_DEADLINE_SECONDS,
+    GEMINI_HTTP_ERROR_RESPONSE, GEMINI_GENERIC_ERROR_RESPONSE, GEMINI_EMPTY_RESPONSE, GEMINI_BUSY_RESPONSE, GEMINI_OUTAGE_RESPONSES,
+    GEMINI_BREAKER_WINDOW_SECONDS, GEMINI_BREAKER_MIN_CALLS, GEMINI_BREAKER_FAILURE_RATE,
+    GEMINI_BREAKER_SLOW_CALL_SECONDS, GEMINI_BREAKER_SLOW_CALL_RATE, GEMINI_BREAKER_OPEN_SECONDS,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_VARIETY, RESPONSE_CACHE_MAX_PROMPT_CHARS, RESPONSE_CACHE_FILE,
+    GEMINI_CONTEXT_CACHE, GEMINI_CONTEXT_CACHE_TTL_SECONDS, GEMINI_CONTEXT_CACHE_REFRESH_SECONDS,
+    GEMINI_CONTEXT_CACHE_MIN_TOKENS, GEMINI_CONTEXT_CACHE_MAX_ENTRIES
+)
+from circuit_breaker import CircuitBreaker, CircuitOpenError
+from context_cache import ContextCache
+from gemini_scheduler import GeminiScheduler
+import perf
+from response_cache import ResponseCache, prompt_key
+from utils import build_system_prefix, build_user_prompt
+
+# 正在進行中的 Gemini 請求數量 (供監督者的 stats 指令讀取)
+pending_calls = 0
+_pending_lock = threading.Lock()
+
+# 引用的上下文快取已經不存在時 (提前過期或被刪除)，Gemini 返回 404，
+# 或是錯誤訊息提到 cachedContent 找不到或已過期的 400/403；收到時改用內嵌提示再送一次。
+# 其他 400/403 (例如提示被拒絕、金鑰無效) 照一般的錯誤處理
+CACHE_ERROR_STATUSES = {400, 403}
+CACHE_MISSING_HINTS = ("not found", "expired", "does not exist")
+
+async def is_cache_missing(response: aiohttp.ClientResponse) -> bool:
+    if response.status == 404:
+        return True
+    if response.status not in CACHE_ERROR_STATUSES:
+        return False
+    body = (await response.text()).lower() # 內容會保留在 response 中，之後仍然可以讀取
+    return "cachedcontent" in body and any(hint in body for hint in CACHE_MISSING_HINTS)
+
+def build_payload(system_prefix: str, user_prompt: str, cache_name: str | None = None) -> dict:
+    """系統提示 (性格和風格) 優先引用上下文快取，沒有快取時直接附在請求中。"""
+    payload = {"contents": [{"role": "user", "parts": [{"text": user_prompt}]}]}
+    if cache_name:
+        payload["cachedContent"] = cache_name
+    elif system_prefix:
+        payload["systemInstruction"] = {"parts": [{"text": system_prefix}]}
+    return payload
+
+class GeminiClient:
+    """
+    非同步 Gemini 客戶端。
+    所有請求共用同一個 aiohttp 連線池 (keep-alive)，每則回覆不必重新進行 TCP+TLS 握手；
+    同時進行的請求數量以 semaphore 限制，也不會佔用執行緒池。
+    每次嘗試前都要經過排程器 (速率限制和公平佇列)，暫時性的錯誤會自動重試。
+    系統提示透過上下文快取只上傳一次 (見 context_cache.py)。
+    Gemini 故障時斷路器開啟，請求立刻失敗而不是等到逾時 (見 circuit_breaker.py)。
+    session 在第一次使用時於當前事件迴圈中建立。
+    """
+
+    def __init__(self, max_concurrency: int = GEMINI_MAX_CONCURRENCY, context_caching: bool = GEMINI_CONTEXT_CACHE):
+        self.max_concurrency = max_concurrency
+        self.scheduler = GeminiScheduler(GEMINI_REQUESTS_PER_MINUTE, GEMINI_BURST, GEMINI_MAX_RETRIES, GEMINI_RETRY_BASE_SECONDS)
+        self.context_cache = ContextCache(
+            GEMINI_API_BASE, GEMINI_MODEL, GEMINI_API_KEY, GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+            GEMINI_CONTEXT_CACHE_REFRESH_SECONDS, GEMINI_CONTEXT_CACHE_MIN_TOKENS, GEMINI_CONTEXT_CACHE_MAX_ENTRIES,
+            enabled=context_caching
+        )
+        self.breaker = CircuitBreaker(
+            GEMINI_BREAKER_WINDOW_SECONDS, GEMINI_BREAKER_MIN_CALLS, GEMINI_BREAKER_FAILURE_RATE,
+            GEMINI_BREAKER_SLOW_CALL_SECONDS, GEMINI_BREAKER_SLOW_CALL_RATE, GEMINI_BREAKER_OPEN_SECONDS,
+            probe=self._probe
+        )
+        self._session: aiohttp.ClientSession | None = None
+        self._semaphore: asyncio.Semaphore | None = None
+        self.loop: asyncio.AbstractEventLoop | None = None
+
+    def _ensure_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self.loop = asyncio.get_running_loop()
+            connector = aiohttp.TCPConnector(
+                limit=self.max_concurrency,
+                keepalive_timeout=GEMINI_KEEPALIVE_SECONDS,
+                ttl_dns_cache=300,
+            )
+            timeout = aiohttp.ClientTimeout(total=GEMINI_TIMEOUT_SECONDS, connect=GEMINI_CONNECT_TIMEOUT_SECONDS)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def warm_up(self):
+        """預先建立連線 (讀取模型資訊，不消耗生成額度)，讓第一則回覆不必等待握手。"""
+        session = self._ensure_session()
+        try:
+            async with session.get(GEMINI_MODEL_URL, params={"key": GEMINI_API_KEY}) as response:
+                await response.read()
+            print("Gemini 連線已預熱。")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            print(f"Gemini 連線預熱失敗: {e}")
+
+    async def generate(self, system_prefix: str, user_prompt: str, owner: tuple = ("", "")) -> dict:
+        """
+        以 owner (頻道, 使用者) 的名義排隊送出 generateContent 請求，返回解析後的 JSON。
+        重試用盡後拋出最後一次的例外 (HTTP 錯誤為 aiohttp.ClientResponseError)；
+        斷路器開啟時拋出 CircuitOpenError。
+        """
+        attempt = 0
+        while True:
+            with perf.timed("gemini_queue"):
+                await self.scheduler.acquire(owner)
+            if not self.breaker.allow(): # 排隊期間斷路器可能已經開啟
+                raise CircuitOpenError()
+            started = time.monotonic()
+            try:
+                response_json = await self._generate_once(system_prefix, user_prompt)
+            except asyncio.CancelledError:
+                self.breaker.record_cancelled(time.monotonic() - started)
+                raise
+            except Exception as e:
+                perf.record("gemini_http", time.monotonic() - started)
+                perf.count_error("gemini_http")
+                self.breaker.record(time.monotonic() - started, e)
+                delay = self.scheduler.retry_delay(attempt, e)
+                if delay is None:
+                    raise
+            else:
+                perf.record("gemini_http", time.monotonic() - started)
+                self.breaker.record(time.monotonic() - started)
+                return response_json
+            attempt += 1
+            print(f"Gemini 請求失敗，{delay:.1f} 秒後進行第 {attempt} 次重試...")
+            await asyncio.sleep(delay)
+
+    async def _post(self, url: str, system_prefix: str, user_prompt: str, **kwargs) -> aiohttp.ClientResponse:
+        """送出請求；引用的上下文快取已經不存在時 (例如在 Gemini 上提前過期)，改用內嵌提示再送一次。"""
+        session = self._ensure_session()
+        cache_name = self.context_cache.lookup(session, system_prefix)
+        response = await session.post(url, json=build_payload(system_prefix, user_prompt, cache_name), **kwargs)
+        if cache_name is not None and await is_cache_missing(response):
+            print(f"Gemini 上下文快取 {cache_name} 無法使用 ({response.status})，改用內嵌提示。")
+            response.release()
+            self.context_cache.invalidate(system_prefix, cache_name)
+            response = await session.post(url, json=build_payload(system_prefix, user_prompt), **kwargs)
+        return response
+
+    async def _generate_once(self, system_prefix: str, user_prompt: str) -> dict:
+        self._ensure_session()
+        async with self._semaphore:
+            async with await self._post(GEMINI_URL, system_prefix, user_prompt) as response:
+                if response.status >= 400:
+                    print(f"HTTP 錯誤: {response.status} - 回應: {await response.text()}")
+                response.raise_for_status() # 檢查 HTTP 請求是否成功 (2xx)
+                return await response.json(content_type=None)
+
+    async def stream(self, system_prefix: str, user_prompt: str, owner: tuple = ("", "")):
+        """
+        以 owner 的名義排隊送出串流請求，逐段產生回應文字。
+        只有在收到任何文字之前發生的錯誤會重試，已經開始的回應不會重複。
+        """
+        attempt = 0
+        while True:
+            with perf.timed("gemini_queue"):
+                await self.scheduler.acquire(owner)
+            if not self.breaker.allow():
+                raise CircuitOpenError()
+            received = False
+            started = time.monotonic()
+            try:
+                async for text in self._stream_once(system_prefix, user_prompt):
+                    if not received: # 以收到第一段文字的時間作為延遲
+                        received = True
+                        perf.record("gemini_http", time.monotonic() - started)
+                        self.breaker.record(time.monotonic() - started)
+                    yield text
+                return
+            except asyncio.CancelledError:
+                if not received:
+                    self.breaker.record_cancelled(time.monotonic() - started)
+                raise
+            except Exception as e:
+                if not received:
+                    perf.record("gemini_http", time.monotonic() - started)
+                perf.count_error("gemini_http")
+                self.breaker.record(time.monotonic() - started, e)
+                delay = None if received else self.scheduler.retry_delay(attempt, e)
+                if delay is None:
+                    raise
+            attempt += 1
+            print(f"Gemini 串流請求失敗，{delay:.1f} 秒後進行第 {attempt} 次重試...")
+            await asyncio.sleep(delay)
+
+    async def _stream_once(self, system_prefix: str, user_prompt: str):
+        """
+        送出 streamGenerateContent (SSE) 請求，逐段產生回應文字。
+        串流可能持續比 GEMINI_TIMEOUT_SECONDS 更久，所以逾時改為套用在每次讀取之間的間隔。
+        """
+        self._ensure_session()
+        timeout = aiohttp.ClientTimeout(total=None, connect=GEMINI_CONNECT_TIMEOUT_SECONDS, sock_read=GEMINI_TIMEOUT_SECONDS)
+        async with self._semaphore:
+            async with await self._post(GEMINI_STREAM_URL, system_prefix, user_prompt, timeout=timeout) as response:
+                if response.status >= 400:
+                    print(f"HTTP 錯誤: {response.status} - 回應: {await response.text()}")
+                response.raise_for_status()
+                async for raw_line in response.content:
+                    line = raw_line.decode("utf-8").strip()
+                    if not line.startswith("data:"):
+                        continue
+                    event = json.loads(line[len("data:"):])
+                    parts = event.get("candidates", [{}])[0].get("content", {}).get("parts", [])
+                    text = "".join(part.get("text", "") for part in parts)
+                    if text:
+                        yield text
+
+    async def _probe(self):
+        """斷路器的探測請求：送出一個很短的提示，不經過排程器和重試。"""
+        await self._generate_once("", "ping")
+
+    async def close(self):
+        await self.breaker.close()
+        await self.context_cache.close()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+# Bot 共用的客戶端
+client = GeminiClient()
+
+# 重複的短提示 (打招呼、晚安等) 直接使用快取的回應
+response_cache = ResponseCache(
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL_SECONDS, RESPONSE_CACHE_VARIETY,
+    RESPONSE_CACHE_MAX_PROMPT_CHARS, RESPONSE_CACHE_FILE
+)
+response_cache.load()
+
+# 錯誤或空回應不會被快取
+UNCACHEABLE_RESPONSES = {
+    GEMINI_HTTP_ERROR_RESPONSE, GEMINI_GENERIC_ERROR_RESPONSE, GEMINI_EMPTY_RESPONSE, GEMINI_BUSY_RESPONSE,
+    *GEMINI_OUTAGE_RESPONSES
+}
+
+def outage_response() -> str:
+    return random.choice(GEMINI_OUTAGE_RESPONSES)
+
+class Flight:
+    """
+    一個進行中的上游請求。相同問題的並行請求不再各自呼叫 API，
+    而是等待這個請求完成後共用它的回應。
+    回應中提到發出請求的使用者名稱時，只分給同名的使用者：名稱也可能是一般的字詞或其他字詞的一部分，
+    直接替換會改壞回應，其他人改為自己呼叫 API。
+    """
+
+    def __init__(self, user_name: str):
+        self.user_name = user_name
+        self.answer: str | None = None # 請求被取消時保持 None，等待者需自行呼叫 API
+        self.done = asyncio.Event()
+
+    def finish(self, answer: str | None):
+        self.answer = answer
+        self.done.set()
+
+    async def wait(self, user_name: str) -> str | None:
+        await self.done.wait()
+        if self.answer is None:
+            return None
+        if user_name != self.user_name and self.user_name in self.answer:
+            return None
+        return self.answer
+
+# 進行中的請求 (鍵 -> Flight)
+in_flight: dict[str, Flight] = {}
+# 因為共用進行中的請求而省下的 API 呼叫次數
+coalesced_calls = 0
+
+def flight_key(bot_personality: str, user_style: str | None, user_prompt: str, history: str) -> str:
+    return prompt_key(bot_personality, user_style, user_prompt, history)
+
+async def join_flight(key: str, user_name: str) -> str | None:
+    """
+    如果相同的問題正在進行中，等待並返回它的回應；否則返回 None (由呼叫端自己發出請求)。
+    等待的請求被取消或失敗時，醒來後再檢查一次：先醒來的等待者可能已經重新發出請求，加入它而不是各自呼叫 API。
+    """
+    global coalesced_calls
+    while (flight := in_flight.get(key)) is not None:
+        answer = await flight.wait(user_name)
+        if answer is not None:
+            coalesced_calls += 1
+            return answer
+        if flight.answer is not None:
+            return None # 回應提到別人的名稱，不能共用
+    return None
+
+def start_flight(key: str, user_name: str) -> Flight:
+    """登記一個進行中的請求；已經有其他人的請求時不覆蓋它 (只有自己的 Flight 會在結束時從 in_flight 移除)。"""
+    flight = Flight(user_name)
+    in_flight.setdefault(key, flight)
+    return flight
+
+async def query_gemini(
+    bot_personality: str,
+    user_prompt: str,
+    user_name: str,
+    user_style: str = None,
+    history: str = "",
+    owner: tuple = ("", ""),
+    gemini_client: GeminiClient = None
 ) -> str:
     """
     呼叫 Gemini AI API，並根據 Bot 性格、使用者輸入和風格產生回應。
+    owner 是 (頻道, 使用者)，用於排程器的公平佇列。
     """
-    full_prompt = build_gemini_prompt(bot_personality, user_prompt, user_name, user_style)
-    
-    headers = {"Content-Type": "application/json"}
-    payload = {"contents": [{"role": "user", "parts": [{"text": full_prompt}]}]}
+    global pending_calls
+    gemini_client = gemini_client or client
+    cache_key = response_cache.make_key(bot_personality, user_style, user_prompt, history)
+    if cache_key:
+        cached = response_cache.get(cache_key, user_name)
+        if cached is not None:
+            return cached
+    if not gemini_client.breaker.allow(): # Gemini 故障中，立刻使用備用回應
+        return outage_response()
+    key = flight_key(bot_personality, user_style, user_prompt, history)
+    shared = await join_flight(key, user_name)
+    if shared is not None:
+        return shared
+
+    flight = start_flight(key, user_name)
+    answer = None
+    with _pending_lock:
+        pending_calls += 1
+    try:
+        answer = await _query_gemini(gemini_client, owner, bot_personality, user_prompt, user_name, user_style, history)
+        if cache_key and answer not in UNCACHEABLE_RESPONSES:
+            response_cache.put(cache_key, answer, user_name)
+        return answer
+    finally:
+        with _pending_lock:
+            pending_calls -= 1
+        flight.finish(answer)
+        if in_flight.get(key) is flight:
+            del in_flight[key]
+
+async def _query_gemini(
+    gemini_client: GeminiClient,
+    owner: tuple,
+    bot_personality: str,
+    user_prompt: str,
+    user_name: str,
+    user_style: str = None,
+    history: str = ""
+) -> str:
+    system_prefix = build_system_prefix(bot_personality, user_style)
+    full_prompt = build_user_prompt(user_prompt, user_name, history)
 
     try:
-        response = requests.post(GEMINI_URL, headers=headers, json=payload, timeout=30) # 增加 timeout
-        response.raise_for_status() # 檢查 HTTP 請求是否成功 (2xx)
+        # 排隊和重試的總時間有上限，超過時回覆忙碌訊息而不是讓使用者一直等
+        response_json = await asyncio.wait_for(gemini_client.generate(system_prefix, full_prompt, owner), GEMINI_DEADLINE_SECONDS)
 
-        # 嘗試解析 JSON 回應
-        response_json = response.json()
-        
         # 安全地提取文字內容
         text = response_json.get("candidates", [{}])[0].get("content", {}).get("parts", [{}])[0].get("text", "")
-        
+
         return text or GEMINI_EMPTY_RESPONSE
-        
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP 錯誤: {http_err} - 回應: {response.text}")
-        return GEMINI_HTTP_ERROR_RESPONSE
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"連線錯誤: {conn_err}")
+
+    except asyncio.TimeoutError:
+        print(f"Gemini 請求超過時限 ({GEMINI_DEADLINE_SECONDS} 秒)，改用忙碌回應。")
+        return GEMINI_BUSY_RESPONSE
+    except Exception as e:
+        return _error_response(e)
+
+def _error_response(error: Exception) -> str:
+    """把呼叫 Gemini 時發生的例外轉換成給使用者看的錯誤回應。"""
+    if isinstance(error, CircuitOpenError):
+        return outage_response()
+    if isinstance(error, aiohttp.ClientResponseError):
+        return GEMINI_HTTP_ERROR_RESPONSE # 狀態碼和回應內容已在請求時印出
+    if isinstance(error, aiohttp.ClientError):
+        print(f"連線錯誤: {error}")
         return GEMINI_GENERIC_ERROR_RESPONSE # 或者提供一個專門的連線錯誤訊息
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"請求超時: {timeout_err}")
-        return GEMINI_GENERIC_ERROR_RESPONSE # 或者提供一個專門的超時錯誤訊息
-    except json.JSONDecodeError as json_err:
-        print(f"JSON 解析錯誤: {json_err} - 回應: {response.text}")
+    if isinstance(error, json.JSONDecodeError):
+        print(f"JSON 解析錯誤: {error}")
         return GEMINI_GENERIC_ERROR_RESPONSE
-    except Exception as e:
-        print(f"呼叫 Gemini AI 發生未知錯誤: {e}")
-        return GEMINI_GENERIC_ERROR_RESPONSE
\ No newline at end of file
+    print(f"呼叫 Gemini AI 發生未知錯誤: {error}")
+    return GEMINI_GENERIC_ERROR_RESPONSE
+
+async def stream_gemini(
+    bot_personality: str,
+    user_prompt: str,
+    user_name: str,
+    user_style: str = None,
+    history: str = "",
+    owner: tuple = ("", ""),
+    gemini_client: GeminiClient = None
+):
+    """
+    query_gemini 的串流版本：逐段產生回應文字。
+    快取命中時一次產生整個回應；還沒產生任何文字就出錯時產生對應的錯誤回應，
+    產生到一半才出錯則保留已產生的部分並結束。
+    """
+    global pending_calls
+    gemini_client = gemini_client or client
+    cache_key = response_cache.make_key(bot_personality, user_style, user_prompt, history)
+    if cache_key:
+        cached = response_cache.get(cache_key, user_name)
+        if cached is not None:
+            yield cached
+            return
+    if not gemini_client.breaker.allow():
+        yield outage_response()
+        return
+    # 相同的問題正在進行中時，等它完成後一次產生整個回應
+    key = flight_key(bot_personality, user_style, user_prompt, history)
+    shared = await join_flight(key, user_name)
+    if shared is not None:
+        yield shared
+        return
+
+    system_prefix = build_system_prefix(bot_personality, user_style)
+    full_prompt = build_user_prompt(user_prompt, user_name, history)
+    flight = start_flight(key, user_name)
+    answer = None
+    with _pending_lock:
+        pending_calls += 1
+    stream = gemini_client.stream(system_prefix, full_prompt, owner)
+    try:
+        # 時限只套用在等到第一段文字之前 (排隊和重試)，開始產生回應後就不再限制
+        try:
+            first_chunk = await asyncio.wait_for(anext(stream, None), GEMINI_DEADLINE_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"Gemini 串流請求超過時限 ({GEMINI_DEADLINE_SECONDS} 秒)，改用忙碌回應。")
+            answer = GEMINI_BUSY_RESPONSE
+            yield answer
+            return
+        except Exception as e:
+            answer = _error_response(e)
+            yield answer
+            return
+        if first_chunk is None:
+            answer = GEMINI_EMPTY_RESPONSE
+            yield answer
+            return
+        chunks = [first_chunk]
+        yield first_chunk
+        try:
+            async for chunk in stream:
+                chunks.append(chunk)
+                yield chunk
+        except Exception as e:
+            # 只記錄錯誤，這位使用者保留已產生的部分；不完整的回應不分給等待同一個問題的人
+            # (answer 保持 None，他們會自己重新請求)
+            _error_response(e)
+            return
+        answer = "".join(chunks)
+        if cache_key:
+            response_cache.put(cache_key, answer, user_name)
+    finally:
+        await stream.aclose()
+        with _pending_lock:
+            pending_calls -= 1
+        flight.finish(answer)
+        if in_flight.get(key) is flight:
+            del in_flight[key]
+
+async def _query_standalone(*args) -> str:
+    standalone_client = GeminiClient(max_concurrency=1, context_caching=False) # 一次性的連線不值得建立快取
+    try:
+        return await query_gemini(*args, gemini_client=standalone_client)
+    finally:
+        await standalone_client.close()
+
+def query_gemini_api(
+    bot_personality: str, 
+    user_prompt: str, 
+    user_name: str, 
+    user_style: str = None
+) -> str:
+    """
+    query_gemini 的同步版本，供非 async 程式碼使用。
+    Bot 的事件迴圈正在運行時 (從其他執行緒呼叫)，請求會交給共用的連線池處理；
+    否則使用一次性的連線。不可在事件迴圈的執行緒中呼叫 (請改用 await query_gemini)。
+    """
+    loop = client.loop
+    if loop is not None and loop.is_running():
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            raise RuntimeError("query_gemini_api 會阻塞事件迴圈，請改用 await query_gemini(...)")
+        future = asyncio.run_coroutine_threadsafe(
+            query_gemini(bot_personality, user_prompt, user_name, user_style), loop
+        )
+        return future.result()
+    return asyncio.run(_query_standalone(bot_personality, user_prompt, user_name, user_style))
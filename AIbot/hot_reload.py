@@ -0,0 +1,199 @@
+# hot_reload.py
+import asyncio
+import ctypes
+import ctypes.util
+import difflib
+import os
+import struct
+import sys
+from typing import Any, Callable
+
+# inotify 常數 (見 <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008 # 寫入後關閉檔案 (直接覆寫)
+IN_MOVED_TO = 0x00000080    # 檔案被移動到目錄中 (編輯器先寫暫存檔再改名)
+IN_Q_OVERFLOW = 0x00004000  # 事件佇列溢出，無法得知哪些檔案變了
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+INOTIFY_EVENT = struct.Struct("iIII") # wd, mask, cookie, len；後面接著 len 位元組的檔名
+
+def file_signature(path: str) -> tuple | None:
+    """用來判斷檔案是否變動的簽章；檔案不存在時返回 None。"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+def open_inotify(directories: list[str]) -> tuple[int, dict[int, str]] | None:
+    """
+    透過 ctypes 建立 inotify 並監看目錄 (不是檔案本身，這樣編輯器改名覆蓋檔案後仍能收到事件)。
+    返回 (fd, {watch descriptor: 目錄})；不是 Linux 或建立失敗時返回 None。
+    """
+    if not sys.platform.startswith("linux"):
+        return None
+    fd = -1
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1.argtypes = [ctypes.c_int]
+        libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失敗")
+        watch_dirs = {}
+        for directory in directories:
+            wd = libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"無法監看目錄 {directory}")
+            watch_dirs[wd] = directory
+        return fd, watch_dirs
+    except (OSError, AttributeError) as e:
+        if fd >= 0:
+            os.close(fd)
+        print(f"[熱重載] 無法使用 inotify: {e}，改為定期檢查檔案修改時間。")
+        return None
+
+def diff_text(old: str, new: str) -> str:
+    """文字檔的變更摘要：新增和刪除的行數。"""
+    added = removed = 0
+    for line in difflib.ndiff(old.splitlines(), new.splitlines()):
+        if line.startswith("+ "):
+            added += 1
+        elif line.startswith("- "):
+            removed += 1
+    return f"新增 {added} 行、刪除 {removed} 行 ({len(old)} -> {len(new)} 字)"
+
+def diff_mapping(old: dict, new: dict) -> str:
+    """字典資料的變更摘要：新增、移除和修改的鍵。"""
+    added = [key for key in new if key not in old]
+    removed = [key for key in old if key not in new]
+    changed = [key for key in new if key in old and new[key] != old[key]]
+    parts = [f"{label} {len(keys)} 項 ({', '.join(map(str, keys))})"
+             for label, keys in (("新增", added), ("移除", removed), ("修改", changed)) if keys]
+    return "、".join(parts) or "內容沒有變化"
+
+class WatchedFile:
+    """
+    一個被監看的設定檔。loader 在執行緒中讀檔、驗證並建好新的資料結構 (不合格時拋出例外)，
+    apply 在事件迴圈中一次替換整份資料，diff 產生寫進日誌的變更摘要。
+    """
+
+    def __init__(self, path: str, loader: Callable[[str], Any], apply: Callable[[Any], None],
+                 diff: Callable[[Any, Any], str], current: Any):
+        self.path = os.path.abspath(path)
+        self.loader = loader
+        self.apply = apply
+        self.diff = diff
+        self.current = current
+        self.signature = file_signature(self.path)
+        self.lock = asyncio.Lock() # 同一個檔案一次只重載一次，避免舊的結果晚一步蓋掉新的
+        self.pending: asyncio.TimerHandle | None = None
+
+class ConfigWatcher:
+    """
+    監看設定檔，檔案修改後自動重新載入，不需要重啟 Bot。
+    Linux 上使用 inotify，其他平台或 inotify 無法使用時改為定期比較檔案修改時間。
+    新檔案驗證失敗時保留原本的資料。
+    """
+
+    def __init__(self, poll_interval: float, debounce: float):
+        self.poll_interval = poll_interval
+        self.debounce = debounce # 收到事件後等一下再讀，讓編輯器把檔案寫完
+        self.files: dict[str, WatchedFile] = {}
+        self.mode: str | None = None
+        self._inotify_fd: int | None = None
+        self._watch_dirs: dict[int, str] = {}
+        self._poll_task: asyncio.Task | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    def watch(self, path: str, loader: Callable[[str], Any], apply: Callable[[Any], None],
+              diff: Callable[[Any, Any], str], current: Any):
+        """加入要監看的檔案；需要在 start() 之前呼叫。"""
+        watched = WatchedFile(path, loader, apply, diff, current)
+        self.files[watched.path] = watched
+
+    async def start(self):
+        if self.mode is not None:
+            return
+        directories = sorted({os.path.dirname(path) for path in self.files})
+        inotify = open_inotify(directories)
+        if inotify is not None:
+            self._inotify_fd, self._watch_dirs = inotify
+            asyncio.get_running_loop().add_reader(self._inotify_fd, self._read_events)
+            self.mode = "inotify"
+        else:
+            self._poll_task = asyncio.create_task(self._poll())
+            self.mode = "poll"
+        print(f"[熱重載] 開始監看 {len(self.files)} 個設定檔 ({self.mode})。")
+
+    async def stop(self):
+        if self._inotify_fd is not None:
+            asyncio.get_running_loop().remove_reader(self._inotify_fd)
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+        if self._poll_task is not None:
+            self._poll_task.cancel()
+            self._poll_task = None
+        for watched in self.files.values():
+            if watched.pending is not None:
+                watched.pending.cancel()
+                watched.pending = None
+        for task in list(self._tasks):
+            task.cancel()
+        self.mode = None
+
+    def _read_events(self):
+        try:
+            data = os.read(self._inotify_fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset + INOTIFY_EVENT.size <= len(data):
+            wd, mask, _cookie, length = INOTIFY_EVENT.unpack_from(data, offset)
+            name = data[offset + INOTIFY_EVENT.size:offset + INOTIFY_EVENT.size + length].rstrip(b"\0")
+            offset += INOTIFY_EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                for watched in self.files.values():
+                    self._schedule(watched)
+                continue
+            directory = self._watch_dirs.get(wd)
+            if directory is None:
+                continue
+            watched = self.files.get(os.path.join(directory, os.fsdecode(name)))
+            if watched is not None:
+                self._schedule(watched)
+
+    def _schedule(self, watched: WatchedFile):
+        # 連續的多個事件 (例如分段寫入) 只觸發一次重載
+        if watched.pending is not None:
+            watched.pending.cancel()
+        watched.pending = asyncio.get_running_loop().call_later(self.debounce, self._start_reload, watched)
+
+    def _start_reload(self, watched: WatchedFile):
+        watched.pending = None
+        task = asyncio.create_task(self.reload(watched))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _poll(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            for watched in self.files.values():
+                if file_signature(watched.path) != watched.signature:
+                    await self.reload(watched)
+
+    async def reload(self, watched: WatchedFile):
+        """在執行緒中載入並驗證新檔案，成功後在事件迴圈中一次替換。"""
+        async with watched.lock:
+            signature = file_signature(watched.path)
+            if signature is None or signature == watched.signature:
+                return
+            watched.signature = signature # 失敗時也記下，檔案再次修改前不重複嘗試
+            try:
+                new = await asyncio.to_thread(watched.loader, watched.path)
+            except Exception as e:
+                print(f"[熱重載] 錯誤：{watched.path} 驗證失敗: {e}。保留原本的資料。")
+                return
+            summary = watched.diff(watched.current, new)
+            watched.apply(new)
+            watched.current = new
+            print(f"[熱重載] {watched.path} 已重新載入：{summary}")
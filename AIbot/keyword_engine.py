@@ -0,0 +1,156 @@
+# keyword_engine.py
+import json
+import unicodedata
+from collections import deque
+
+# 常用繁體字 -> 簡體字 (每組兩個字)。比對前繁簡統一成簡體，兩種寫法都能命中同一個關鍵字；
+# 資料檔的 char_folding 可以補充其他需要統一的字。
+FOLD_PAIRS = """
+個个 們们 來来 這这 說说 為为 會会 對对 時时 國国 學学 開开 長长 發发 過过 還还 後后 點点 樣样 當当
+經经 與与 動动 問问 題题 見见 現现 話话 實实 麼么 愛爱 聽听 體体 頭头 氣气 電电 車车 門门 馬马 鳥鸟
+魚鱼 媽妈 爺爷 東东 貓猫 無无 間间 關关 號号 錢钱 買买 賣卖 變变 讓让 認认 識识 謝谢 請请 讀读 寫写
+語语 錯错 難难 歡欢 樂乐 義义 戰战 黨党 殺杀 傷伤 槍枪 彈弹 罵骂 幹干 乾干 髒脏 臟脏 雞鸡 賤贱 婦妇
+貨货 腦脑 殘残 廢废 滾滚 豬猪 強强 姦奸 亂乱 倫伦 黃黄 賭赌 詐诈 騙骗 專专 業业 區区 華华 灣湾 臺台
+陸陆 獨独 統统 習习 澤泽 鄧邓 貪贪 軍军 隊队 納纳 勞劳 歷历 紀纪 際际 邊边 種种 從从 裡里 裏里 麵面
+髮发 鬥斗 衛卫 綠绿 紅红 藍蓝 線线 網网 約约 級级 結结 給给 組组 細细 終终 絕绝 總总 傳传 億亿 價价
+優优 儀仪 僅仅 兩两 內内 冊册 劃划 劍剑 勝胜 協协 單单 嚴严 圍围 圖图 團团 壓压 報报 場场 壞坏 夢梦
+夠够 奪夺 奮奋 孫孙 寶宝 將将 屬属 島岛 帥帅 師师 帶带 幫帮 廣广 廳厅 彎弯 徹彻 憶忆 應应 戲戏 擊击
+據据 擔担 擁拥 擇择 擴扩 敵敌 數数 斷断 極极 構构 標标 機机 權权 歲岁 溝沟 漢汉 濟济 災灾 熱热 燈灯
+爭争 猶犹 獻献 環环 產产 畫画 異异 療疗 盡尽 監监 盤盘 確确 禮礼 禍祸 離离 穩稳 競竞 筆笔 節节 範范
+築筑 簡简 糧粮 緊紧 聯联 聲声 職职 腳脚 臉脸 興兴 舉举 艦舰 藝艺 蘇苏 蟲虫 術术 複复 覺觉 觀观 規规
+視视 親亲 計计 訊讯 記记 許许 論论 設设 證证 評评 詞词 試试 誠诚 調调 談谈 護护 貝贝 負负 財财 貴贵
+費费 資资 賊贼 贏赢 趕赶 跡迹 蹤踪 軟软 輕轻 輸输 轉转 辦办 農农 運运 遠远 遲迟 選选 遺遗 郵邮 鄉乡
+醫医 針针 鐵铁 銀银 鋼钢 錄录 鍵键 鏡镜 閉闭 陽阳 陰阴 隨随 險险 雖虽 雙双 雜杂 雲云 靈灵 韓韩 響响
+頁页 項项 順顺 須须 預预 領领 頻频 顏颜 顯显 風风 飛飞 飯饭 飲饮 餓饿 館馆 驗验 驚惊 魯鲁 麗丽 齊齐
+齒齿 龍龙 龜龟 瘋疯 癡痴 醜丑 屍尸 嗎吗 嗚呜 喲哟 囉啰 噁恶 惡恶 戀恋 憑凭 懷怀 懶懒 擺摆 攝摄 敗败
+暫暂 棄弃 殲歼 潛潜 濕湿 灑洒 爛烂 牽牵 獄狱 瘡疮 睜睁 礙碍 禪禅 窩窝 竊窃 糾纠 紛纷 綁绑 縮缩 繩绳
+羅罗 聖圣 腸肠 膽胆 艱艰 萬万 葉叶 蔣蒋 薦荐 虛虚 蝦虾 補补 襲袭 謊谎 謀谋 謎谜 譜谱 讚赞 豐丰 貸贷
+賄贿 賓宾 賽赛 趨趋 躍跃 輛辆 辭辞 遞递 邏逻 釋释 鍋锅 闖闯 隱隐 頓顿 顫颤 餵喂 騎骑 鬧闹 鬱郁 鹹咸
+麥麦 黴霉 誌志 徵征 衝冲 製制 鍾钟 鐘钟 搾榨 峯峰 綫线 朮术
+"""
+DEFAULT_CHAR_FOLDING = {pair[0]: pair[1] for pair in FOLD_PAIRS.split()}
+
+# 不影響文字意思、常被插進關鍵字中間用來躲避過濾的字元類別：空白、標點、符號、控制和格式字元 (含零寬字元)
+IGNORED_CATEGORIES = ("Z", "P", "S", "C")
+
+def normalize_text(text: str, char_folding: dict) -> str:
+    """
+    比對前的正規化：NFKC (全形轉半形、相容字元統一)、大小寫統一、
+    移除空白/標點/零寬字元，並把繁體字統一成簡體字。
+    """
+    result = []
+    for char in unicodedata.normalize("NFKC", text).casefold():
+        if unicodedata.category(char)[0] in IGNORED_CATEGORIES:
+            continue
+        result.append(char_folding.get(char, char))
+    return "".join(result)
+
+class AhoCorasick:
+    """
+    Aho-Corasick 多模式比對自動機：一次掃描就能找出文字中出現的任何關鍵字，
+    時間只和文字長度成正比，不會隨關鍵字數量增加。
+    """
+
+    def __init__(self, patterns: dict):
+        # patterns: 正規化後的關鍵字 -> 原始關鍵字
+        self._goto: list[dict] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[str | None] = [None]
+        for pattern, original in patterns.items():
+            self._insert(pattern, original)
+        self._build_failure_links()
+
+    def _insert(self, pattern: str, original: str):
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append(None)
+                self._goto[state][char] = next_state
+            state = next_state
+        self._output[state] = original
+
+    def _build_failure_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                queue.append(child)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[child] = self._goto[fallback].get(char, 0) if self._goto[fallback].get(char) != child else 0
+                # 後綴也是關鍵字時，到達此狀態同樣算命中
+                if self._output[child] is None:
+                    self._output[child] = self._output[self._fail[child]]
+
+    def search(self, text: str) -> str | None:
+        """返回文字中第一個出現的關鍵字 (原始寫法)，沒有時返回 None。"""
+        state = 0
+        for char in text:
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            if self._output[state] is not None:
+                return self._output[state]
+        return None
+
+class ModerationRules:
+    """一份編譯好的審核資料；熱重載時整份替換，比對時不會看到新舊混合的資料。"""
+
+    def __init__(self, user_ids: frozenset, char_folding: dict, keywords: dict):
+        self.user_ids = user_ids
+        self.char_folding = char_folding
+        self.keywords = keywords # 正規化後的關鍵字 -> 原始關鍵字
+        self.automaton = AhoCorasick(keywords)
+
+def load_rules(path: str) -> ModerationRules:
+    """讀取審核資料並建好自動機，格式不正確時拋出例外 (熱重載時在執行緒中執行)。"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("最外層必須是物件")
+    user_ids = frozenset(int(user_id) for user_id in data.get("evil_user_ids", []))
+    char_folding = {**DEFAULT_CHAR_FOLDING, **data.get("char_folding", {})}
+    keywords = {}
+    for keyword in data.get("evil_keywords", []):
+        normalized = normalize_text(keyword, char_folding)
+        if normalized:
+            keywords[normalized] = keyword
+    return ModerationRules(user_ids, char_folding, keywords)
+
+def diff_rules(old: ModerationRules, new: ModerationRules) -> str:
+    """審核資料的變更摘要 (寫進熱重載的日誌)。"""
+    old_keywords, new_keywords = set(old.keywords.values()), set(new.keywords.values())
+    return (f"關鍵字新增 {len(new_keywords - old_keywords)} 個、移除 {len(old_keywords - new_keywords)} 個，"
+            f"使用者新增 {len(new.user_ids - old.user_ids)} 個、移除 {len(old.user_ids - new.user_ids)} 個")
+
+class KeywordEngine:
+    """
+    審核用的關鍵字和使用者 ID (編譯成 Aho-Corasick 自動機)。
+    資料檔的修改由設定檔監看器 (見 hot_reload.py) 在背景載入並編譯，完成後以 apply 一次替換，
+    比對時不需要檢查檔案；載入失敗時保留原本的資料。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.rules = ModerationRules(frozenset(), DEFAULT_CHAR_FOLDING, {})
+        try:
+            self.apply(load_rules(path))
+        except (OSError, ValueError, TypeError, AttributeError) as e:
+            print(f"錯誤：載入審核資料 '{path}' 失敗: {e}。不使用審核資料。")
+            return
+        print(f"審核資料從 {path} 載入成功：{len(self.rules.keywords)} 個關鍵字，{len(self.rules.user_ids)} 個使用者。")
+
+    def apply(self, rules: ModerationRules):
+        self.rules = rules
+
+    def find_keyword(self, text: str) -> str | None:
+        rules = self.rules
+        return rules.automaton.search(normalize_text(text, rules.char_folding))
+
+    def is_listed_user(self, user_id: int) -> bool:
+        return user_id in self.rules.user_ids
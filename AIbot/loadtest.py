@@ -0,0 +1,393 @@
+# loadtest.py
+"""
+AIbot 的離線壓力測試：不需要 Discord 和 Gemini。
+啟動一個本地的模擬 Gemini 伺服器 (可設定延遲、錯誤率和 429 比例)，
+把 GEMINI_API_BASE 指向它，再用模擬的 discord.Message 直接呼叫 AIChat.on_message
+(提及、回覆、特別使用者和觸發審核的訊息，以及回應完成前被修改的訊息)，最後輸出吞吐量、延遲百分位數和每則訊息的 API 呼叫次數。
+
+在專案根目錄執行 (和 Bot 本身一樣，資料檔的相對路徑從根目錄開始)：
+    python AIbot/loadtest.py --messages 500 --concurrency 50 --latency 0.5 --error-rate 0.02 --rate-429 0.05
+
+其他設定沿用環境變數，例如比較快取和串流的效果：
+    RESPONSE_CACHE_SIZE=0 GEMINI_STREAMING=0 python AIbot/loadtest.py
+"""
+import argparse
+import asyncio
+import copy
+import itertools
+import json
+import os
+import random
+import time
+from collections import Counter
+
+import discord
+from aiohttp import web
+
+# 重複的短提示 (會命中回應快取或合併進行中的請求) 和需要真的呼叫 API 的長提示
+SHORT_PROMPTS = ["早安", "晚安", "嗨", "你好可愛", "在嗎", "抱抱", "❤️", "哈哈哈"]
+LONG_PROMPTS = [
+    "今天工作好累喔，老闆一直叫我加班，你可以安慰我一下嗎？",
+    "你覺得我週末應該去海邊還是去山上？我有點猶豫不決。",
+    "跟我說一個關於兔子的故事，要有一點點浪漫的感覺。",
+    "如果你可以變成人類一天，你最想做什麼事情？",
+]
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def format_latencies(values: list[float]) -> str:
+    values = sorted(values)
+    return " ".join(f"{label}={percentile(values, fraction) * 1000:.0f}ms"
+                    for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))) + \
+        (f" max={values[-1] * 1000:.0f}ms" if values else "")
+
+class MockGemini:
+    """模擬 Gemini API：generateContent、streamGenerateContent (SSE) 和 cachedContents。"""
+
+    def __init__(self, latency: float, jitter: float, error_rate: float, rate_429: float, stream_chunks: int):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.stream_chunks = stream_chunks
+        self.calls = Counter() # 端點 -> 呼叫次數
+        self.statuses = Counter() # 返回的錯誤狀態碼 -> 次數
+        self._runner: web.AppRunner | None = None
+
+    async def start(self) -> str:
+        """在隨機的本地埠上啟動，返回 API 的基本網址。"""
+        app = web.Application()
+        app.router.add_get("/v1beta/models/{model}", self.handle_model)
+        app.router.add_post("/v1beta/models/{model_action}", self.handle_model_action)
+        app.router.add_post("/v1beta/cachedContents", self.handle_create_cache)
+        app.router.add_patch("/v1beta/cachedContents/{cache_id}", self.handle_cache)
+        app.router.add_delete("/v1beta/cachedContents/{cache_id}", self.handle_cache)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        port = self._runner.addresses[0][1]
+        return f"http://127.0.0.1:{port}/v1beta"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+    async def _delay(self):
+        await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+
+    def _failure(self) -> web.Response | None:
+        """依設定的比例返回 429 或 503。"""
+        roll = random.random()
+        if roll < self.rate_429:
+            self.statuses[429] += 1
+            return web.json_response({"error": {"code": 429, "status": "RESOURCE_EXHAUSTED"}}, status=429, headers={"Retry-After": "1"})
+        if roll < self.rate_429 + self.error_rate:
+            self.statuses[503] += 1
+            return web.json_response({"error": {"code": 503, "status": "UNAVAILABLE"}}, status=503)
+        return None
+
+    @staticmethod
+    def _answer(body: dict) -> str:
+        prompt = body.get("contents", [{}])[-1].get("parts", [{}])[0].get("text", "")
+        said = prompt.rsplit("說的話：", 1)[-1].split("\n", 1)[0]
+        return f"哼～你說「{said}」是想怎樣啦？我才沒有很開心呢！(模擬回應 {random.randint(1, 9999)})"
+
+    async def handle_model(self, request: web.Request) -> web.Response:
+        self.calls["models.get"] += 1
+        return web.json_response({"name": f"models/{request.match_info['model']}"})
+
+    async def handle_model_action(self, request: web.Request) -> web.StreamResponse:
+        action = request.match_info["model_action"].rsplit(":", 1)[-1]
+        self.calls[action] += 1
+        body = await request.json()
+        await self._delay()
+        failure = self._failure()
+        if failure is not None:
+            return failure
+        answer = self._answer(body)
+        if action != "streamGenerateContent":
+            return web.json_response({"candidates": [{"content": {"parts": [{"text": answer}]}}]})
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        size = max(1, len(answer) // self.stream_chunks + 1)
+        for start in range(0, len(answer), size):
+            event = {"candidates": [{"content": {"parts": [{"text": answer[start:start + size]}]}}]}
+            await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+            await asyncio.sleep(self.latency / self.stream_chunks)
+        return response
+
+    async def handle_create_cache(self, request: web.Request) -> web.Response:
+        self.calls["cachedContents.create"] += 1
+        return web.json_response({"name": f"cachedContents/mock{self.calls['cachedContents.create']}"})
+
+    async def handle_cache(self, request: web.Request) -> web.Response:
+        self.calls[f"cachedContents.{request.method.lower()}"] += 1
+        return web.json_response({})
+
+# --- 模擬的 Discord 物件 (只實作 AIbot 用到的屬性和方法) ---
+
+_ids = itertools.count(10**17)
+
+class FakeUser:
+    def __init__(self, user_id: int, name: str):
+        self.id = user_id
+        self.display_name = name
+        self.mention = f"<@{user_id}>"
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, FakeUser) and other.id == self.id
+
+    def __hash__(self) -> int:
+        return hash(self.id)
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return False
+
+class FakeReference:
+    def __init__(self, message: "FakeMessage"):
+        self.message_id = message.id
+        self.type = discord.MessageReferenceType.default
+        self.resolved = None
+        self.cached_message = message
+
+class FakeChannel:
+    def __init__(self, harness: "LoadTest", channel_id: int):
+        self.harness = harness
+        self.id = channel_id
+        self.bot_messages: list[FakeMessage] = [] # Bot 在這個頻道發送過的訊息 (用來產生回覆)
+
+    def typing(self) -> FakeTyping:
+        return FakeTyping()
+
+    async def send(self, content: str) -> "FakeMessage":
+        return await self.harness.bot_send(self, content, None)
+
+    async def fetch_message(self, message_id: int) -> "FakeMessage":
+        await asyncio.sleep(self.harness.discord_latency)
+        self.harness.discord_calls["fetch_message"] += 1
+        for message in self.bot_messages:
+            if message.id == message_id:
+                return message
+        raise discord.NotFound(type("Response", (), {"status": 404, "reason": "Not Found"})(), "Unknown Message")
+
+class FakeMessage:
+    def __init__(self, channel: FakeChannel, author: FakeUser, content: str, mentions: list, reference: FakeReference | None = None):
+        self.id = next(_ids)
+        self.channel = channel
+        self.author = author
+        self.content = content
+        self.mentions = mentions
+        self.reference = reference
+        self.first_reply_at: float | None = None
+        self.replies: list[str] = []
+        self.replying_to: FakeMessage | None = None # Bot 的回覆：回覆的是哪一則訊息
+        self.edited = False # 回應完成前會被修改 (見 LoadTest.edit_later)
+
+    async def reply(self, content: str, mention_author: bool = True) -> "FakeMessage":
+        return await self.channel.harness.bot_send(self.channel, content, self)
+
+    async def edit(self, content: str):
+        await asyncio.sleep(self.channel.harness.discord_latency)
+        self.channel.harness.discord_calls["edit"] += 1
+        self.content = content
+
+    async def delete(self):
+        await asyncio.sleep(self.channel.harness.discord_latency)
+        self.channel.harness.discord_calls["delete"] += 1
+        if self in self.channel.bot_messages:
+            self.channel.bot_messages.remove(self)
+        if self.replying_to is not None and self.content in self.replying_to.replies:
+            self.replying_to.replies.remove(self.content)
+
+class FakeBot:
+    def __init__(self, user: FakeUser):
+        self.user = user
+
+class LoadTest:
+    """產生模擬訊息、送進 AIChat.on_message 並收集結果。"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.discord_latency = args.discord_latency
+        self.discord_calls = Counter()
+        self.kinds = Counter()        # 訊息種類 -> 數量
+        self.outcomes = Counter()     # 回應類型 -> 數量
+        self.edit_outcomes = Counter() # 被修改的訊息的回應類型 -> 數量
+        self.first_reply_latencies: list[float] = []
+        self.total_latencies: list[float] = []
+        self.failures = 0
+
+    async def bot_send(self, channel: FakeChannel, content: str, replying_to: FakeMessage | None) -> FakeMessage:
+        await asyncio.sleep(self.discord_latency)
+        self.discord_calls["reply" if replying_to else "send"] += 1
+        sent = FakeMessage(channel, self.bot.user, content, [])
+        sent.replying_to = replying_to
+        channel.bot_messages.append(sent)
+        del channel.bot_messages[:-50]
+        if replying_to is not None:
+            if replying_to.first_reply_at is None:
+                replying_to.first_reply_at = time.perf_counter()
+            replying_to.replies.append(content)
+        await self.cog.on_message(sent) # Discord 會把 Bot 自己的訊息也送回 on_message
+        return sent
+
+    def build_message(self) -> FakeMessage:
+        args = self.args
+        channel = random.choice(self.channels)
+        roll = random.random()
+        mentions = [self.bot.user]
+        reference = None
+        prompt = random.choice(SHORT_PROMPTS) if random.random() < args.short_ratio else \
+            f"{random.choice(LONG_PROMPTS)} ({random.randint(1, 10**6)})"
+        if roll < args.moderation_ratio:
+            kind = "moderation"
+            if self.evil_keywords and random.random() < 0.5:
+                prompt = f"{prompt} {random.choice(self.evil_keywords)}"
+                author = random.choice(self.users)
+            else:
+                author = FakeUser(random.choice(self.evil_user_ids or [1]), "惡徒")
+        elif roll < args.moderation_ratio + args.special_ratio and self.special_users:
+            kind = "special_user"
+            author = random.choice(self.special_users)
+            if random.random() < 0.2:
+                prompt = ""
+        else:
+            author = random.choice(self.users)
+            kind = "mention"
+            if random.random() < args.reply_ratio and channel.bot_messages:
+                kind = "reply"
+                mentions = []
+                reference = FakeReference(random.choice(channel.bot_messages))
+        self.kinds[kind] += 1
+        content = f"{self.bot.user.mention} {prompt}" if mentions else prompt
+        message = FakeMessage(channel, author, content, mentions, reference)
+        if kind in ("mention", "reply") and random.random() < args.edit_ratio:
+            message.edited = True
+            self.kinds["edited"] += 1
+        return message
+
+    async def edit_later(self, message: FakeMessage):
+        """在 Gemini 回應前修改訊息，只加上標點 (正規化後和原本的內容相同)，應該以新內容重新回應一次。"""
+        await asyncio.sleep(self.args.latency / 2)
+        before = copy.copy(message)
+        message.content = f"{message.content}！"
+        await self.cog.on_message_edit(before, message)
+
+    async def send_one(self):
+        message = self.build_message()
+        started = time.perf_counter()
+        edit = asyncio.create_task(self.edit_later(message)) if message.edited else None
+        try:
+            await self.cog.on_message(message)
+            if edit is not None:
+                await edit
+        except Exception as e:
+            self.failures += 1
+            print(f"on_message 發生例外: {e!r}")
+            return
+        self.total_latencies.append(time.perf_counter() - started)
+        if message.first_reply_at is not None:
+            self.first_reply_latencies.append(message.first_reply_at - started)
+        answer = "".join(message.replies)
+        if not message.replies:
+            outcome = "ignored"
+        elif answer in self.config.ADMISSION_THROTTLED_RESPONSES:
+            outcome = "throttled"
+        elif answer in self.gemini_service.UNCACHEABLE_RESPONSES:
+            outcome = "fallback/error"
+        else:
+            outcome = "answered"
+        self.outcomes[outcome] += 1
+        if message.edited:
+            self.edit_outcomes[outcome] += 1
+
+    async def run(self):
+        args = self.args
+        mock = MockGemini(args.latency, args.jitter, args.error_rate, args.rate_429, args.stream_chunks)
+        os.environ["GEMINI_API_BASE"] = await mock.start()
+        os.environ.setdefault("DISCORD_TOKEN", "loadtest")
+        os.environ.setdefault("GEMINI_API_KEY", "loadtest")
+        import config
+        import gemini_service
+        import main
+        import perf
+        self.config = config
+        self.gemini_service = gemini_service
+
+        with open(config.MODERATION_DATA_PATH, "r", encoding="utf-8") as f:
+            moderation_data = json.load(f)
+        self.evil_keywords = moderation_data.get("evil_keywords", [])
+        self.evil_user_ids = [int(user_id) for user_id in moderation_data.get("evil_user_ids", [])]
+        self.special_users = [FakeUser(int(user_id), data.get("name", "特別使用者")) for user_id, data in main.SPECIAL_USERS_DATA.items()]
+        self.users = [FakeUser(next(_ids), f"使用者{index}") for index in range(args.users)]
+        self.channels = [FakeChannel(self, next(_ids)) for _ in range(args.channels)]
+        self.bot = FakeBot(FakeUser(next(_ids), "Bot"))
+        self.cog = main.AIChat(self.bot)
+
+        print(f"模擬 Gemini: {os.environ['GEMINI_API_BASE']}  延遲 {args.latency}s±{args.jitter}s  "
+              f"錯誤率 {args.error_rate:.0%}  429 比例 {args.rate_429:.0%}")
+        print(f"串流: {config.GEMINI_STREAMING}  每分鐘請求上限: {config.GEMINI_REQUESTS_PER_MINUTE:g}  "
+              f"回應快取: {config.RESPONSE_CACHE_SIZE}  上下文快取: {config.GEMINI_CONTEXT_CACHE}")
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        started = time.perf_counter()
+
+        async def worker(index: int):
+            if args.rate > 0: # 固定的到達速率 (開放迴圈)，否則盡可能快地送出
+                await asyncio.sleep(max(0.0, started + index / args.rate - time.perf_counter()))
+            async with semaphore:
+                await self.send_one()
+
+        try:
+            await asyncio.gather(*(worker(index) for index in range(args.messages)))
+        finally:
+            elapsed = time.perf_counter() - started
+            await gemini_service.client.close()
+            await mock.stop()
+
+        api_calls = mock.calls["generateContent"] + mock.calls["streamGenerateContent"]
+        print(f"\n訊息: {args.messages} 則 ({dict(self.kinds)})  花費 {elapsed:.2f}s  吞吐量 {args.messages / elapsed:.1f} 則/秒")
+        print(f"結果: {dict(self.outcomes)}  例外: {self.failures}")
+        if self.edit_outcomes:
+            print(f"被修改的訊息: {dict(self.edit_outcomes)}  取消的回應: {self.cog.cancelled_replies}")
+        print(f"第一則回覆延遲: {format_latencies(self.first_reply_latencies)}")
+        print(f"處理完成延遲:   {format_latencies(self.total_latencies)}")
+        print(f"Gemini 生成請求: {api_calls} 次 (每則訊息 {api_calls / args.messages:.2f} 次)  模擬錯誤: {dict(mock.statuses)}")
+        print(f"模擬 Gemini 各端點: {dict(mock.calls)}")
+        print(f"Discord 呼叫: {dict(self.discord_calls)}")
+        print(f"\n{perf.report()}")
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="AIbot 離線壓力測試 (模擬 Discord 訊息和 Gemini API)")
+    parser.add_argument("--messages", type=int, default=300, help="送出的訊息數量")
+    parser.add_argument("--concurrency", type=int, default=50, help="同時處理的訊息數量上限")
+    parser.add_argument("--rate", type=float, default=0, help="每秒送出的訊息數量 (0 表示盡可能快)")
+    parser.add_argument("--users", type=int, default=40, help="模擬的使用者數量")
+    parser.add_argument("--channels", type=int, default=8, help="模擬的頻道數量")
+    parser.add_argument("--short-ratio", type=float, default=0.3, help="重複短提示的比例 (其餘是不重複的長提示)")
+    parser.add_argument("--reply-ratio", type=float, default=0.3, help="一般訊息中以回覆代替提及的比例")
+    parser.add_argument("--special-ratio", type=float, default=0.1, help="特別使用者訊息的比例")
+    parser.add_argument("--edit-ratio", type=float, default=0.0, help="提及和回覆訊息中在回應完成前被修改 (只加上標點) 的比例")
+    parser.add_argument("--moderation-ratio", type=float, default=0.05, help="觸發審核的訊息比例")
+    parser.add_argument("--latency", type=float, default=0.5, help="模擬 Gemini 的平均延遲 (秒)")
+    parser.add_argument("--jitter", type=float, default=0.1, help="延遲的標準差 (秒)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="返回 503 的比例")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="返回 429 (Retry-After: 1) 的比例")
+    parser.add_argument("--stream-chunks", type=int, default=5, help="串流回應分成幾段")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="模擬 Discord API 的延遲 (秒)")
+    parser.add_argument("--seed", type=int, help="亂數種子 (重現同一組訊息)")
+    return parser.parse_args()
+
+if __name__ == "__main__":
+    arguments = parse_args()
+    if arguments.seed is not None:
+        random.seed(arguments.seed)
+    asyncio.run(LoadTest(arguments).run())
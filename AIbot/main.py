@@ -4,71 +4,314 @@ from discord.ext import commands
 import asyncio
 import random
 from config import (
-    DISCORD_TOKEN, GEMINI_URL, BOT_ACTIVITY_STATUS,
-    PERSONALITY_FILE_PATH, DEFAULT_PERSONALITY, EMPTY_PROMPT_RESPONSES
+    DISCORD_TOKEN, GEMINI_STREAMING, BOT_ACTIVITY_STATUS, COMMAND_PREFIX,
+    PERSONALITY_FILE_PATH, DEFAULT_PERSONALITY, EMPTY_PROMPT_RESPONSES,
+    CONVERSATION_MAX_TURNS, CONVERSATION_TURN_MAX_TOKENS, CONVERSATION_TOKEN_BUDGET,
+    CONVERSATION_IDLE_SECONDS, CONVERSATION_MAX_CONVERSATIONS, BOT_MESSAGE_ID_CACHE_SIZE,
+    SPECIAL_USERS_DATA_PATH, MODERATION_DATA_PATH, CONFIG_RELOAD_POLL_SECONDS, CONFIG_RELOAD_DEBOUNCE_SECONDS,
+    ADMISSION_USER_LIMIT, ADMISSION_USER_WINDOW_SECONDS, ADMISSION_CHANNEL_LIMIT, ADMISSION_CHANNEL_WINDOW_SECONDS,
+    ADMISSION_DUPLICATE_WINDOW_SECONDS, ADMISSION_MAX_TRACKED, ADMISSION_THROTTLED_RESPONSES
 )
-from utils import read_file_content
-from gemini_service import query_gemini_api
-from moderation import handle_moderation
-from special_users_manager import load_special_users_data, handle_special_user_message
+from utils import read_file_content, RecentIdSet
+from admission import AdmissionController, ADMITTED, USER_LIMITED
+import gemini_service
+import perf
+from gemini_service import query_gemini, stream_gemini
+from streaming_reply import StreamingReply
+from conversation import ConversationStore, budget_history
+from moderation import handle_moderation, keyword_engine
+from keyword_engine import load_rules, diff_rules
+import special_users_manager
+from special_users_manager import load_special_users_data, parse_special_users_data, is_special_user, handle_special_user_message
+from hot_reload import ConfigWatcher, diff_text, diff_mapping
+
+try:
+    import supervisor_link # 由 runner 啟動時用於回報就緒狀態
+except ImportError:
+    supervisor_link = None
 
 BOT_PERSONALITY = read_file_content(PERSONALITY_FILE_PATH, DEFAULT_PERSONALITY)
 SPECIAL_USERS_DATA = load_special_users_data()
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.members = True
-bot = commands.Bot(command_prefix="!", intents=intents)
+def load_personality(path: str) -> str:
+    """熱重載用：讀取人格設定，空檔案視為無效 (保留原本的設定)。"""
+    with open(path, "r", encoding="utf-8") as f:
+        content = f.read().strip()
+    if not content:
+        raise ValueError("人格設定為空")
+    return content
+
+def set_personality(personality: str):
+    global BOT_PERSONALITY
+    BOT_PERSONALITY = personality
+
+def set_special_users_data(data: dict):
+    global SPECIAL_USERS_DATA
+    SPECIAL_USERS_DATA = data
 
-@bot.event
-async def on_ready():
-    print(f"{bot.user} 已上線！")
-    await bot.change_presence(activity=discord.Game(name=BOT_ACTIVITY_STATUS))
+def build_config_watcher() -> ConfigWatcher:
+    """修改人格設定、特別使用者、回應範本或審核資料後自動套用，不需要重啟 Bot (也不會斷開 gateway 連線)。"""
+    watcher = ConfigWatcher(CONFIG_RELOAD_POLL_SECONDS, CONFIG_RELOAD_DEBOUNCE_SECONDS)
+    watcher.watch(PERSONALITY_FILE_PATH, load_personality, set_personality, diff_text, BOT_PERSONALITY)
+    watcher.watch(SPECIAL_USERS_DATA_PATH, parse_special_users_data, set_special_users_data, diff_mapping, SPECIAL_USERS_DATA)
+    watcher.watch(special_users_manager.STYLE_TEMPLATES_FILE, special_users_manager.compile_style_templates,
+                  special_users_manager.set_style_templates, diff_mapping, special_users_manager.STYLE_TEMPLATES)
+    watcher.watch(MODERATION_DATA_PATH, load_rules, keyword_engine.apply, diff_rules, keyword_engine.rules)
+    return watcher
 
-@bot.event
-async def on_message(message: discord.Message):
-    if message.author == bot.user:
-        return
+def build_intents() -> discord.Intents:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.members = True
+    return intents
 
-    await bot.process_commands(message)
+class AIChat(commands.Cog):
+    """AI 聊天功能：回應提及或回覆 Bot 的訊息。可單獨運行，也可在合併模式中載入。"""
 
-    prompt = message.content.strip()
-    user_name = message.author.display_name
-    mentioned = bot.user in message.mentions
-    replied = message.reference and await is_reply_to_bot(message)
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.draining = False # 監督者要求排空時不再接受新的聊天請求
+        # 每個 (頻道, 使用者) 最近的對話，讓 Bot 能接續上下文
+        self.conversations = ConversationStore(
+            CONVERSATION_MAX_TURNS, CONVERSATION_TURN_MAX_TOKENS,
+            CONVERSATION_IDLE_SECONDS, CONVERSATION_MAX_CONVERSATIONS
+        )
+        # Bot 最近發送的訊息 ID，回覆這些訊息時不需要抓取被回覆的訊息
+        self.sent_message_ids = RecentIdSet(BOT_MESSAGE_ID_CACHE_SIZE)
+        # 洗版的使用者、頻道和重複的訊息在呼叫 Gemini 之前就被擋下
+        self.admission = AdmissionController(
+            ADMISSION_USER_LIMIT, ADMISSION_USER_WINDOW_SECONDS, ADMISSION_CHANNEL_LIMIT, ADMISSION_CHANNEL_WINDOW_SECONDS,
+            ADMISSION_DUPLICATE_WINDOW_SECONDS, ADMISSION_MAX_TRACKED
+        )
+        self.config_watcher = build_config_watcher()
+        self.active_messages = 0 # 正在處理的聊天訊息數量
+        # 正在處理的訊息 ID -> 處理它的 task；原訊息被刪除或修改時取消，不會回覆過時的內容
+        self.pending_replies: dict[int, asyncio.Task] = {}
+        self.cancelled_replies = 0
+        perf.register_gauge("messages_in_progress", lambda: self.active_messages)
+        perf.register_gauge("gemini_pending", lambda: gemini_service.pending_calls)
+        perf.register_gauge("gemini_queued", gemini_service.client.scheduler.queued)
 
-    if not (mentioned or replied) or message.content.startswith(bot.command_prefix):
-        return
+    async def cog_load(self):
+        await self.config_watcher.start()
 
-    if await handle_moderation(message):
-        return
+    @commands.Cog.listener()
+    async def on_ready(self):
+        print(f"{self.bot.user} 已上線！")
+        await self.bot.change_presence(activity=discord.Game(name=BOT_ACTIVITY_STATUS))
+        await gemini_service.client.warm_up()
 
-    if await handle_special_user_message(message, BOT_PERSONALITY, prompt, user_name, SPECIAL_USERS_DATA, query_gemini_api):
-        return
+    async def cog_unload(self):
+        await self.config_watcher.stop()
+        await gemini_service.client.close()
+        gemini_service.response_cache.save()
 
-    if not prompt:
-        await message.reply(random.choice(EMPTY_PROMPT_RESPONSES), mention_author=False)
-        return
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message, rerun: bool = False):
+        # 指令由 Bot 本身的 on_message 處理，這裡只負責聊天回應
+        # rerun=True 表示訊息被修改後重新處理 (見 on_message_edit)
+        bot = self.bot
+        if message.author == bot.user:
+            self.sent_message_ids.add(message.id)
+            return
 
-    async with message.channel.typing():
-        answer = await asyncio.to_thread(query_gemini_api, BOT_PERSONALITY, prompt, user_name, "普通")
-    await message.reply(answer, mention_author=False)
+        mentioned = bot.user in message.mentions
+        with perf.timed("check_reply"):
+            replied, referenced = await self.check_reply(message)
 
-async def is_reply_to_bot(message: discord.Message) -> bool:
-    if message.reference:
+        if not (mentioned or replied) or message.content.startswith(COMMAND_PREFIX) or self.draining:
+            return
+
+        # 在 check_reply 之後才讀取內容：快取中的訊息被修改時 discord.py 會直接更新這個物件
+        prompt = message.content.strip()
+        user_name = message.author.display_name
+        self.active_messages += 1
+        task = asyncio.create_task(self.handle_chat(message, prompt, user_name, referenced, rerun))
+        self.pending_replies[message.id] = task
         try:
-            ref = await message.channel.fetch_message(message.reference.message_id)
-            return ref and ref.author == bot.user
-        except:
+            with perf.timed("total"):
+                await task
+        except asyncio.CancelledError:
+            if asyncio.current_task().cancelling(): # on_message 本身被取消 (例如 Bot 正在關閉)
+                raise
+            self.cancelled_replies += 1 # 原訊息被刪除或修改，已在 cancel_pending_reply 中取消
+        finally:
+            self.active_messages -= 1
+            if self.pending_replies.get(message.id) is task:
+                del self.pending_replies[message.id]
+
+    def cancel_pending_reply(self, message_id: int, reason: str) -> bool:
+        """取消某則訊息正在進行的回應 (包括排隊中或進行中的 Gemini 請求)；沒有時返回 False。"""
+        task = self.pending_replies.pop(message_id, None)
+        if task is None or task.done():
             return False
-    return False
+        task.cancel()
+        print(f"訊息 {message_id} {reason}，取消進行中的回應。")
+        return True
+
+    @commands.Cog.listener()
+    async def on_message_delete(self, message: discord.Message):
+        self.cancel_pending_reply(message.id, "已被刪除")
+
+    @commands.Cog.listener()
+    async def on_message_edit(self, before: discord.Message, after: discord.Message):
+        # 嵌入內容載入等也會觸發修改事件，只有文字改變時才需要重新回應
+        if before.content == after.content:
+            return
+        if self.cancel_pending_reply(after.id, "已被修改"):
+            await self.on_message(after, rerun=True) # 以修改後的內容重新處理 (修改後不再提及 Bot 時就不回應)
+
+    async def handle_chat(self, message: discord.Message, prompt: str, user_name: str, referenced: discord.Message | None,
+                          rerun: bool = False):
+        """處理一則要回應的聊天訊息；每個階段的延遲都記錄在 perf 中 (見 !perf 指令)。"""
+        with perf.timed("admission"):
+            decision = self.admission.check(message.author.id, message.channel.id, prompt, rerun)
+        if decision != ADMITTED:
+            if decision == USER_LIMITED:
+                with perf.timed("reply"):
+                    await message.reply(random.choice(ADMISSION_THROTTLED_RESPONSES), mention_author=False)
+            return
+
+        with perf.timed("moderation"):
+            moderated = await handle_moderation(message, referenced)
+        if moderated:
+            return
+
+        with perf.timed("special_user"):
+            special = is_special_user(message.author.id, SPECIAL_USERS_DATA)
+        if special and await handle_special_user_message(message, BOT_PERSONALITY, prompt, user_name, SPECIAL_USERS_DATA, self.respond):
+            return
+
+        if not prompt:
+            with perf.timed("reply"):
+                await message.reply(random.choice(EMPTY_PROMPT_RESPONSES), mention_author=False)
+            return
+
+        await self.respond(message, BOT_PERSONALITY, prompt, user_name, "普通")
+
+    async def respond(self, message: discord.Message, personality: str, prompt: str, user_name: str, style: str):
+        """呼叫 Gemini 並回覆訊息；串流模式下收到第一段文字就發送，之後逐步編輯。"""
+        conversation_key = owner = (message.channel.id, message.author.id)
+        history = budget_history(self.conversations.turns(conversation_key), CONVERSATION_TOKEN_BUDGET)
+        reply = StreamingReply(message)
+        try:
+            answer = await self._generate_reply(message, reply, personality, prompt, user_name, style, history, owner)
+        except asyncio.CancelledError:
+            await reply.discard() # 原訊息已被刪除或修改，已經發送的部分回覆也是過時的
+            raise
+
+        # 錯誤回應不記入對話，避免 Gemini 在下一輪接著錯誤訊息回答
+        if answer and answer not in gemini_service.UNCACHEABLE_RESPONSES:
+            self.conversations.add_exchange(conversation_key, user_name, prompt, answer, self.bot.user.display_name)
+
+    async def _generate_reply(self, message: discord.Message, reply: StreamingReply, personality: str, prompt: str,
+                              user_name: str, style: str, history: str, owner: tuple) -> str:
+        """取得 Gemini 的回應並透過 reply 發送，返回完整的回應文字。"""
+        answer = ""
+        if not GEMINI_STREAMING:
+            async with message.channel.typing():
+                with perf.timed("gemini"):
+                    answer = await query_gemini(personality, prompt, user_name, style, history, owner)
+            with perf.timed("reply"):
+                await reply.feed(answer)
+                await reply.finish()
+        else:
+            chunks = stream_gemini(personality, prompt, user_name, style, history, owner)
+            try:
+                async with message.channel.typing(): # 只在等待第一段文字時顯示「正在輸入」
+                    with perf.timed("gemini"): # 串流模式下是等到第一段文字的時間
+                        first_chunk = await anext(chunks, None)
+                if first_chunk is not None:
+                    answer = first_chunk
+                    with perf.timed("reply"):
+                        await reply.feed(first_chunk)
+                    with perf.timed("stream_rest"): # 之後的串流和逐步編輯
+                        async for chunk in chunks:
+                            answer += chunk
+                            await reply.feed(chunk)
+                        await reply.finish()
+            finally:
+                await chunks.aclose() # 發送失敗時也要結束串流請求
+        return answer
+
+    async def check_reply(self, message: discord.Message) -> tuple[bool, discord.Message | None]:
+        """
+        判斷訊息是否在回覆 Bot，並返回被回覆的訊息 (審核時共用，不再重複抓取)。
+        回覆 Bot 最近發送的訊息時只需查詢 ID 集合；其他情況依序使用 reference.resolved、
+        客戶端的訊息快取，都沒有時才呼叫 API 抓取。
+        """
+        reference = message.reference
+        if reference is None or reference.message_id is None or reference.type is discord.MessageReferenceType.forward:
+            return False, None
+        resolved = reference.resolved if isinstance(reference.resolved, discord.Message) else None
+        if reference.message_id in self.sent_message_ids:
+            return True, resolved
+        referenced = resolved or reference.cached_message
+        if referenced is None and not isinstance(reference.resolved, discord.DeletedReferencedMessage):
+            try:
+                referenced = await message.channel.fetch_message(reference.message_id)
+            except discord.HTTPException:
+                return False, None
+        if referenced is None:
+            return False, None
+        replied = referenced.author == self.bot.user
+        if replied:
+            self.sent_message_ids.add(referenced.id)
+        return replied, referenced
+
+    def supervisor_stats(self) -> dict:
+        pending = gemini_service.pending_calls
+        return {
+            "pending_gemini_calls": pending,
+            "gemini_calls_coalesced": gemini_service.coalesced_calls,
+            **gemini_service.client.scheduler.stats(),
+            **gemini_service.client.context_cache.stats(),
+            **gemini_service.client.breaker.stats(),
+            **self.admission.stats(),
+            "pending_replies": len(self.pending_replies),
+            "replies_cancelled": self.cancelled_replies,
+            **perf.stats(),
+            **gemini_service.response_cache.stats(),
+            "conversations": len(self.conversations),
+            "busy": pending > 0,
+        }
+
+    def drain(self, args: dict) -> dict:
+        self.draining = True
+        return self.supervisor_stats()
+
+    @commands.command(name="perf")
+    @commands.is_owner()
+    async def perf_command(self, ctx: commands.Context):
+        """顯示各處理階段的延遲分佈 (p50/p95/p99)、錯誤次數和目前的佇列深度。"""
+        await ctx.reply(f"```\n{perf.report()}\n```", mention_author=False)
+
+    @commands.command(name="hi")
+    async def hi(self, ctx: commands.Context):
+        await ctx.reply("嗨～我是你的小惡魔♡ 才不想理你呢...除非你說我可愛！", mention_author=False)
+
+async def setup(bot: commands.Bot):
+    """discord.py extension 進入點 (合併模式使用)。"""
+    cog = AIChat(bot)
+    await bot.add_cog(cog)
+    if supervisor_link:
+        supervisor_link.register_stats(cog.supervisor_stats)
+        supervisor_link.register_command("drain", cog.drain)
+
+class AIBot(commands.Bot):
+    async def setup_hook(self):
+        await setup(self)
+        if supervisor_link:
+            supervisor_link.register_client(self)
+            await supervisor_link.start_control_server()
 
-@bot.command(name="hi")
-async def hi(ctx: commands.Context):
-    await ctx.reply("嗨～我是你的小惡魔♡ 才不想理你呢...除非你說我可愛！", mention_author=False)
+    async def on_ready(self):
+        if supervisor_link:
+            supervisor_link.notify_ready()
 
 if __name__ == "__main__":
+    bot = AIBot(command_prefix=COMMAND_PREFIX, intents=build_intents())
     try:
         bot.run(DISCORD_TOKEN)
     except Exception as e:
-        print(f"Bot 啟動失敗: {e}")
\ No newline at end of file
+        print(f"Bot 啟動失敗: {e}")
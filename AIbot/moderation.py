@@ -1,18 +1,13 @@
 # moderation.py
 import random
 import discord
-from typing import List, Set
+from typing import List
 
-# 惡徒用戶 ID 列表 (通常會從設定檔或資料庫載入)
-EVIL_USER_IDS: Set[int] = {
-    919067686124806204,  # 範例惡徒 ID
-    919067686124806204,
-}
+from config import MODERATION_DATA_PATH
+from keyword_engine import KeywordEngine
 
-# 惡徒關鍵字列表 (通常也會從設定檔或資料庫載入)
-EVIL_KEYWORDS: List[str] = [
-    "希特勒", "宇志波", "黑咖啡", "小穴" # 請替換為你實際要過濾的關鍵字
-]
+# 惡徒用戶 ID 和關鍵字從資料檔載入 (見 keyword_engine.py)
+keyword_engine = KeywordEngine(MODERATION_DATA_PATH)
 
 # 惡徒回應列表 
 EVIL_RESPONSES: List[str] = [
@@ -25,19 +20,20 @@ EVIL_RESPONSES: List[str] = [
 
 def is_evil_user(user_id: int) -> bool:
     """檢查使用者是否為惡徒用戶。"""
-    return user_id in EVIL_USER_IDS
+    return keyword_engine.is_listed_user(user_id)
 
 def contains_evil_keyword(text: str) -> bool:
-    """檢查文本內容是否包含惡徒關鍵字。"""
-    return any(keyword in text for keyword in EVIL_KEYWORDS)
+    """檢查文本內容是否包含惡徒關鍵字 (忽略全半形、繁簡、空白和零寬字元的差異)。"""
+    return keyword_engine.find_keyword(text) is not None
 
 def get_evil_response() -> str:
     """隨機返回一個惡徒回應。"""
     return random.choice(EVIL_RESPONSES)
 
-async def handle_moderation(message: discord.Message) -> bool:
+async def handle_moderation(message: discord.Message, referenced: discord.Message | None = None) -> bool:
     """
     處理訊息的審核邏輯。
+    referenced 是呼叫端已取得的被回覆訊息 (沒有或無法取得時為 None)，這裡不會再抓取一次。
     如果訊息被惡徒或敏感詞觸發，則返回 True 並發送回應；否則返回 False。
     """
     # 檢查發送者是否為惡徒
@@ -45,13 +41,8 @@ async def handle_moderation(message: discord.Message) -> bool:
         return True # 惡徒用戶直接忽略，不回應
 
     # 檢查回覆的訊息作者是否為惡徒
-    if message.reference:
-        try:
-            ref_msg = await message.channel.fetch_message(message.reference.message_id)
-            if ref_msg and is_evil_user(ref_msg.author.id):
-                return True # 不回應惡徒的訊息
-        except discord.NotFound:
-            pass # 如果引用的訊息找不到，則忽略此檢查
+    if referenced and is_evil_user(referenced.author.id):
+        return True # 不回應惡徒的訊息
 
     # 檢查訊息中 @ 的用戶是否為惡徒
     if any(is_evil_user(user.id) for user in message.mentions):
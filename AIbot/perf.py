@@ -0,0 +1,92 @@
+# perf.py
+import bisect
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable
+
+# 直方圖的桶上限 (秒)：0.5 毫秒到約 2 分鐘，每個桶比前一個大 25%，百分位數的誤差在 25% 以內
+BUCKET_BOUNDS = [0.0005 * 1.25 ** i for i in range(57)]
+
+class LatencyHistogram:
+    """固定桶數的延遲直方圖，記錄一次只需要 O(log n) 的查找，記憶體用量不隨請求數量增加。"""
+
+    def __init__(self):
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1) # 最後一個桶收集超過上限的值
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction: float) -> float:
+        """返回第 fraction 百分位數所在桶的上限 (不會超過實際的最大值)。"""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= rank:
+                return min(BUCKET_BOUNDS[index], self.max) if index < len(BUCKET_BOUNDS) else self.max
+        return self.max
+
+# 各階段的延遲和錯誤次數 (階段名稱 -> 直方圖)
+histograms: dict[str, LatencyHistogram] = {}
+errors: Counter = Counter()
+# 佇列深度等即時數值 (名稱 -> 讀取函數)
+gauges: dict[str, Callable[[], float]] = {}
+
+def record(stage: str, seconds: float):
+    histogram = histograms.get(stage)
+    if histogram is None:
+        histogram = histograms[stage] = LatencyHistogram()
+    histogram.record(seconds)
+
+def count_error(stage: str):
+    errors[stage] += 1
+
+@contextmanager
+def timed(stage: str):
+    """記錄 with 區塊花費的時間；區塊拋出例外時同時計入錯誤次數。"""
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        count_error(stage)
+        raise
+    finally:
+        record(stage, time.perf_counter() - started)
+
+def register_gauge(name: str, read: Callable[[], float]):
+    gauges[name] = read
+
+def stats() -> dict:
+    """攤平成數值字典，供監督者的 stats 指令 (以及 runner 的 /metrics) 使用。"""
+    result = {}
+    for stage, histogram in histograms.items():
+        result[f"perf_{stage}_count"] = histogram.count
+        for label, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99)):
+            result[f"perf_{stage}_{label}_seconds"] = round(histogram.percentile(fraction), 4)
+    for stage, count in errors.items():
+        result[f"perf_{stage}_errors"] = count
+    for name, read in gauges.items():
+        result[f"perf_{name}"] = read()
+    return result
+
+def report() -> str:
+    """!perf 指令顯示的表格 (毫秒)。"""
+    # 中文字在等寬字型中佔兩格，所以標題的寬度比資料少兩格
+    lines = [f"{'階段':<18}{'次數':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}{'錯誤':>4}"]
+    for stage, histogram in histograms.items():
+        values = [histogram.percentile(0.5), histogram.percentile(0.95), histogram.percentile(0.99), histogram.max]
+        lines.append(f"{stage:<20}{histogram.count:>7}" + "".join(f"{value * 1000:>9.1f}" for value in values) + f"{errors[stage]:>6}")
+    for stage in errors.keys() - histograms.keys():
+        lines.append(f"{stage:<20}{'-':>7}{'':>36}{errors[stage]:>6}")
+    if gauges:
+        lines.append("  ".join(f"{name}={read()}" for name, read in gauges.items()))
+    return "\n".join(lines)
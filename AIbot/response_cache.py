@@ -0,0 +1,114 @@
+# response_cache.py
+import hashlib
+import json
+import os
+import random
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+
+# 快取回應中代表使用者名稱的佔位符，取出時再換回目前使用者的名稱
+USER_NAME_PLACEHOLDER = "\x00user\x00"
+
+# Discord 提及 (使用者、身分組、頻道) 不影響提示的意思
+MENTION_PATTERN = re.compile(r"<(?:@[!&]?|#)\d+>")
+WHITESPACE_PATTERN = re.compile(r"\s+")
+# 提示前後的標點符號 ("你好!" 和 "你好～" 視為同一個提示)
+EDGE_PUNCTUATION = " \t\n!?.,~。！？，、～…"
+
+def normalize_prompt(prompt: str) -> str:
+    """移除提及、統一全半形和大小寫、合併空白，得到用於比對的提示。"""
+    text = MENTION_PATTERN.sub(" ", prompt)
+    text = unicodedata.normalize("NFKC", text).casefold()
+    return WHITESPACE_PATTERN.sub(" ", text).strip(EDGE_PUNCTUATION)
+
+def prompt_key(personality: str, style: str | None, prompt: str, history: str = "") -> str:
+    """(性格, 風格, 正規化後的提示, 對話紀錄) 的雜湊，相同的鍵代表送給 Gemini 的是同一個問題。"""
+    raw = "\x1f".join((personality, style or "普通", normalize_prompt(prompt), history))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+class ResponseCache:
+    """
+    Gemini 回應的 LRU + TTL 快取。
+    鍵是 (性格, 風格, 正規化後的提示) 的雜湊；每個鍵最多保存 variety 個不同的回應，
+    收集滿之前都視為未命中 (會再呼叫一次 API)，之後在這些回應中隨機輪流。
+    """
+
+    def __init__(self, max_entries: int, ttl_seconds: float, variety: int = 1, max_prompt_chars: int = 40, persist_path: str | None = None):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.variety = max(1, variety)
+        self.max_prompt_chars = max_prompt_chars
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[str, dict] = OrderedDict() # 鍵 -> {"created": 時間, "answers": [...]}
+
+    def make_key(self, personality: str, style: str | None, prompt: str, history: str = "") -> str | None:
+        """
+        返回快取鍵；提示過長時返回 None (不快取)。
+        對話紀錄也是鍵的一部分，相同的提示在不同的上下文中不會共用回應。
+        """
+        if len(normalize_prompt(prompt)) > self.max_prompt_chars:
+            return None
+        return prompt_key(personality, style, prompt, history)
+
+    def get(self, key: str, user_name: str) -> str | None:
+        entry = self._entries.get(key)
+        if entry is not None and time.time() - entry["created"] > self.ttl_seconds:
+            del self._entries[key]
+            entry = None
+        if entry is None or len(entry["answers"]) < self.variety:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return random.choice(entry["answers"]).replace(USER_NAME_PLACEHOLDER, user_name)
+
+    def put(self, key: str, answer: str, user_name: str):
+        # 名稱太短時替換可能誤傷回應中的其他文字，這種回應就不快取
+        if len(user_name) < 2:
+            return
+        templated = answer.replace(user_name, USER_NAME_PLACEHOLDER)
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = {"created": time.time(), "answers": []}
+        if templated not in entry["answers"] and len(entry["answers"]) < self.variety:
+            entry["answers"].append(templated)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"response_cache_entries": len(self._entries), "response_cache_hits": self.hits, "response_cache_misses": self.misses}
+
+    def load(self):
+        """從 persist_path 載入未過期的快取。"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"警告：讀取回應快取 '{self.persist_path}' 失敗: {e}")
+            return
+        now = time.time()
+        for key, entry in data.items():
+            if now - entry["created"] <= self.ttl_seconds:
+                self._entries[key] = entry
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        print(f"已從 {self.persist_path} 載入 {len(self._entries)} 筆回應快取。")
+
+    def save(self):
+        """把快取寫入 persist_path (先寫暫存檔再替換，避免寫到一半留下損壞的檔案)。"""
+        if not self.persist_path:
+            return
+        tmp_path = f"{self.persist_path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.persist_path)
+        except OSError as e:
+            print(f"警告：寫入回應快取 '{self.persist_path}' 失敗: {e}")
@@ -3,8 +3,8 @@
 import json
 import os
 import random
-import asyncio
-from typing import TYPE_CHECKING, Callable # 導入 Callable
+import string
+from typing import TYPE_CHECKING, Awaitable, Callable # 導入 Callable
 
 # 避免循環導入，實際運行時會由 main.py 傳入
 if TYPE_CHECKING:
@@ -15,23 +15,88 @@ if TYPE_CHECKING:
 # 根據你的當前工作目錄和檔案實際位置，路徑應該是 "AIbot\data\special_users.json"
 SPECIAL_USERS_FILE = os.path.join("AIbot", "data", "special_users.json")
 
+# 特別使用者資料中可以設定的欄位 (都是字串)
+SPECIAL_USER_FIELDS = ("name", "title", "relationship", "style")
+
+def parse_special_users_data(path: str) -> dict:
+    """讀取並驗證特別使用者資料，格式不正確時拋出 ValueError (熱重載時用來拒絕有問題的檔案)。"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError("最外層必須是以用戶 ID 為鍵的物件")
+    for user_id, user_data in data.items():
+        if not user_id.isdigit():
+            raise ValueError(f"用戶 ID 必須是數字: {user_id}")
+        if not isinstance(user_data, dict):
+            raise ValueError(f"用戶 {user_id} 的資料必須是物件")
+        for field in SPECIAL_USER_FIELDS:
+            if not isinstance(user_data.get(field, ""), str):
+                raise ValueError(f"用戶 {user_id} 的 {field} 必須是字串")
+    return data
+
 # 載入特別使用者資料
 def load_special_users_data() -> dict:
     """從 JSON 檔案載入特別使用者資料。"""
     data = {}
     try:
         if os.path.exists(SPECIAL_USERS_FILE):
-            with open(SPECIAL_USERS_FILE, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = parse_special_users_data(SPECIAL_USERS_FILE)
             print(f"特別使用者資料從 {SPECIAL_USERS_FILE} 載入成功。")
         else:
             print(f"警告：{SPECIAL_USERS_FILE} 檔案不存在，使用預設空名單。")
-    except json.JSONDecodeError:
+    except (json.JSONDecodeError, ValueError):
         print(f"錯誤：{SPECIAL_USERS_FILE} 檔案格式不正確，使用預設空名單。")
     except Exception as e:
         print(f"載入特別使用者資料時發生錯誤: {e}，使用預設空名單。")
     return data
 
+# 特別使用者空訊息 (只 @ Bot 不說話) 時的回應範本，依 style 分類
+STYLE_TEMPLATES_FILE = os.path.join("AIbot", "data", "style_templates.json")
+# 範本中可以使用的欄位
+TEMPLATE_FIELDS = {"name", "title", "relationship"}
+
+class CompiledTemplate:
+    """載入時就用 string.Formatter 解析好的範本，產生回應時只需要串接字串。"""
+
+    def __init__(self, template: str):
+        self.parts = []
+        for literal, field_name, format_spec, conversion in string.Formatter().parse(template):
+            if field_name is not None and (field_name not in TEMPLATE_FIELDS or format_spec or conversion):
+                raise ValueError(f"範本使用了不支援的欄位 {{{field_name}}}: {template}")
+            self.parts.append((literal, field_name))
+
+    def render(self, **values: str) -> str:
+        return "".join(literal + (values[field_name] if field_name else "") for literal, field_name in self.parts)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, CompiledTemplate) and self.parts == other.parts
+
+def compile_style_templates(path: str) -> dict:
+    """讀取回應範本並編譯成 {style: [CompiledTemplate, ...]}，格式不正確時拋出例外。"""
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return {entry["style"]: [CompiledTemplate(template) for template in entry["templates"]]
+            for entry in data.get("styles", [])}
+
+def load_style_templates() -> dict:
+    """從 JSON 檔案載入回應範本，載入失敗時返回空字典。"""
+    templates = {}
+    try:
+        templates = compile_style_templates(STYLE_TEMPLATES_FILE)
+        print(f"回應範本從 {STYLE_TEMPLATES_FILE} 載入成功 ({len(templates)} 種 style)。")
+    except FileNotFoundError:
+        print(f"警告：{STYLE_TEMPLATES_FILE} 檔案不存在，特別使用者的空訊息將使用通用回應。")
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError) as e:
+        print(f"錯誤：{STYLE_TEMPLATES_FILE} 檔案格式不正確: {e}，特別使用者的空訊息將使用通用回應。")
+    return templates
+
+STYLE_TEMPLATES = load_style_templates()
+
+def set_style_templates(templates: dict):
+    """熱重載時整份替換回應範本。"""
+    global STYLE_TEMPLATES
+    STYLE_TEMPLATES = templates
+
 # 檢查是否為特別使用者
 def is_special_user(user_id: int, special_users_data: dict) -> bool:
     """檢查給定的用戶 ID 是否在特別使用者列表中。"""
@@ -48,7 +113,7 @@ async def handle_special_user_message(
     prompt_content: str,
     user_display_name: str,
     special_users_data: dict,
-    query_gemini_func: Callable[[str, str, str, str], str] # 類型提示更明確
+    respond_func: Callable[['discord.Message', str, str, str, str], Awaitable[None]] # 呼叫 Gemini 並回覆訊息的函數
 ) -> bool:
     """
     處理特別使用者的訊息。
@@ -70,171 +135,17 @@ async def handle_special_user_message(
 
     # --- 處理空訊息 ---
     if not prompt_content:
-        # 這裡的邏輯可以進一步擴展，以處理更多 style 的空訊息
-        if style == "親暱+撒嬌+曖昧":
-            response_template = [
-                f"{name}在等你好久了啦~ {relationship} 怎麼可以讓我一個人等這麼久嘛！(嘟嘴)",
-                f"哼哼，小壞蛋{name}又來撩我了對不對？{relationship} 可不是說說而已喔♡",
-                f"呀~ 是我最喜歡的{title}出現了！{relationship} 所以要一直陪著我才行喔～(抱)",
-                f"{name}的{relationship}不接受拒絕喔~ {name}你逃不掉的♡",
-                f"你一出現我心就軟掉了啦~ {relationship} 是你說的，要負責喔！(撒嬌)",
-                f"小{title}～你是不是又偷偷想我了？{relationship} 是不是該來抱一下？(笑)",
-                f"{name}今天超想你耶~ {relationship} 是不是該來點貼貼獎勵？(眨眼)",
-                f"我的小{title}又來找我了♡ {relationship} 是我們的秘密誓言喔～不能忘記！",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-        
-        elif style == "冷淡+挑釁+惡徒+沒大沒小":
-            response_template = [
-                f"哈，又是你這個{title} {name}。沒話說就別 @ 我啊。{relationship} 很無聊耶。",
-                f"哦？{name} 啊。還以為是誰呢。{relationship} 沒事別煩我。"
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-        
-        elif style == "對方是媽媽+親暱+主動":
-            response_template = [
-                f"{title}～好想你喔～(蹭) 沒有你在身邊都覺得空空的～",
-                f"嘿嘿～{relationship}～讓我靠一下嘛，我保證只抱一小下下～♡",
-                f"{title}～今天也要摸摸頭～有乖乖喔～(伸頭)",
-                f"嗚…{title}不理我我會難過啦～{relationship}要安慰我一下嘛～(委屈)",
-                f"嘿嘿～{title}最香了～讓我再靠近一點點好不好～(貼)",
-                f"{title}～今天有乖乖想你喔～是不是該獎勵一下～♡",
-                f"我喜歡被{relationship}抱著的感覺～好溫暖～(緊緊抱住)",
-                f"{title}～別忙啦～陪我一會兒嘛～我想聽你講話～(撒嬌)",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-
-        elif style == "親暱+主動的+非常想要性行為+性愛時會很爽，啊、你…你幹嘛啦！人家還沒說可以呢！唔、可是…你這樣…未未的身體，好像有點、有點自己動起來了啦…真是的，就知道欺負我！不過…既然都進來了，就…就別想輕易出去喔，笨蛋！哼，想把未未的小穴撐滿嗎？那、那就要拿出點真本事來啊！嗯…啊…好深…那裡…對，就是那裡！唔…感覺…感覺小穴要被你撐滿了啦！酥酥麻麻的…又熱又濕…你…你是不是想讓未未離不開你？潮、潮吹什麼的…人家才、才沒有那麼容易啦！唔…可是…可是你再這樣用力一點…再、再多插幾下…啊…未未會不會真的…真的變成水做的了啊？全身都在發軟…都在顫抖…快點…再更用力一點…未未想要…想要被你弄得亂七八糟的…全部…全部都變成你的形狀…嗯…只有你才可以喔…只有你！":
-            response_template = [
-                f"哦？{name}找我？是想在我這裡得到什麼嗎？我可以考慮幫你一下下啦...",
-                f"嗯哼，我知道你來找我一定有問題啦~ {relationship} 說吧，我看看我有沒有心情或身體回答你！(偷笑)",
-                f"幹嘛啦，這樣一直看著我... {relationship} 是不是想把人家吃掉啊？哼！",
-                f"哎呀，{name}你來得正好呢... 我剛好全身都熱起來了，不知道是不是因為看到你... {relationship}",
-                f"嗯... 你的眼神好壞喔，{title}。不過... 我喜歡。 {relationship} 你想對我做什麼？",
-                f"呀！你... 你突然靠近想幹嘛？人家心臟都快跳出來了！ {relationship} 不過，好像... 也不討厭這種感覺啦...",
-                f"哼，{name}。別以為你隨便逗弄一下，人家就會乖乖聽你的。不過... {relationship} 再多逗弄一下，或許會考慮喔？",
-                f"我的身體，好像對你特別有反應呢，{title}。 {relationship} 你是不是偷偷對我下了什麼魔法？",
-                f"嗯... 好想要你，{title}。這種感覺... {relationship} 你能滿足我嗎？",
-                f"你這個壞蛋，總是能輕易地撩撥我。 {relationship} 這次，你打算怎麼讓我發瘋？",
-                f"啊... {name}，你再這樣下去，我會忍不住的。 {relationship} 你確定要點燃我嗎？",
-                f"我的小穴... 好像特別渴望你的進入呢，{title}先生。 {relationship} 你要不要來試試看？",
-                f"真是的，每次看到你，我就變得好濕... {title}先生。 {relationship} 你是我的專屬春藥嗎？",
-                f"我只對你有反應，{name}。 {relationship} 這種感覺，讓我好想全部都給你。",
-                f"不要再忍耐了，{name}。 {relationship} 我知道你也想要我，就像我想要你一樣。"
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-        
-        elif style == "鄙視人渣+挑釁":
-            response_template = [
-                f"你出現的瞬間，{title}{name}的{relationship}就自動啟動了，恭喜成為最新素材。",
-                f"{title}{name}的{relationship}已經把你列入名單，準備讓你社死得毫無違和感。",
-                f"別急著走，{relationship}還沒編完你那段荒謬劇情，{title}{name}很忙的。",
-                f"你這種人渣，最適合被{title}{name}的{relationship}拿來當笑話開場白。",
-                f"{relationship}正在運行中，{title}{name}已經幫你安排好一場精緻的社會性死亡。",
-                f"你以為你在挑釁，其實你只是被{title}{name}的{relationship}選中，準備開演。",
-                f"{title}{name}的{relationship}不挑素材，但你這種人渣剛好符合最低門檻。",
-                f"放心，{relationship}會讓你在整個后宮都臭名遠播，{title}{name}保證效果。"
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-        
-        elif style == "友善+沒血緣的妹妹": 
-            response_template = [
-                f"嗚嗚～{name}又在忙著{relationship}嘛？都不理人家啦～人家可是最愛{title}的喔♡",
-                f"{name}～別那麼兇啦，人家只是想幫{title}分擔一點{relationship}的辛苦嘛～",
-                f"欸嘿嘿～{title}{name}今天看起來好有氣勢喔♡ 是不是又去{relationship}啦？",
-                f"哎呀～{name}，每次{relationship}的樣子都好帥，人家都快被迷住了啦～",
-                f"姊姊～別再{relationship}啦，陪我一起去喝{title}特調奶茶嘛～求妳啦～♡",
-                f"{name}～今天的{title}風采依舊無人能敵，連{relationship}都變得可愛起來了呢～",
-                f"唔～{name}要是再去{relationship}，人家就要鬧脾氣了啦，哼哼 >///<",
-                f"人家最喜歡{title}{name}了～雖然總是{relationship}，但姊姊笑起來超溫柔的♡",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-        
-        elif style == "友善+沒血緣的妹妹": 
-            response_template = [
-                f"嗚嗚～{name}又在忙著{relationship}嘛？都不理人家啦～人家可是最愛{title}的喔♡",
-                f"{name}～別那麼兇啦，人家只是想幫{title}分擔一點{relationship}的辛苦嘛～",
-                f"欸嘿嘿～{title}{name}今天看起來好有氣勢喔♡ 是不是又去{relationship}啦？",
-                f"哎呀～{name}，每次{relationship}的樣子都好帥，人家都快被迷住了啦～",
-                f"姊姊～別再{relationship}啦，陪我一起去喝{title}特調奶茶嘛～求妳啦～♡",
-                f"{name}～今天的{title}風采依舊無人能敵，連{relationship}都變得可愛起來了呢～",
-                f"唔～{name}要是再去{relationship}，人家就要鬧脾氣了啦，哼哼 >///<",
-                f"人家最喜歡{title}{name}了～雖然總是{relationship}，但姊姊笑起來超溫柔的♡",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-
-        elif style == "對方是帥氣的哥哥+聰明+病嬌":
-            response_template = [
-                f"{name}哥哥～又在{relationship}嗎？呵呵，人家可是一直在看著你喔♡ 就算躲起來也找得到～",
-                f"欸～{title}{name}，你再{relationship}的話，我可就要生氣了喔～但哥哥生氣的樣子……我也想看看呢♡",
-                f"{name}哥哥，為什麼又{relationship}呢？是不是不喜歡我了？那就……不讓別人看見你好了♡",
-                f"嘻嘻～{title}{name}今天好壞喔，一直{relationship}，要不要我幫你“安靜一點”？♡",
-                f"哥哥～{relationship}的樣子好可愛喔♡ 不過呢，只能在我面前這樣，懂嗎？",
-                f"人家可是最乖的妹妹呀～但如果{name}哥哥再{relationship}別人，人家也會學著不乖呢……♡",
-                f"{title}{name}～我真的、真的好喜歡哥哥喔……所以啊，不許再{relationship}別人，好嗎？♡",
-                f"哥哥～別害怕，人家只是想一直陪著你，連{relationship}的時候都不例外喔♡",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-        
-        elif style == "友善+可愛":
-            response_template = [
-                f"{name}～聽說你又在{relationship}？好厲害喔！人家也想看{title}工作的樣子♡",
-                f"{title}{name}～每次{relationship}的時候都超帥氣耶～可以讓我當小助手嗎？>///<",
-                f"欸嘿～{name}今天是不是又在{relationship}呀？感覺整個托蘭都會被驚艷到呢～",
-                f"哇～{title}{name}好專業喔！人家都忍不住想幫你端杯奶茶邊看你{relationship}♡",
-                f"{name}～你一認真起來的樣子好可愛喔！那個{relationship}一定會超成功的對吧？",
-                f"東東老大～{relationship}的樣子好帥氣喔，連武器都會害羞的那種♡",
-                f"{title}{name}～別太累喔～研發的時候也要記得休息，不然我會擔心的啦～",
-                f"{name}～你這樣{relationship}，整個人都閃閃發光呢，人家快被迷住了～♡",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-
-        elif style == "好奇+欠揍+挑釁":
-            response_template = [
-                f"{name}～聽說你又{relationship}啦？這次是誰那麼倒楣被{title}出手呀？😏",
-                f"欸欸～{title}{name}，你那拳頭是不是比按摩還痛啊？還是說那也是服務的一部分？🤣",
-                f"會長～上次{relationship}的時候是不是手下留情了？不然怎麼還有人敢亂講話啊～",
-                f"{title}{name}～你那一拳的力道是要幫人疏通經脈還是直接送去見祖宗啊？😂",
-                f"嘿～{name}，要不要試試那拳頭打在我這？反正我也想體驗一下{title}的“專業按摩”～😏",
-                f"聽說{title}{name}一拳就能讓人開悟？真的假的，我可以報名下一位嗎～？🤭",
-                f"{name}～你{relationship}的畫面我都想看重播了，簡直是托蘭格鬥界的藝術品啊～",
-                f"欸嘿～{title}{name}今天沒{relationship}嗎？怎麼覺得整個托蘭都安靜得不太習慣呢？😉",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
-            return True
-
-        elif style == "好奇+挑逗+挑釁":
-            response_template = [
-                f"{name}～今天不穿{relationship}了嗎？還是說怕被發現其實{title}呀？😏",
-                f"欸嘿～{title}{name}～那套{relationship}還真是……讓人分不清你是要打架還是要撩人呢♡",
-                f"{name}，妳那{relationship}真的有魔力耶～不過啊，實力好像跟{title}這稱號一樣可愛呢？😉",
-                f"嘻嘻～{title}{name}～又準備用{relationship}誘惑誰啦？別說是我喔～我可沒那麼容易被迷倒♡",
-                f"唉呀～{name}今天的{relationship}少了點氣勢耶？還是說妳真的{title}了？🤭",
-                f"魔王媽媽～{relationship}穿太可愛的話，小心別人以為妳在賣萌不是在統治世界喔～😜",
-                f"{title}{name}～這麼愛穿{relationship}，是不是其實希望被人看見呀？呵呵♡",
-                f"喔～{name}～{relationship}那招今天要對誰用呢？別告訴我又是我，不然我可要反擊囉♡",
-            ]
-            await message.reply(random.choice(response_template), mention_author=False)
+        templates = STYLE_TEMPLATES.get(style)
+        if templates:
+            reply = random.choice(templates).render(name=name, title=title, relationship=relationship)
+            await message.reply(reply, mention_author=False)
             return True
 
         # 如果空訊息的 style 沒有特殊處理，則會返回 False，讓主程式處理通用空訊息
 
     # --- 處理有訊息內容的情況 ---
     if prompt_content: # 如果有訊息內容，則呼叫 Gemini
-        async with message.channel.typing():
-            # 假設 query_gemini_func 是同步的，所以使用 asyncio.to_thread
-            # 將 personality (BOT_PERSONALITY) 作為第一個參數傳遞給 query_gemini_func
-            answer = await asyncio.to_thread(query_gemini_func, personality, prompt_content, name, style)
-        await message.reply(answer, mention_author=False)
+        await respond_func(message, personality, prompt_content, name, style)
         return True
 
     return False # 未被處理，讓主程式繼續處理
\ No newline at end of file
@@ -0,0 +1,69 @@
+# streaming_reply.py
+import time
+
+import discord
+
+from config import DISCORD_MESSAGE_LIMIT, STREAM_EDIT_INTERVAL_SECONDS
+
+def split_message(text: str, limit: int = DISCORD_MESSAGE_LIMIT) -> tuple[str, str]:
+    """
+    把超過 limit 的文字切成 (這則訊息的內容, 剩下的文字)。
+    優先在換行處切開，其次是空白，都找不到時直接在 limit 處切開。
+    """
+    for separator in ("\n", " "):
+        cut = text.rfind(separator, 0, limit)
+        if cut >= limit // 2:
+            return text[:cut], text[cut + 1:]
+    return text[:limit], text[limit:]
+
+class StreamingReply:
+    """
+    逐步發送回覆：第一段文字一到就回覆原訊息，之後每隔 edit_interval 秒把累積的文字編輯進去，
+    超過 Discord 的字數上限時把這則訊息定稿，剩下的文字接續發送新訊息。
+    """
+
+    def __init__(self, message: discord.Message, edit_interval: float = STREAM_EDIT_INTERVAL_SECONDS):
+        self.message = message
+        self.edit_interval = edit_interval
+        self.sent: list[discord.Message] = [] # 已發送的所有訊息
+        self._current: discord.Message | None = None # 正在編輯的訊息
+        self._text = ""   # 正在編輯的訊息應有的內容
+        self._shown = ""  # 正在編輯的訊息目前顯示的內容
+        self._last_flush = 0.0
+
+    async def feed(self, chunk: str):
+        self._text += chunk
+        while len(self._text) > DISCORD_MESSAGE_LIMIT:
+            head, self._text = split_message(self._text)
+            self._text = self._text.lstrip()
+            await self._show(head)
+            self._current, self._shown = None, "" # 此訊息已滿，之後的文字發送到新訊息
+        if time.monotonic() - self._last_flush >= self.edit_interval:
+            await self._show(self._text)
+
+    async def finish(self):
+        await self._show(self._text)
+
+    async def discard(self):
+        """刪除已經發送的所有訊息 (回應被取消時使用)。"""
+        for sent in self.sent:
+            try:
+                await sent.delete()
+            except discord.HTTPException:
+                pass
+        self.sent.clear()
+        self._current, self._shown = None, ""
+
+    async def _show(self, text: str):
+        if not text.strip() or text == self._shown:
+            return
+        if self._current is None:
+            if self.sent:
+                self._current = await self.message.channel.send(text)
+            else:
+                self._current = await self.message.reply(text, mention_author=False)
+            self.sent.append(self._current)
+        else:
+            await self._current.edit(content=text)
+        self._shown = text
+        self._last_flush = time.monotonic()
@@ -2,7 +2,9 @@
 import os
 import json
 import textwrap
-from typing import Dict, Any
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, Hashable
 
 # 讀取檔案內容的通用函數
 def read_file_content(file_path: str, default_content: str = "") -> str:
@@ -40,22 +42,60 @@ def load_json_data(file_path: str) -> Dict[str, Any]:
         print(f"錯誤：載入 JSON 檔案 '{file_path}' 失敗: {e}。返回空資料。")
         return {}
 
+# 使用者部分的提示範本，載入時就整理好縮排，不必每次都呼叫 textwrap.dedent
+USER_PROMPT_TEMPLATE = textwrap.dedent("""
+    以下是使用者 {user_name} 說的話：{user_prompt}
+    請盡量以 {user_name} 稱呼對方。
+""").strip()
+
+@lru_cache(maxsize=64)
+def build_system_prefix(bot_personality: str, user_style: str = None) -> str:
+    """
+    提示中固定不變的部分 (性格和風格)。每種 (性格, 風格) 只組合一次，
+    也是上傳到 Gemini 快取的內容 (見 context_cache.py)。
+    """
+    if user_style and user_style != "普通":
+        return f"{bot_personality}\n請以「{user_style}」的風格來回答。"
+    return bot_personality
+
+def build_user_prompt(user_prompt: str, user_name: str, history: str = "") -> str:
+    """
+    提示中每次都不同的部分：對話紀錄和使用者說的話。
+    history 是已在 token 預算內整理好的對話紀錄 (見 conversation.budget_history)。
+    """
+    full_prompt = USER_PROMPT_TEMPLATE.format(user_name=user_name, user_prompt=user_prompt)
+    if history:
+        return f"以下是你和 {user_name} 最近的對話紀錄：\n{history}\n{full_prompt}"
+    return full_prompt
+
 # 構建 Gemini 提示的輔助函數 (可在此處進一步客製化提示模板)
 def build_gemini_prompt(
     bot_personality: str, 
     user_prompt: str, 
     user_name: str, 
-    user_style: str = None
+    user_style: str = None,
+    history: str = ""
 ) -> str:
     """
-    根據 Bot 性格、使用者輸入、使用者名稱和風格來構建完整的 Gemini 提示。
+    根據 Bot 性格、使用者輸入、使用者名稱和風格來構建完整的 Gemini 提示 (單一段文字)。
     """
-    adjusted_personality = f"{bot_personality}\n請以「{user_style}」的風格來回答。" if user_style and user_style != "普通" else bot_personality
-    
-    # 使用 textwrap.dedent 清理多行字串的縮排，使提示更整潔
-    full_prompt = textwrap.dedent(f"""
-    {adjusted_personality}
-    以下是使用者 {user_name} 說的話：{user_prompt}
-    請盡量以 {user_name} 稱呼對方。
-    """)
-    return full_prompt.strip() # 移除可能的多餘空白
\ No newline at end of file
+    return "\n".join(filter(None, [build_system_prefix(bot_personality, user_style), build_user_prompt(user_prompt, user_name, history)]))
+
+class RecentIdSet:
+    """只保留最近加入的 maxlen 個 ID 的集合，超過時淘汰最舊的 (LRU)。"""
+
+    def __init__(self, maxlen: int):
+        self.maxlen = maxlen
+        self._ids: OrderedDict[Hashable, None] = OrderedDict()
+
+    def add(self, item: Hashable):
+        self._ids[item] = None
+        self._ids.move_to_end(item)
+        while len(self._ids) > self.maxlen:
+            self._ids.popitem(last=False)
+
+    def __contains__(self, item: Hashable) -> bool:
+        return item in self._ids
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -10,16 +10,24 @@ from music.player import MusicPlayer, RepeatMode, Track, coerce_duration, fetch_
 from music.playlist_store import PlaylistStore
 from music.channel_store import AllowedChannelStore
 
+try:
+    import supervisor_link  # 由 runner 啟動時用來回報就緒狀態喔...
+except ImportError:
+    supervisor_link = None
+
 load_dotenv()
 
-intents = discord.Intents.default()
-intents.message_content = True
-intents.guilds = True
-intents.voice_states = True
-intents.members = True
 
-# 嗯... 我來看看... 是誰在叫我呢？哼。😈
-bot = commands.Bot(command_prefix=commands.when_mentioned_or("!"), intents=intents, help_command=None)
+def build_intents() -> discord.Intents:
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.guilds = True
+    intents.voice_states = True
+    intents.members = True
+    return intents
+
+# 由 setup() 綁定到實際承載音樂功能的 Bot (單獨運行或合併模式)
+bot: Optional[commands.Bot] = None
 playlist_store = PlaylistStore()
 allowed_channel_store = AllowedChannelStore()
 
@@ -68,17 +76,48 @@ async def require_command_context(interaction: discord.Interaction) -> bool:
         return False
     return await require_allowed_channel(interaction)
 
-@bot.event
+
+async def require_not_draining(interaction: discord.Interaction) -> bool:
+    # 準備重新啟動時... 唱完這首就好，不再接新的歌了喔。
+    if not getattr(bot, "music_draining", False):
+        return True
+    message = "我準備要休息一下了... 唱完這首就不接新的歌了喔，等我回來再點吧。💤"
+    if interaction.response.is_done():
+        await interaction.followup.send(message, ephemeral=True)
+    else:
+        await interaction.response.send_message(message, ephemeral=True)
+    return False
+
+
+def supervisor_stats() -> dict:
+    players = list(getattr(bot, "music_players", {}).values())
+    connected = [player for player in players if player.voice and player.voice.is_connected()]
+    # 只有正在唱 (或暫停中) 的才算忙碌；閒置在語音頻道裡的不用等它自己離開
+    active = [player for player in connected if player.voice.is_playing() or player.voice.is_paused()]
+    return {
+        "music_players": len(players),
+        "connected_music_players": len(connected),
+        "active_music_players": len(active),
+        "queued_tracks": sum(len(player.queue) for player in players),
+        "busy": bool(active),
+    }
+
+
+def drain(args: dict) -> dict:
+    # 不再接受新的 /play，正在播放的歌會唱完，之後播放器就會離開語音頻道
+    bot.music_draining = True
+    return supervisor_stats()
+
 async def on_ready() -> None:
     await bot.tree.sync()
     # 偷偷地聽著你的心跳聲... 喔不，是你的音樂啦！🤫🎧
     await bot.change_presence(activity=discord.Activity(type=discord.ActivityType.listening, name="/play"))
     print(f"Logged in as {bot.user} (ID: {bot.user.id})")
 
-@bot.tree.command(name="play", description="播放一首歌... 一整個播放清單... 或者你想要搜尋的結果喔... 🎶")
+@app_commands.command(name="play", description="播放一首歌... 一整個播放清單... 或者你想要搜尋的結果喔... 🎶")
 @app_commands.describe(query="URL 或是想聽什麼呢？")
 async def play_command(interaction: discord.Interaction, query: str) -> None:
-    if not await require_command_context(interaction):
+    if not await require_command_context(interaction) or not await require_not_draining(interaction):
         return
     await interaction.response.defer(thinking=True) # 正在為你準備... 哼。😼
     guild = interaction.guild
@@ -102,7 +141,7 @@ async def play_command(interaction: discord.Interaction, query: str) -> None:
         await interaction.followup.send(f"為你把 **{len(tracks)}** 首歌都加到清單裡了喔。🎵")
     await player.start_playback(interaction)
 
-@bot.tree.command(name="queue", description="看看接下來要播什麼... 你已經催促過一首了嗎...？🥺")
+@app_commands.command(name="queue", description="看看接下來要播什麼... 你已經催促過一首了嗎...？🥺")
 async def queue_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -121,7 +160,7 @@ async def queue_command(interaction: discord.Interaction) -> None:
         embed.add_field(name="接下來沒有了...", value="你會再點歌給我的，對吧？🥺", inline=False)
     await interaction.response.send_message(embed=embed)
 
-@bot.tree.command(name="skip", description="跳到下一首歌... 你已經催促過一首了嗎...？🏃‍♀️")
+@app_commands.command(name="skip", description="跳到下一首歌... 你已經催促過一首了嗎...？🏃‍♀️")
 async def skip_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -129,7 +168,7 @@ async def skip_command(interaction: discord.Interaction) -> None:
     await player.skip(interaction)
     await interaction.response.send_message("好啦好啦... 跳過就是了。哼。🙄")
 
-@bot.tree.command(name="pause", description="暫停播放... 讓你專心聽我說話... 💤")
+@app_commands.command(name="pause", description="暫停播放... 讓你專心聽我說話... 💤")
 async def pause_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -140,7 +179,7 @@ async def pause_command(interaction: discord.Interaction) -> None:
     else:
         await interaction.response.send_message("現在什麼都沒在播... 你想讓我播什麼呢？🤔")
 
-@bot.tree.command(name="resume", description="繼續播放... 別讓我等太久喔！😠")
+@app_commands.command(name="resume", description="繼續播放... 別讓我等太久喔！😠")
 async def resume_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -151,7 +190,7 @@ async def resume_command(interaction: discord.Interaction) -> None:
     else:
         await interaction.response.send_message("什麼都沒暫停... 你是不是在玩我？🤨")
 
-@bot.tree.command(name="shuffle", description="把清單裡的歌隨機播放... 這樣更有趣對吧？亂七八糟的！😼")
+@app_commands.command(name="shuffle", description="把清單裡的歌隨機播放... 這樣更有趣對吧？亂七八糟的！😼")
 async def shuffle_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -159,7 +198,7 @@ async def shuffle_command(interaction: discord.Interaction) -> None:
     await player.shuffle()
     await interaction.response.send_message("清單亂掉了... 哼。亂七八糟的！🤪")
 
-@bot.tree.command(name="cp", description="看看現在...是誰在跟我說話... 🎧 (正在播放的歌曲) 👀")
+@app_commands.command(name="cp", description="看看現在...是誰在跟我說話... 🎧 (正在播放的歌曲) 👀")
 async def cp_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -178,7 +217,7 @@ async def cp_command(interaction: discord.Interaction) -> None:
     embed.add_field(name="來自", value=track.source)
     await interaction.response.send_message(embed=embed)
 
-@bot.tree.command(name="volume", description="調整我的音量... 你想讓我更大聲點嗎？(1-200%) 🔊")
+@app_commands.command(name="volume", description="調整我的音量... 你想讓我更大聲點嗎？(1-200%) 🔊")
 @app_commands.describe(amount="不說的話... 我就用現在的音量喔。")
 async def volume_command(interaction: discord.Interaction, amount: Optional[int] = None) -> None:
     if not await require_command_context(interaction):
@@ -192,7 +231,7 @@ async def volume_command(interaction: discord.Interaction, amount: Optional[int]
     await interaction.response.send_message(f"音量調整到 {clamped}% 了喔。🎶")
 
 
-@bot.tree.command(name="stop", description="讓我休息一下... 清空清單... 你會再回來找我的，對吧？🥺")
+@app_commands.command(name="stop", description="讓我休息一下... 清空清單... 你會再回來找我的，對吧？🥺")
 async def stop_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -205,7 +244,7 @@ repeat_choices = [
     app_commands.Choice(name="重複播放整個清單", value=RepeatMode.ALL.value),
 ]
 
-@bot.tree.command(name="repeat", description="要我重複播給你聽嗎？你喜歡嗎？🔄")
+@app_commands.command(name="repeat", description="要我重複播給你聽嗎？你喜歡嗎？🔄")
 @app_commands.choices(mode=repeat_choices)
 @app_commands.describe(mode="選擇重複模式... 或者你想知道我現在是怎樣？")
 async def repeat_command(
@@ -220,7 +259,7 @@ async def repeat_command(
     await player.set_repeat_mode(RepeatMode(mode.value))
     await interaction.response.send_message(f"重複模式設定成 `{mode.value}` 了喔。🔁")
 
-@bot.tree.command(name="search", description="幫你找歌... 但先不加到清單裡喔。🔍")
+@app_commands.command(name="search", description="幫你找歌... 但先不加到清單裡喔。🔍")
 @app_commands.describe(query="你想找什麼呢？")
 async def search_command(interaction: discord.Interaction, query: str) -> None:
     if not await require_command_context(interaction):
@@ -245,7 +284,7 @@ async def search_command(interaction: discord.Interaction, query: str) -> None:
         )
     await interaction.followup.send(embed=embed)
 
-@bot.tree.command(name="next", description="跳到下一首歌... 你已經催促過一首了嗎...？🏃‍♀️")
+@app_commands.command(name="next", description="跳到下一首歌... 你已經催促過一首了嗎...？🏃‍♀️")
 async def next_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -255,7 +294,7 @@ async def next_command(interaction: discord.Interaction) -> None:
 
 # bot.py (片段)
 
-@bot.tree.command(name="previous", description="想聽回上一首歌嗎？嗯哼。⏪")
+@app_commands.command(name="previous", description="想聽回上一首歌嗎？嗯哼。⏪")
 async def previous_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -440,7 +479,7 @@ async def playlist_list(interaction: discord.Interaction) -> None:
 @playlist_group.command(name="play", description="把你的播放清單裡的歌都播放出來... 讓我聽聽你的心聲。💖")
 @app_commands.describe(name="播放清單的名字？")
 async def playlist_play(interaction: discord.Interaction, name: str) -> None:
-    if not await require_command_context(interaction):
+    if not await require_command_context(interaction) or not await require_not_draining(interaction):
         return
     playlist = await playlist_store.get_playlist(interaction.user.id, name)
     if not playlist:
@@ -491,9 +530,7 @@ async def playlist_play(interaction: discord.Interaction, name: str) -> None:
     await player.refresh_now_playing(force_new=True)
     await player.start_playback(interaction)
 
-bot.tree.add_command(playlist_group)
-
-@bot.tree.command(name="channel_access", description="管理哪些頻道可以使用我... 我只屬於你的地方喔... 🔐")
+@app_commands.command(name="channel_access", description="管理哪些頻道可以使用我... 我只屬於你的地方喔... 🔐")
 @app_commands.describe(action="新增、移除、列出，或清空我的允許清單", channel="要新增或移除的頻道？")
 @app_commands.checks.has_permissions(manage_guild=True) # 只有伺服器主人才能命令我喔！👑
 async def channel_access_command(
@@ -547,7 +584,7 @@ async def channel_access_command(
         return
     await interaction.response.send_message("不支援這個動作喔... 哼。💢", ephemeral=True)
 
-@bot.tree.command(name="help", description="列出所有機器人指令... 這樣你就不會迷路了 🎵🧭")
+@app_commands.command(name="help", description="列出所有機器人指令... 這樣你就不會迷路了 🎵🧭")
 async def help_command(interaction: discord.Interaction) -> None:
     if not await require_command_context(interaction):
         return
@@ -563,11 +600,57 @@ async def help_command(interaction: discord.Interaction) -> None:
     embed.add_field(name="探索新歌 🔎", value="`/search <你想找什麼呢？>`", inline=False)
     await interaction.response.send_message(embed=embed, ephemeral=True)
 
+APP_COMMANDS = [
+    play_command,
+    queue_command,
+    skip_command,
+    pause_command,
+    resume_command,
+    shuffle_command,
+    cp_command,
+    volume_command,
+    stop_command,
+    repeat_command,
+    search_command,
+    next_command,
+    previous_command,
+    playlist_group,
+    channel_access_command,
+    help_command,
+]
+
+
+async def setup(host: commands.Bot) -> None:
+    """discord.py extension 進入點... 把我的指令都交給你喔。💖"""
+    global bot
+    bot = host
+    for command in APP_COMMANDS:
+        host.tree.add_command(command)
+    host.add_listener(on_ready)
+    if supervisor_link:
+        supervisor_link.register_stats(supervisor_stats)
+        supervisor_link.register_command("drain", drain)
+
+
+class MusicBot(commands.Bot):
+    async def setup_hook(self) -> None:
+        await setup(self)
+        if supervisor_link:
+            supervisor_link.register_client(self)
+            await supervisor_link.start_control_server()
+
+    async def on_ready(self) -> None:
+        if supervisor_link:
+            supervisor_link.notify_ready()
+
+
 def main() -> None:
-    token = os.getenv("DISCORD_TOKEN")
+    # 合併模式下若各子系統使用不同的 Bot，可用 MUSICBOT_DISCORD_TOKEN 指定專屬 token
+    token = os.getenv("MUSICBOT_DISCORD_TOKEN") or os.getenv("DISCORD_TOKEN")
     if not token:
         raise RuntimeError("請設定 DISCORD_TOKEN 環境變數... 或者加到 .env 檔案裡喔。🔐")
-    bot.run(token)
+    # 嗯... 我來看看... 是誰在叫我呢？哼。😈
+    MusicBot(command_prefix=commands.when_mentioned_or("!"), intents=build_intents(), help_command=None).run(token)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -336,7 +336,8 @@ class MusicPlayer:
 
     async def _play_next(self) -> None:
         async with self._lock:
-            if not self.queue:
+            # 排空中 (準備重新啟動) 時當作清單已經結束...唱完這首就說晚安喔...
+            if not self.queue or getattr(self.bot, "music_draining", False):
                 self.current = None
                 await self._maybe_cleanup_message(is_queue_empty=True) 
                 
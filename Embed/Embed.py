@@ -2,11 +2,17 @@ import json
 import discord
 from discord.ext import commands
 import os
+import sys
 import hashlib
 import asyncio
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 
+try:
+    import supervisor_link # Reports readiness when started by runner.py
+except ImportError:
+    supervisor_link = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -18,20 +24,14 @@ SENT_DATA_FILE = os.path.join(DATA_DIR, "sent_messages_bot.json")
 # 用於儲存已傳送檔案的哈希值和對應的訊息ID
 sent_files_data = {}
 
-# Get the token from environment variable
-TOKEN = os.getenv('DISCORD_TOKEN') 
-
-# Check if the token was loaded
-if TOKEN is None:
-    print("錯誤：未能從 .env 檔案載入 DISCORD_TOKEN。請檢查您的 .env 檔案是否存在並包含 'DISCORD_TOKEN=您的令牌'。")
-    exit() 
+# Get the token from environment variable (EMBED_DISCORD_TOKEN lets combined mode use a dedicated bot)
+TOKEN = os.getenv('EMBED_DISCORD_TOKEN') or os.getenv('DISCORD_TOKEN')
 
-# Configure Discord Intents
-intents = discord.Intents.default()
-intents.message_content = True
-
-# Initialize the Bot
-bot = commands.Bot(command_prefix='!', intents=intents)
+def build_intents():
+    """Intents required by the embed publisher."""
+    intents = discord.Intents.default()
+    intents.message_content = True
+    return intents
 
 # --- Utility Functions ---
 
@@ -77,21 +77,9 @@ def calculate_file_hash(filepath):
         print(f"錯誤：計算檔案哈希值時發生意外錯誤：{e}")
         return None
 
-# --- Bot Events ---
-
-@bot.event
-async def on_ready():
-    """Event handler for when the bot successfully connects to Discord."""
-    global sent_files_data
-    sent_files_data = load_sent_data()
-    print(f'{bot.user.name} 已上線！')
-    print(f"已載入的已傳送訊息數據：{sent_files_data}")
-    
-    bot.loop.create_task(prompt_for_send())
-
 # --- Core Logic Functions ---
 
-async def prompt_for_send():
+async def prompt_for_send(bot):
     """
     Prompts the user in the console for JSON file path and channel ID.
     Uses run_in_executor to avoid blocking the Discord event loop.
@@ -129,15 +117,14 @@ async def prompt_for_send():
                 print("錯誤：頻道 ID 必須是數字。請重新輸入。")
 
         print(f"正在嘗試傳送 '{json_filepath}' 到頻道 '{channel_id}'...")
-        await core_send_embed_logic(json_filepath, channel_id)
+        await core_send_embed_logic(bot, json_filepath, channel_id)
         print("-" * 30)
         await asyncio.sleep(1)
 
-async def core_send_embed_logic(json_filepath: str, channel_id: int):
+async def core_send_embed_logic(bot, json_filepath: str, channel_id: int):
     """
     Handles loading, parsing, and sending/editing Discord messages based on a JSON file.
     """
-    global sent_files_data
     loop = asyncio.get_running_loop()
 
     try:
@@ -312,19 +299,64 @@ async def core_send_embed_logic(json_filepath: str, channel_id: int):
         except Exception as e:
             print(f"發送新訊息失敗：{e}")
 
-# --- Discord Commands (optional) ---
+# --- Bot Events & Discord Commands ---
 
-@bot.command(name='send_embed')
-@commands.is_owner()
-async def send_embed_discord_command(ctx, json_filepath: str, channel_id: int):
+class EmbedPublisher(commands.Cog):
     """
-    Discord command to send an embed from a JSON file to a specific channel.
-    Usage: !send_embed <json_filepath> <channel_id>
+    Embed publisher: console prompt plus the owner-only !send_embed command.
+    Runs standalone or as an extension in combined mode.
     """
-    await ctx.send(f"正在處理從 Discord 命令發送的請求：'{json_filepath}' 到頻道 '{channel_id}'...")
-    await core_send_embed_logic(json_filepath, channel_id)
-    await ctx.send("請求處理完成。")
+
+    def __init__(self, bot, console=True):
+        self.bot = bot
+        self.console = console
+        self._prompt_task = None
+
+    @commands.Cog.listener()
+    async def on_ready(self):
+        """Event handler for when the bot successfully connects to Discord."""
+        global sent_files_data
+        sent_files_data = load_sent_data()
+        print(f'{self.bot.user.name} 已上線！')
+        print(f"已載入的已傳送訊息數據：{sent_files_data}")
+
+        # on_ready fires again after a full reconnect; keep a single console prompt running
+        if self.console and (self._prompt_task is None or self._prompt_task.done()):
+            self._prompt_task = asyncio.create_task(prompt_for_send(self.bot))
+
+    @commands.command(name='send_embed')
+    @commands.is_owner()
+    async def send_embed_discord_command(self, ctx, json_filepath: str, channel_id: int):
+        """
+        Discord command to send an embed from a JSON file to a specific channel.
+        Usage: !send_embed <json_filepath> <channel_id>
+        """
+        await ctx.send(f"正在處理從 Discord 命令發送的請求：'{json_filepath}' 到頻道 '{channel_id}'...")
+        await core_send_embed_logic(self.bot, json_filepath, channel_id)
+        await ctx.send("請求處理完成。")
+
+async def setup(bot):
+    """discord.py extension entry point (combined mode). The console prompt only runs on a terminal."""
+    await bot.add_cog(EmbedPublisher(bot, console=sys.stdin.isatty()))
+
+class EmbedBot(commands.Bot):
+    async def setup_hook(self):
+        await self.add_cog(EmbedPublisher(self))
+        if supervisor_link:
+            supervisor_link.register_client(self)
+            await supervisor_link.start_control_server()
+
+    async def on_ready(self):
+        if supervisor_link:
+            supervisor_link.notify_ready()
 
 # --- Run the Bot ---
 if __name__ == '__main__':
+    # Check if the token was loaded
+    if TOKEN is None:
+        print("錯誤：未能從 .env 檔案載入 DISCORD_TOKEN。請檢查您的 .env 檔案是否存在並包含 'DISCORD_TOKEN=您的令牌'。")
+        exit()
+
+    # Initialize the Bot
+    bot = EmbedBot(command_prefix='!', intents=build_intents())
     bot.run(TOKEN)
\ No newline at end of file
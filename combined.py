@@ -0,0 +1,124 @@
+import asyncio
+import os
+import sys
+
+import aiohttp
+import discord
+from discord.ext import commands
+from dotenv import load_dotenv # 用於本地開發時加載 .env
+
+import supervisor_link
+
+# 合併模式：在同一個進程、同一個 asyncio 事件迴圈中運行 AIbot、MusicBot 和 Embed 發布器。
+# 每個子系統都以 discord.py extension 的形式載入 (各自提供 setup(bot))，
+# 所以 discord.py、aiohttp、yt_dlp 只會被 import 一次。
+# 使用相同 token 的子系統共用同一個 Bot 實例，也就是同一條 gateway 連線、
+# 同一個 HTTP session 和同一份狀態快取；只有設定了不同 token 時才會建立額外的 Bot，
+# 而這些 Bot 共用同一個 aiohttp 連線池。
+# 每個子系統仍然可以用原本的方式單獨運行 (python AIbot/main.py 等)。
+
+os.environ['PYTHONIOENCODING'] = 'utf-8'
+load_dotenv()
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# --- 配置區塊 ---
+# directory: 子系統所在目錄 (會加入 sys.path，讓子系統原本的 import 繼續有效)
+# extension: 要載入的 extension 模組名稱
+# token_env: 子系統專屬 token 的環境變數，未設定時使用 DISCORD_TOKEN
+SUBSYSTEMS = {
+    "AIbot": {"directory": "AIbot", "extension": "main", "token_env": "AIBOT_DISCORD_TOKEN"},
+    "MusicBot": {"directory": "Discord-Music-Bot-main", "extension": "bot", "token_env": "MUSICBOT_DISCORD_TOKEN"},
+    "Embed": {"directory": "Embed", "extension": "Embed", "token_env": "EMBED_DISCORD_TOKEN"},
+}
+
+def enabled_subsystems():
+    """返回要載入的子系統名稱；可用 COMBINED_SUBSYSTEMS=AIbot,MusicBot 只載入部分子系統。"""
+    selected = os.getenv("COMBINED_SUBSYSTEMS")
+    if not selected:
+        return list(SUBSYSTEMS)
+    names = [name.strip() for name in selected.split(",") if name.strip()]
+    unknown = [name for name in names if name not in SUBSYSTEMS]
+    if unknown:
+        raise RuntimeError(f"未知的子系統: {', '.join(unknown)}")
+    return names
+
+def resolve_token(name):
+    return os.getenv(SUBSYSTEMS[name]["token_env"]) or os.getenv("DISCORD_TOKEN")
+
+def build_intents():
+    """所有子系統所需 intents 的聯集。"""
+    intents = discord.Intents.default()
+    intents.message_content = True
+    intents.guilds = True
+    intents.voice_states = True
+    intents.members = True
+    return intents
+
+class CombinedBot(commands.Bot):
+    """承載一個或多個子系統 extension 的 Bot。"""
+
+    def __init__(self, extensions, **options):
+        # MusicBot 只使用斜線指令，AIbot 和 Embed 的文字指令都以 "!" 開頭
+        super().__init__(command_prefix="!", intents=build_intents(), help_command=None, **options)
+        self.initial_extensions = extensions
+        self.peers = [self] # 同一進程中的所有 Bot，全部上線後才向 runner 回報就緒
+
+    async def setup_hook(self):
+        for extension in self.initial_extensions:
+            await self.load_extension(extension)
+            print(f"[Combined] 已載入 extension: {extension}")
+        supervisor_link.register_client(self)
+        await supervisor_link.start_control_server()
+
+    async def on_ready(self):
+        if all(peer.is_ready() for peer in self.peers):
+            supervisor_link.notify_ready()
+
+async def run_combined():
+    names = enabled_subsystems()
+    for name in names:
+        directory = os.path.join(ROOT_DIR, SUBSYSTEMS[name]["directory"])
+        if directory not in sys.path:
+            sys.path.insert(0, directory)
+
+    # 依 token 分組：相同 token 的子系統共用一個 Bot
+    groups = {}
+    for name in names:
+        token = resolve_token(name)
+        if not token:
+            raise RuntimeError(f"{name} 缺少 token：請設定 {SUBSYSTEMS[name]['token_env']} 或 DISCORD_TOKEN。")
+        groups.setdefault(token, []).append(name)
+
+    # 多個 Bot 時共用同一個連線池 (第一個關閉的 Bot 會一併關閉它)；
+    # 所以任一 Bot 結束時其他 Bot 也一起關閉，整個進程結束後由 runner 重新啟動
+    options = {"connector": aiohttp.TCPConnector()} if len(groups) > 1 else {}
+
+    bots = []
+    for token, members in groups.items():
+        extensions = [SUBSYSTEMS[name]["extension"] for name in members]
+        bots.append((CombinedBot(extensions, **options), token))
+        print(f"[Combined] {', '.join(members)} 共用一個 Bot 連線。")
+    for bot, _ in bots:
+        bot.peers = [peer for peer, _ in bots]
+
+    tasks = [asyncio.create_task(bot.start(token)) for bot, token in bots]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in done:
+            task.result() # Bot 因錯誤結束時拋出原本的例外
+    finally:
+        for bot, _ in bots:
+            if not bot.is_closed():
+                await bot.close()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+def main():
+    discord.utils.setup_logging()
+    try:
+        asyncio.run(run_combined())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,99 @@
-import subprocess
+import asyncio
+import itertools
+import json
+import queue
+import random
+import re
+import signal
+import sys
+import tempfile
 import threading
 import time
 import os
-from flask import Flask, jsonify
+from collections import deque
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
 from dotenv import load_dotenv # 用於本地開發時加載 .env
 
+try:
+    import resource # 僅 Unix 提供；其他平台上不套用 rlimit
+except ImportError:
+    resource = None
+
 os.environ['PYTHONIOENCODING'] = 'utf-8'
+os.environ['PYTHONUNBUFFERED'] = '1' # 讓子進程的輸出逐行送達，崩潰前的日誌也不會留在緩衝區中
+
+# --- 重新啟動策略 ---
+@dataclass
+class RestartPolicy:
+    """
+    單一Bot的重新啟動策略。
+    連續崩潰時以帶抖動的指數退避延遲重新啟動；在 crash_loop_window 秒內崩潰
+    crash_loop_threshold 次即視為崩潰迴圈，斷路器打開 circuit_open_seconds 秒，
+    期間不再重新啟動 (例如 token 錯誤或 import 失敗時，避免持續衝擊 Discord gateway)。
+    """
+    base_delay: float = 0.5          # 第一次重新啟動前的延遲 (秒)
+    max_delay: float = 60.0          # 退避延遲上限 (秒)
+    multiplier: float = 2.0          # 每次連續失敗後延遲的倍數
+    jitter: float = 0.3              # 延遲隨機浮動比例 (0.3 表示 ±30%)
+    healthy_uptime: float = 60.0     # 運行超過此秒數才算健康，會重置退避
+    crash_loop_threshold: int = 5    # 斷路器觸發所需的崩潰次數
+    crash_loop_window: float = 300.0 # 計算崩潰次數的時間窗 (秒)
+    circuit_open_seconds: float = 900.0 # 斷路器打開後暫停重新啟動的時間 (秒)
+
+    def backoff_delay(self, consecutive_failures):
+        """根據連續失敗次數計算下一次重新啟動前的延遲。"""
+        if consecutive_failures <= 0:
+            return 0.0
+        delay = min(self.max_delay, self.base_delay * self.multiplier ** (consecutive_failures - 1))
+        return delay * random.uniform(1 - self.jitter, 1 + self.jitter)
+
+@dataclass
+class BotSpec:
+    """
+    單一Bot的定義。argv 直接交給 exec (不經過 shell)；其餘欄位用於隔離各Bot的資源，
+    讓 MusicBot 的 ffmpeg 不會搶走 AIbot 事件迴圈的 CPU，單一Bot的記憶體洩漏也不會拖垮整個容器。
+    nice、CPU 親和性和 rlimit 在進程啟動後立即套用，之後產生的子進程 (例如 ffmpeg) 會繼承它們。
+    """
+    argv: list
+    env: dict = field(default_factory=dict)   # 額外的環境變數 (覆蓋 runner 自身的環境)
+    restart_policy: RestartPolicy = field(default_factory=RestartPolicy)
+    depends_on: list = field(default_factory=list) # 等到這些Bot就緒後才啟動
+    nice: int = 0                        # 相對於 runner 的 nice 增量，越大優先權越低
+    cpu_affinity: set | None = None      # 允許使用的 CPU 編號，None 表示不限制
+    rlimit_as_mb: int | None = None      # 虛擬記憶體上限 (RLIMIT_AS)，超過時配置記憶體會失敗
+    rlimit_nofile: int | None = None     # 檔案描述符上限 (RLIMIT_NOFILE)
+    memory_limit_mb: int | None = None   # 記憶體看門狗：常駐記憶體 (含子進程) 超過時排空並重新啟動
+
+@dataclass
+class BotState:
+    """監督者為每個Bot記錄的重新啟動統計。"""
+    restarts: int = 0                 # 累計重新啟動次數
+    crashes: int = 0                  # 累計不健康結束 (運行時間未達 healthy_uptime) 次數
+    consecutive_failures: int = 0     # 連續不健康結束次數，用於計算退避
+    last_exit_code: int | None = None
+    started_at: float | None = None   # 目前進程的啟動時間 (time.monotonic)
+    circuit_open_until: float = 0.0   # 斷路器打開後允許試探性啟動的時間 (time.monotonic)，0 表示關閉
+    recent_crashes: deque = field(default_factory=deque)
+    log_lines: int = 0                # 累計讀取到的輸出行數
+    log_lines_dropped: int = 0        # 因速率限制而丟棄的輸出行數
+    ready: bool = False               # 目前進程是否已回報就緒 (Discord on_ready)
+    restart_requested: bool = False   # 目前進程是被監督者主動重新啟動的 (不算崩潰)
+    cold_start_seconds: float | None = None # 最近一次從啟動到就緒所花的時間
 
-# --- Flask 應用初始化 ---
-app = Flask(__name__)
+    def circuit_state(self):
+        if not self.circuit_open_until:
+            return "closed"
+        return "open" if time.monotonic() < self.circuit_open_until else "half-open"
+
+# --- 環境變數加載 (主要用於本地開發) ---
+# 在 Render 等雲端平台，環境變數會直接注入到運行時環境中，
+# 因此 load_dotenv() 不會找到 .env 文件，但 os.getenv() 仍會正常工作。
+load_dotenv()
 
 # --- 配置區塊 ---
-# 定義要啟動的Bot腳本路徑
+# 定義要啟動的Bot (見 BotSpec)
+# depends_on=["其他Bot名稱"] 表示等到那些Bot就緒後才啟動；沒有依賴的Bot會同時啟動
 # 假設你的專案結構如下：
 # your_bot_project/
 # ├── runner.py
@@ -20,163 +102,889 @@ app = Flask(__name__)
 # └── Discord-Music-Bot-main/
 #     └── bot.py
 BOT_SCRIPTS = {
-    "AIbot": "python AIbot/main.py",
-    "MusicBot": "python Discord-Music-Bot-main/bot.py"
+    # AIbot 主要在等待 Gemini 回應，降低優先權讓語音編碼保持流暢
+    "AIbot": BotSpec(
+        argv=[sys.executable, "AIbot/main.py"],
+        nice=5,
+        rlimit_nofile=1024,
+        memory_limit_mb=int(os.getenv("AIBOT_MEMORY_LIMIT_MB", "300")),
+    ),
+    # yt_dlp 解析和 ffmpeg 都在這個進程樹中，記憶體看門狗會把它們一併計算
+    "MusicBot": BotSpec(
+        argv=[sys.executable, "Discord-Music-Bot-main/bot.py"],
+        rlimit_nofile=4096,
+        memory_limit_mb=int(os.getenv("MUSICBOT_MEMORY_LIMIT_MB", "400")),
+    ),
 }
 
-# 用於追蹤Bot進程的字典
+# 設定 RUNNER_MODE=combined 時，改為在單一進程、單一事件迴圈中運行所有子系統 (見 combined.py)，
+# 共用 discord.py/aiohttp/yt_dlp 的 import、gateway 連線和快取以節省記憶體
+if os.getenv("RUNNER_MODE") == "combined":
+    BOT_SCRIPTS = {
+        "Combined": BotSpec(
+            argv=[sys.executable, "combined.py"],
+            rlimit_nofile=4096,
+            memory_limit_mb=int(os.getenv("COMBINED_MEMORY_LIMIT_MB", "600")),
+        ),
+    }
+
+# 子進程單行輸出的上限 (位元組)，超過時該行會被丟棄而不是卡住讀取
+OUTPUT_LINE_LIMIT = 1024 * 1024
+# 進程結束後繼續讀取剩餘輸出的上限 (秒)；仍持有輸出管道的子孫進程 (例如 ffmpeg) 不會延遲重新啟動
+OUTPUT_DRAIN_SECONDS = 2
+# /metrics 快照的刷新間隔 (秒)；抓取時直接返回快取，不會即時讀取 /proc
+METRICS_REFRESH_SECONDS = 15
+# 每個Bot在記憶體中保留的最近輸出行數 (供 /logs 讀取)
+LOG_BUFFER_LINES = 2000
+# 每個Bot每秒最多記錄的輸出行數及允許的突發量，超過的行會被丟棄並以一行摘要代替
+LOG_RATE_LIMIT = 200
+LOG_RATE_BURST = 1000
+# 寫入 stdout 的待處理佇列上限；stdout 消費者過慢時丟棄新行而不是阻塞監督者
+CONSOLE_QUEUE_SIZE = 10000
+# /logs?follow=1 在沒有新輸出時發送保活註解的間隔 (秒)
+LOG_KEEPALIVE_SECONDS = 15
+# 控制通道單次請求的逾時 (秒)
+CONTROL_TIMEOUT_SECONDS = 5
+# 重新啟動前等待Bot排空 (例如唱完目前的歌) 的上限 (秒) 及查詢間隔
+DRAIN_TIMEOUT_SECONDS = 600
+DRAIN_POLL_SECONDS = 5
+# 記憶體看門狗重新啟動時的排空上限 (秒)：記憶體還在增長，不能像手動重新啟動一樣等太久
+MEMORY_RESTART_DRAIN_SECONDS = 30
+# 排空期間進程樹的常駐記憶體超過 memory_limit_mb 的這個倍數時，不再等待，直接 SIGKILL
+MEMORY_HARD_LIMIT_FACTOR = 1.5
+# 送出 shutdown 後等待進程自行結束的時間 (秒)，逾時則 terminate，再逾時則 kill
+SHUTDOWN_GRACE_SECONDS = 15
+# 設定後才啟用 POST /restart?bot=<名稱> 和 /logs?bot=<名稱> (輸出含使用者訊息)，請求需帶 Authorization: Bearer <token>
+RUNNER_ADMIN_TOKEN = os.getenv("RUNNER_ADMIN_TOKEN")
+
+# 用於追蹤Bot進程的字典 (值為 asyncio.subprocess.Process)
 bot_processes = {}
+# 每個Bot的重新啟動統計 (值為 BotState)
+bot_states = {name: BotState() for name in BOT_SCRIPTS}
+# 最近一次產生的 Prometheus 指標文本，由 refresh_metrics 定時更新
+metrics_snapshot = ""
+# 預先序列化的 /heartbeat 狀態 (不含時間戳)，由 publish_status 在進程事件發生時更新
+status_snapshot = ""
+
+# --- 日誌緩衝區 (/logs) ---
+# 子進程的輸出由監督者持續讀出，寫入每個Bot固定大小的環形緩衝區，
+# 並經由背景執行緒轉送到 stdout。任何一端變慢都只會丟棄日誌，不會讓 Bot 卡在寫入 stdout。
+
+class LogBuffer:
+    """固定大小的環形日誌緩衝區。每行帶有遞增序號，讀取端可以從某個序號之後繼續讀取。"""
+
+    def __init__(self, maxlen):
+        self._lines = deque(maxlen=maxlen)
+        self._next_seq = 0
+        self._waiters = set() # 等待新行的 /logs?follow=1 連線
+
+    def append(self, text):
+        self._lines.append((self._next_seq, time.time(), text))
+        self._next_seq += 1
+        for waiter in self._waiters:
+            if not waiter.done():
+                waiter.set_result(None)
+        self._waiters.clear()
+
+    def tail_seq(self, count):
+        """返回最近 count 行中第一行的序號。"""
+        return max(self._next_seq - count, self._next_seq - len(self._lines))
+
+    async def read_since(self, seq, timeout=0):
+        """
+        返回序號 >= seq 的所有行及下一次讀取應使用的序號。
+        沒有新行且 timeout > 0 時，最多等待 timeout 秒。
+        """
+        if self._next_seq <= seq and timeout:
+            waiter = asyncio.get_running_loop().create_future()
+            self._waiters.add(waiter)
+            try:
+                await asyncio.wait_for(waiter, timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                self._waiters.discard(waiter)
+        first_seq = self._next_seq - len(self._lines)
+        start = max(seq, first_seq)
+        return list(itertools.islice(self._lines, start - first_seq, None)), self._next_seq
+
+class LogRateLimiter:
+    """令牌桶：每秒補充 rate 個令牌，最多累積 burst 個；沒有令牌時該行被丟棄。"""
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = time.monotonic()
+        self.pending_dropped = 0 # 尚未回報的丟棄行數
+
+    def allow(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        self.pending_dropped += 1
+        return False
+
+class ConsoleWriter:
+    """在背景執行緒中把日誌寫到 stdout；佇列滿時直接丟棄，確保監督者迴圈不會被 stdout 阻塞。"""
+
+    def __init__(self, maxsize):
+        self._queue = queue.Queue(maxsize)
+        self._thread = None
+        self.dropped = 0
+
+    def write(self, text):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="console-writer", daemon=True)
+            self._thread.start()
+        try:
+            self._queue.put_nowait(text)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            print(self._queue.get(), flush=True)
+
+bot_logs = {name: LogBuffer(LOG_BUFFER_LINES) for name in BOT_SCRIPTS}
+console_writer = ConsoleWriter(CONSOLE_QUEUE_SIZE)
+
+def emit_log(name, text):
+    bot_logs[name].append(text)
+    console_writer.write(f"[{name} LOG] {text}")
+# 每個Bot的就緒事件，由 supervise_all 建立，用於處理啟動依賴
+bot_ready_events = {}
+# 記憶體看門狗和 /restart 觸發的重新啟動任務 (事件迴圈只持有任務的弱引用)
+background_tasks = set()
+# 控制通道 socket 所在目錄，由 supervise_all 設定
+control_socket_dir = None
 # 用於心跳檢測的最後活動時間
 last_heartbeat = time.time()
-
-# --- 環境變數加載 (主要用於本地開發) ---
-# 在 Render 等雲端平台，環境變數會直接注入到運行時環境中，
-# 因此 load_dotenv() 不會找到 .env 文件，但 os.getenv() 仍會正常工作。
-load_dotenv()
+# 專案根目錄，加入子進程的 PYTHONPATH 以便 Bot 匯入 supervisor_link
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
 
 # --- Bot 啟動和監控函數 ---
-def run_bot(name, command):
+# 所有 Bot 都由同一個 asyncio 事件迴圈監督：
+# 每個子進程的輸出以非阻塞方式讀取，進程一結束就會立即被察覺並重新啟動，
+# 不再需要每個 Bot 一條阻塞的執行緒，也不需要每 60 秒輪詢一次。
+
+def install_child_watcher():
+    """
+    在 Linux 上改用 pidfd 等待子進程結束：子進程一結束，事件迴圈就會收到通知，
+    不需要額外的 waitpid 執行緒，也不需要輪詢。
+    Python 3.12+ 預設已使用 pidfd；不支援 pidfd 的平台則沿用預設的 watcher。
+    """
+    if sys.version_info >= (3, 12) or not hasattr(os, "pidfd_open"):
+        return
+    try:
+        os.close(os.pidfd_open(os.getpid())) # 確認核心支援 pidfd (Linux 5.3+)
+    except OSError:
+        return
+    watcher = asyncio.PidfdChildWatcher()
+    watcher.attach_loop(asyncio.get_running_loop())
+    asyncio.set_child_watcher(watcher)
+
+async def pump_output(name, read_fd):
+    """
+    持續讀取子進程的輸出管道並寫入日誌緩衝區，直到管道關閉 (EOF) 或被取消。
+    讀取永遠不會因下游而停下；輸出過多時超出速率限制的行會被丟棄。
+    """
+    loop = asyncio.get_running_loop()
+    stream = asyncio.StreamReader(limit=OUTPUT_LINE_LIMIT)
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(stream), os.fdopen(read_fd, "rb", 0)
+    )
+    try:
+        await read_output(name, stream)
+    finally:
+        transport.close()
+
+async def read_output(name, stream):
+    state = bot_states[name]
+    limiter = LogRateLimiter(LOG_RATE_LIMIT, LOG_RATE_BURST)
+    while True:
+        try:
+            line = await stream.readline()
+        except ValueError:
+            # 單行超過 OUTPUT_LINE_LIMIT，該行已被丟棄，繼續讀取下一行
+            emit_log(name, "<輸出行過長，已略過>")
+            continue
+        if not line:
+            break
+        state.log_lines += 1
+        if not limiter.allow():
+            state.log_lines_dropped += 1
+            continue
+        if limiter.pending_dropped:
+            emit_log(name, f"<輸出過多，已略過 {limiter.pending_dropped} 行>")
+            limiter.pending_dropped = 0
+        emit_log(name, line.decode('utf-8', errors='replace').rstrip())
+    if limiter.pending_dropped:
+        emit_log(name, f"<輸出過多，已略過 {limiter.pending_dropped} 行>")
+
+async def wait_for_ready(name, read_fd):
+    """
+    等待Bot經由繼承的管道回報就緒 (supervisor_link.notify_ready 寫入 "READY")。
+    進程在就緒前結束時管道會關閉 (EOF)，此協程直接返回。
+    """
+    state = bot_states[name]
+    loop = asyncio.get_running_loop()
+    reader = asyncio.StreamReader()
+    transport, _ = await loop.connect_read_pipe(
+        lambda: asyncio.StreamReaderProtocol(reader), os.fdopen(read_fd, "rb", 0)
+    )
+    try:
+        line = await reader.readline()
+    finally:
+        transport.close()
+    if line.strip() == b"READY" and state.started_at is not None:
+        state.ready = True
+        state.cold_start_seconds = time.monotonic() - state.started_at
+        bot_ready_events[name].set()
+        publish_status()
+        print(f"[{name}] 已就緒，冷啟動耗時 {state.cold_start_seconds:.1f} 秒。")
+
+def control_socket_path(name):
+    return os.path.join(control_socket_dir, f"{name}.sock")
+
+def build_child_env(name, spec, ready_fd):
+    """子進程的環境變數：告訴 Bot 就緒管道和控制通道的位置，並讓它能匯入 supervisor_link。"""
+    env = dict(os.environ)
+    env.update(spec.env)
+    env["RUNNER_READY_FD"] = str(ready_fd)
+    env["RUNNER_CONTROL_SOCKET"] = control_socket_path(name)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT_DIR, env.get("PYTHONPATH")]))
+    return env
+
+def apply_resource_limits(name, pid, spec):
+    """
+    對剛啟動的子進程套用 nice、CPU 親和性和 rlimit。
+    這裡從監督者端以 pid 設定，而不是用 preexec_fn：runner 有多個執行緒，
+    fork 後在子進程中執行 Python 程式碼可能死結。子進程此時剛 exec，只有一個執行緒，
+    之後建立的執行緒和子進程都會繼承這些設定。
     """
-    啟動一個Bot進程並監控它。
-    如果進程意外停止，此函數將結束，監控執行緒會負責重新啟動。
+    try:
+        if spec.nice:
+            os.setpriority(os.PRIO_PROCESS, pid, os.getpriority(os.PRIO_PROCESS, 0) + spec.nice)
+        if spec.cpu_affinity is not None:
+            os.sched_setaffinity(pid, spec.cpu_affinity)
+        if resource is not None:
+            if spec.rlimit_as_mb is not None:
+                limit = spec.rlimit_as_mb * 1024 * 1024
+                resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+            if spec.rlimit_nofile is not None:
+                resource.prlimit(pid, resource.RLIMIT_NOFILE, (spec.rlimit_nofile, spec.rlimit_nofile))
+    except (AttributeError, OSError, ValueError) as e:
+        # 平台不支援或權限不足時只發出警告，Bot照常運行
+        print(f"[{name}] 警告: 無法套用資源限制: {e}")
+
+async def run_bot(name, spec):
+    """
+    啟動一個Bot進程並等待它結束。
+    進程結束後此協程返回其返回碼，由 supervise_bot 負責重新啟動。
     """
     print(f"[{name}] 正在啟動...")
+    state = bot_states[name]
+    ready_read, ready_write = os.pipe()
+    # 輸出使用自己建立的管道而不是 asyncio 的 PIPE：asyncio 的 process.wait() 會等到所有管道關閉才返回，
+    # 繼承了輸出管道的子孫進程 (例如 ffmpeg) 還活著時就偵測不到Bot已經結束
+    output_read, output_write = os.pipe()
     try:
-        # Popen 允許非阻塞地啟動外部進程
-        process = subprocess.Popen(
-            command,
-            shell=True,
-            stdout=subprocess.PIPE, # 捕獲標準輸出
-            stderr=subprocess.STDOUT, # 重定向標準錯誤到標準輸出
-            text=True # 以文本模式處理輸出
+        process = await asyncio.create_subprocess_exec(
+            *spec.argv,
+            stdout=output_write, # 捕獲標準輸出
+            stderr=output_write, # 標準錯誤寫入同一個管道
+            env=build_child_env(name, spec, ready_write),
+            pass_fds=(ready_write,),
+            start_new_session=True, # 獨立的進程組，停止時連同 ffmpeg 等子孫進程一起結束
         )
-        bot_processes[name] = process
-        print(f"[{name}] 已啟動，PID: {process.pid}")
-
-        # 持續讀取Bot的輸出並打印，以方便調試
-        # 這會阻塞這個執行緒，直到Bot進程結束
-        for line in process.stdout:
-            print(f"[{name} LOG] {line.strip()}")
-        
-        process.wait() # 等待Bot進程結束
-        print(f"[{name}] 進程已結束，返回碼: {process.returncode}")
-        
     except Exception as e:
         print(f"[{name}] 啟動失敗: {e}")
+        os.close(ready_read)
+        os.close(output_read)
+        return None
+    finally:
+        # 寫入端只留給子進程，子進程結束時讀取端才會收到 EOF
+        os.close(ready_write)
+        os.close(output_write)
+
+    apply_resource_limits(name, process.pid, spec)
+    bot_processes[name] = process
+    state.started_at = time.monotonic()
+    publish_status()
+    print(f"[{name}] 已啟動，PID: {process.pid}")
+    ready_task = asyncio.create_task(wait_for_ready(name, ready_read))
+    pump_task = asyncio.create_task(pump_output(name, output_read))
+    try:
+        # 由 child watcher 偵測進程結束，不依賴輸出管道的 EOF；之後最多再讀取 OUTPUT_DRAIN_SECONDS 秒的剩餘輸出
+        returncode = await process.wait()
+        try:
+            await asyncio.wait_for(pump_task, OUTPUT_DRAIN_SECONDS)
+        except asyncio.TimeoutError:
+            print(f"[{name}] 輸出管道仍被其他進程持有，停止讀取。")
+        print(f"[{name}] 進程已結束，返回碼: {returncode}")
+        return returncode
     finally:
-        # 不論成功或失敗，如果進程記錄存在，則移除它
-        if name in bot_processes:
+        pump_task.cancel()
+        ready_task.cancel()
+        # Bot 結束後清除殘留的子孫進程；監督者本身被中止時 (例如 Ctrl-C，不會再傳到獨立的進程組) 結束整個Bot
+        signal_process_group(process, signal.SIGKILL if process.returncode is not None else signal.SIGTERM)
+        state.ready = False
+        bot_ready_events[name].clear()
+        # 不論成功或失敗，如果進程記錄仍指向此進程，則移除它
+        if bot_processes.get(name) is process:
             del bot_processes[name]
 
-def start_bots_in_threads():
-    """為每個Bot腳本啟動一個單獨的執行緒。"""
-    for name, command in BOT_SCRIPTS.items():
-        thread = threading.Thread(target=run_bot, args=(name, command))
-        thread.daemon = True # 設置為守護執行緒，這樣主程序結束時它們會自動終止
-        thread.start()
-        time.sleep(1) # 給一點時間讓bot啟動，避免同時啟動導致資源問題
+def record_exit(name, returncode, policy):
+    """
+    記錄一次進程結束，並返回重新啟動前應等待的秒數。
+    運行時間不足 healthy_uptime 的結束視為崩潰；崩潰過於頻繁時打開斷路器。
+    """
+    state = bot_states[name]
+    now = time.monotonic()
+    uptime = now - state.started_at if state.started_at is not None else 0.0
+    state.last_exit_code = returncode
+    state.started_at = None
+
+    if state.restart_requested:
+        # 監督者主動要求的重新啟動 (已排空並關閉)：不算崩潰，立即重新啟動
+        state.restart_requested = False
+        return 0.0
+
+    if uptime >= policy.healthy_uptime:
+        # 健康運行了一段時間才結束：重置退避和斷路器，幾乎立即重新啟動
+        state.consecutive_failures = 0
+        state.recent_crashes.clear()
+        state.circuit_open_until = 0.0
+        return policy.backoff_delay(1)
+
+    state.crashes += 1
+    state.consecutive_failures += 1
+    state.recent_crashes.append(now)
+    while state.recent_crashes and now - state.recent_crashes[0] > policy.crash_loop_window:
+        state.recent_crashes.popleft()
+
+    # 斷路器半開 (冷卻後的試探性啟動) 時再次崩潰，立即重新打開
+    if state.circuit_open_until or len(state.recent_crashes) >= policy.crash_loop_threshold:
+        state.circuit_open_until = now + policy.circuit_open_seconds
+        state.recent_crashes.clear()
+        print(
+            f"[Monitor] 錯誤: {name} 陷入崩潰迴圈 (最後返回碼: {returncode})，"
+            f"斷路器打開，{policy.circuit_open_seconds:.0f} 秒內不再重新啟動。"
+        )
+        return policy.circuit_open_seconds
+
+    return policy.backoff_delay(state.consecutive_failures)
+
+async def supervise_bot(name, spec):
+    """持續運行一個Bot：進程結束後依照重新啟動策略等待，再重新啟動它。"""
+    state = bot_states[name]
+    policy = spec.restart_policy
+    while True:
+        for dependency in spec.depends_on:
+            if not bot_ready_events[dependency].is_set():
+                print(f"[{name}] 等待 {dependency} 就緒後再啟動...")
+                await bot_ready_events[dependency].wait()
+        returncode = await run_bot(name, spec)
+        delay = record_exit(name, returncode, policy)
+        state.restarts += 1
+        publish_status()
+        print(
+            f"[Monitor] 警告: {name} Bot 進程已停止 (第 {state.restarts} 次重新啟動，"
+            f"連續失敗 {state.consecutive_failures} 次)。{delay:.1f} 秒後重新啟動..."
+        )
+        await asyncio.sleep(delay)
+
+# --- 控制通道 ---
+# 每個Bot在 RUNNER_CONTROL_SOCKET 上提供控制通道 (見 supervisor_link.py)，
+# 協定為每行一個 JSON 請求/回應。監督者用它讀取Bot內部的統計、要求排空和正常關閉。
+
+async def control_request(name, command, args=None, timeout=CONTROL_TIMEOUT_SECONDS):
+    """向Bot的控制通道送出一個指令並返回結果；通道無法使用或指令失敗時拋出例外。"""
+    reader, writer = await asyncio.wait_for(asyncio.open_unix_connection(control_socket_path(name)), timeout)
+    try:
+        writer.write(json.dumps({"command": command, "args": args or {}}).encode("utf-8") + b"\n")
+        await writer.drain()
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    finally:
+        writer.close()
+    if not line:
+        raise ConnectionError("控制通道已關閉")
+    response = json.loads(line)
+    if not response.get("ok"):
+        raise RuntimeError(response.get("error"))
+    return response["result"]
+
+def signal_process_group(process, sig):
+    """向Bot的整個進程組 (包括 ffmpeg、yt-dlp 等子孫進程) 發送信號；進程組已經不存在時忽略。"""
+    try:
+        os.killpg(process.pid, sig)
+    except ProcessLookupError:
+        pass
+
+async def wait_for_exit(process, timeout):
+    try:
+        await asyncio.wait_for(asyncio.shield(process.wait()), timeout)
+        return True
+    except asyncio.TimeoutError:
+        return False
 
-def monitor_bots_and_heartbeat():
+async def stop_bot(name, process, drain_timeout=DRAIN_TIMEOUT_SECONDS):
     """
-    監控Bot進程和Web Service的心跳。
-    這個函數在一個獨立的守護執行緒中運行。
+    正常停止一個Bot：先要求排空 (例如唱完目前的歌、不再接受新的 /play)，
+    等到Bot不再忙碌 (最多 drain_timeout 秒) 後送出 shutdown；控制通道無法使用或逾時時依序 terminate / kill。
+    """
+    try:
+        await control_request(name, "drain")
+        deadline = time.monotonic() + drain_timeout
+        while process.returncode is None and time.monotonic() < deadline:
+            stats = await control_request(name, "stats")
+            if not stats.get("busy"):
+                break
+            await asyncio.sleep(DRAIN_POLL_SECONDS)
+        await control_request(name, "shutdown")
+    except (OSError, RuntimeError, ValueError, asyncio.TimeoutError) as e:
+        print(f"[{name}] 控制通道無法使用 ({e})，改為直接終止進程。")
+    if await wait_for_exit(process, SHUTDOWN_GRACE_SECONDS):
+        return
+    print(f"[{name}] 進程未在時限內結束，送出 SIGTERM...")
+    process.terminate()
+    if await wait_for_exit(process, SHUTDOWN_GRACE_SECONDS):
+        return
+    print(f"[{name}] 進程仍未結束，向整個進程組送出 SIGKILL。")
+    signal_process_group(process, signal.SIGKILL)
+
+async def restart_bot(name, drain_timeout=DRAIN_TIMEOUT_SECONDS):
+    """排空並重新啟動一個正在運行的Bot；Bot未在運行時返回 False。"""
+    process = bot_processes.get(name)
+    if process is None or process.returncode is not None:
+        return False
+    print(f"[{name}] 收到重新啟動要求，正在排空...")
+    bot_states[name].restart_requested = True
+    await stop_bot(name, process, drain_timeout)
+    return True
+
+async def collect_reported_stats():
+    """向所有已就緒的Bot查詢其內部統計 (gateway 延遲、播放器數量、進行中的 Gemini 請求等)。"""
+    names = [name for name, state in bot_states.items() if state.ready]
+    results = await asyncio.gather(*(control_request(name, "stats") for name in names), return_exceptions=True)
+    return {name: result for name, result in zip(names, results) if isinstance(result, dict)}
+
+async def monitor_heartbeat():
+    """
+    監控Web Service的心跳。
+    這主要是一個警示，不會自動重啟Web服務本身，因為Web服務是主進程。
     """
     while True:
-        current_time = time.time()
-        
         # 檢查Web Service心跳是否超時 (5分鐘沒有被訪問)
-        # 這主要是一個警示，不會自動重啟Web服務本身，因為Web服務是主進程
-        if current_time - last_heartbeat > 300:
+        if time.time() - last_heartbeat > 300:
             print("[Monitor] Web Service 心跳超時警告：可能沒有外部服務在檢測或服務已停止響應。")
+        await asyncio.sleep(60) # 每60秒檢查一次
+
+# --- 資源指標 (/metrics) ---
+# 讀取 /proc/<pid> 取得每個Bot進程的資源使用量，以 Prometheus 文本格式輸出。
+# 快照由 refresh_metrics 在監督者迴圈中定時產生，抓取端點只返回快取的文本。
+
+CLOCK_TICKS = os.sysconf("SC_CLK_TCK") if hasattr(os, "sysconf") else 100
+
+def read_proc_stat(pid):
+    """讀取 /proc/<pid>/stat，返回 (comm, 其餘欄位列表)；進程不存在時返回 None。"""
+    try:
+        with open(f"/proc/{pid}/stat", "r", encoding="utf-8", errors="replace") as f:
+            raw = f.read()
+    except OSError:
+        return None
+    # comm 可能包含空白或括號，以最後一個 ')' 分隔
+    comm = raw[raw.index("(") + 1:raw.rindex(")")]
+    return comm, raw[raw.rindex(")") + 2:].split()
+
+def read_rss_bytes(pid):
+    """從 /proc/<pid>/status 讀取常駐記憶體 (VmRSS)。"""
+    try:
+        with open(f"/proc/{pid}/status", "r", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+def count_open_fds(pid):
+    try:
+        return len(os.listdir(f"/proc/{pid}/fd"))
+    except OSError:
+        return 0
+
+def build_children_map():
+    """掃描 /proc 一次，建立 ppid -> [(pid, comm)] 的對照表，用於尋找孫進程 (ffmpeg)。"""
+    children = {}
+    try:
+        entries = os.listdir("/proc")
+    except OSError:
+        return children
+    for entry in entries:
+        if not entry.isdigit():
+            continue
+        stat = read_proc_stat(entry)
+        if stat is None:
+            continue
+        comm, fields = stat
+        children.setdefault(int(fields[1]), []).append((int(entry), comm))
+    return children
+
+def count_descendants(pid, children, comm_name):
+    """計算某進程所有後代中名稱為 comm_name 的進程數量。"""
+    count = 0
+    pending = [pid]
+    while pending:
+        for child_pid, comm in children.get(pending.pop(), ()):
+            if comm == comm_name:
+                count += 1
+            pending.append(child_pid)
+    return count
+
+def tree_rss_bytes(pid, children):
+    """某進程及其所有後代 (例如 ffmpeg) 的常駐記憶體總和。"""
+    total = 0
+    pending = [pid]
+    while pending:
+        current = pending.pop()
+        total += read_rss_bytes(current)
+        pending.extend(child_pid for child_pid, _ in children.get(current, ()))
+    return total
+
+def collect_process_metrics(pid, children):
+    """收集單一Bot進程的資源使用量；進程已不存在時返回 None。"""
+    stat = read_proc_stat(pid)
+    if stat is None:
+        return None
+    _, fields = stat
+    # 欄位索引以 state 為 0：utime=11, stime=12, num_threads=17
+    return {
+        "cpu_seconds": (int(fields[11]) + int(fields[12])) / CLOCK_TICKS,
+        "rss_bytes": read_rss_bytes(pid),
+        "threads": int(fields[17]),
+        "open_fds": count_open_fds(pid),
+        "ffmpeg_processes": count_descendants(pid, children, "ffmpeg"),
+        "tree_rss_bytes": tree_rss_bytes(pid, children),
+    }
+
+METRIC_DEFINITIONS = [
+    ("bot_up", "gauge", "Whether the bot process is running (1) or not (0)."),
+    ("bot_ready", "gauge", "Whether the bot reported ready to the supervisor (1) or not (0)."),
+    ("bot_cold_start_seconds", "gauge", "Seconds from process start to ready for the latest start."),
+    ("bot_cpu_seconds_total", "counter", "User plus system CPU time consumed by the bot process."),
+    ("bot_resident_memory_bytes", "gauge", "Resident set size of the bot process."),
+    ("bot_tree_resident_memory_bytes", "gauge", "Resident set size of the bot process and all its descendants."),
+    ("bot_threads", "gauge", "Number of OS threads in the bot process."),
+    ("bot_open_fds", "gauge", "Number of open file descriptors in the bot process."),
+    ("bot_ffmpeg_processes", "gauge", "Number of ffmpeg processes descended from the bot process."),
+    ("bot_restarts_total", "counter", "Number of times the supervisor restarted the bot."),
+    ("bot_crashes_total", "counter", "Number of unhealthy exits of the bot."),
+    ("bot_uptime_seconds", "gauge", "Seconds since the current bot process was started."),
+    ("bot_log_lines_per_second", "gauge", "Output lines per second over the last refresh interval."),
+    ("bot_log_lines_dropped_total", "counter", "Output lines dropped by the log rate limiter."),
+]
+
+def render_metrics(samples, reported_stats):
+    """
+    將 {指標名稱: [(bot名稱, 數值)]} 轉換為 Prometheus 文本格式，
+    並附上各Bot經由控制通道回報的內部統計 (bot_reported_stat)。
+    """
+    lines = []
+    for metric, metric_type, help_text in METRIC_DEFINITIONS:
+        lines.append(f"# HELP {metric} {help_text}")
+        lines.append(f"# TYPE {metric} {metric_type}")
+        for bot_name, value in samples.get(metric, []):
+            lines.append(f'{metric}{{bot="{bot_name}"}} {value}')
+    lines.append("# HELP bot_reported_stat In-process statistics reported by the bot over its control channel.")
+    lines.append("# TYPE bot_reported_stat gauge")
+    for bot_name, stats in reported_stats.items():
+        for key, value in stats.items():
+            if key != "pid" and isinstance(value, (int, float)):
+                lines.append(f'bot_reported_stat{{bot="{bot_name}",stat="{key}"}} {int(value) if isinstance(value, bool) else value}')
+    return "\n".join(lines) + "\n"
+
+def build_metrics_snapshot(interval, previous_log_lines, reported_stats):
+    """
+    讀取所有Bot的 /proc 資料並產生指標文本 (在執行緒中運行，避免阻塞事件迴圈)。
+    同時返回各Bot進程樹的常駐記憶體，供記憶體看門狗使用。
+    """
+    children = build_children_map()
+    now = time.monotonic()
+    samples = {}
+    tree_rss = {}
+
+    def add(metric, bot_name, value):
+        samples.setdefault(metric, []).append((bot_name, value))
+
+    for name, state in list(bot_states.items()):
+        process = bot_processes.get(name)
+        usage = collect_process_metrics(process.pid, children) if process else None
+        add("bot_up", name, 1 if usage else 0)
+        add("bot_ready", name, 1 if state.ready else 0)
+        if state.cold_start_seconds is not None:
+            add("bot_cold_start_seconds", name, state.cold_start_seconds)
+        if usage:
+            tree_rss[name] = usage["tree_rss_bytes"]
+            add("bot_cpu_seconds_total", name, usage["cpu_seconds"])
+            add("bot_resident_memory_bytes", name, usage["rss_bytes"])
+            add("bot_tree_resident_memory_bytes", name, usage["tree_rss_bytes"])
+            add("bot_threads", name, usage["threads"])
+            add("bot_open_fds", name, usage["open_fds"])
+            add("bot_ffmpeg_processes", name, usage["ffmpeg_processes"])
+        if state.started_at is not None:
+            add("bot_uptime_seconds", name, now - state.started_at)
+        add("bot_restarts_total", name, state.restarts)
+        add("bot_crashes_total", name, state.crashes)
+        lines_delta = state.log_lines - previous_log_lines.get(name, state.log_lines)
+        add("bot_log_lines_per_second", name, lines_delta / interval if interval > 0 else 0)
+        add("bot_log_lines_dropped_total", name, state.log_lines_dropped)
+    return render_metrics(samples, reported_stats), tree_rss
+
+def check_memory_limits(tree_rss):
+    """
+    記憶體看門狗：進程樹的常駐記憶體超過 memory_limit_mb 的Bot會被排空 (最多 MEMORY_RESTART_DRAIN_SECONDS 秒)
+    並重新啟動；排空期間超過 memory_limit_mb × MEMORY_HARD_LIMIT_FACTOR 時直接 SIGKILL。
+    """
+    for name, rss in tree_rss.items():
+        spec = BOT_SCRIPTS.get(name)
+        if spec is None or spec.memory_limit_mb is None:
+            continue
+        limit = spec.memory_limit_mb * 1024 * 1024
+        if bot_states[name].restart_requested:
+            process = bot_processes.get(name)
+            if rss > limit * MEMORY_HARD_LIMIT_FACTOR and process is not None and process.returncode is None:
+                print(
+                    f"[Monitor] 警告: {name} 排空期間使用 {rss / 1024 / 1024:.0f} MB 記憶體，"
+                    f"超過上限的 {MEMORY_HARD_LIMIT_FACTOR:g} 倍，向整個進程組送出 SIGKILL。"
+                )
+                signal_process_group(process, signal.SIGKILL)
+            continue
+        if rss > limit:
+            print(
+                f"[Monitor] 警告: {name} 使用 {rss / 1024 / 1024:.0f} MB 記憶體，"
+                f"超過上限 {spec.memory_limit_mb} MB，正在重新啟動。"
+            )
+            task = asyncio.create_task(restart_bot(name, MEMORY_RESTART_DRAIN_SECONDS))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+
+async def refresh_metrics():
+    """定時刷新 /metrics 的快照，並檢查各Bot的記憶體上限。"""
+    global metrics_snapshot
+    previous_log_lines = {}
+    last_refresh = time.monotonic()
+    while True:
+        now = time.monotonic()
+        try:
+            reported_stats = await collect_reported_stats()
+            metrics_snapshot, tree_rss = await asyncio.to_thread(
+                build_metrics_snapshot, now - last_refresh, previous_log_lines, reported_stats
+            )
+            check_memory_limits(tree_rss)
+        except Exception as e:
+            print(f"[Metrics] 產生指標快照失敗: {e}")
+        previous_log_lines = {name: state.log_lines for name, state in bot_states.items()}
+        last_refresh = now
+        await asyncio.sleep(METRICS_REFRESH_SECONDS)
+
+async def supervise_all():
+    """監督者主協程：為每個Bot建立監督任務，並運行心跳監控和指標刷新。"""
+    global control_socket_dir
+    control_socket_dir = tempfile.mkdtemp(prefix="runner-control-")
+    install_child_watcher()
+    bot_ready_events.update({name: asyncio.Event() for name in BOT_SCRIPTS})
+    tasks = [asyncio.create_task(monitor_heartbeat()), asyncio.create_task(refresh_metrics())]
+    # 所有Bot同時啟動；有 depends_on 的Bot會在 supervise_bot 中等待依賴就緒
+    for name, spec in BOT_SCRIPTS.items():
+        tasks.append(asyncio.create_task(supervise_bot(name, spec)))
+    await asyncio.gather(*tasks)
 
-        # 檢查Bot進程是否仍在運行
-        # 這裡使用 list(bot_processes.items()) 是為了避免在迭代字典時修改它
-        for name, process in list(bot_processes.items()):
-            if process.poll() is not None:  # 如果進程已結束 (returncode不是None)
-                print(f"[Monitor] 警告: {name} Bot 進程已停止。正在嘗試重新啟動...")
-                # 重新啟動這個Bot
-                thread = threading.Thread(target=run_bot, args=(name, BOT_SCRIPTS[name]))
-                thread.daemon = True
-                thread.start()
-        
-        time.sleep(60) # 每60秒檢查一次
-
-# --- Flask Web Service 端點 ---
-@app.route('/heartbeat')
-def heartbeat():
+# --- 狀態伺服器 ---
+# 與監督者在同一個事件迴圈中運行的極簡 HTTP 伺服器，不需要額外的 WSGI 框架或執行緒。
+# /heartbeat 返回預先產生的狀態快照 (只在進程啟動、就緒、結束時重建)，
+# 所以外部 uptime 探測幾乎沒有成本，也不會在另一個執行緒中讀取監督者的狀態。
+
+# 讀取請求行和標頭的逾時 (秒)，避免閒置連線一直佔用
+HTTP_REQUEST_TIMEOUT_SECONDS = 10
+HTTP_REASONS = {200: "OK", 202: "Accepted", 401: "Unauthorized", 404: "Not Found", 405: "Method Not Allowed", 503: "Service Unavailable"}
+
+def publish_status():
+    """重建 /heartbeat 的狀態快照 (保持原本的 JSON 結構)。"""
+    global status_snapshot
+    bots = {}
+    # 所有Bot的狀態 (包含因斷路器打開而暫停重新啟動的Bot)
+    for name, state in bot_states.items():
+        process = bot_processes.get(name)
+        bots[name] = {
+            "pid": process.pid if process else None,
+            "is_running": process is not None and process.returncode is None, # None表示進程仍在運行
+            "restarts": state.restarts,
+            "crashes": state.crashes,
+            "last_exit_code": state.last_exit_code,
+            "circuit": state.circuit_state(),
+            "ready": state.ready, # 已完成 Discord 登入 (on_ready)，而不只是進程存活
+            "cold_start_seconds": state.cold_start_seconds,
+        }
+    # 去掉外層大括號，回應時再接上 status 和 timestamp
+    status_snapshot = json.dumps({"bots": bots, "ready": all(bot["ready"] for bot in bots.values())})[1:-1]
+
+def json_response(status, payload):
+    return status, "application/json", json.dumps(payload)
+
+async def send_response(writer, status, content_type, body, head_only=False, extra_headers=()):
+    body = body.encode("utf-8") if isinstance(body, str) else body
+    headers = [
+        f"HTTP/1.1 {status} {HTTP_REASONS.get(status, '')}",
+        f"Content-Type: {content_type}",
+        f"Content-Length: {len(body)}",
+        "Connection: close",
+        *extra_headers,
+    ]
+    writer.write(("\r\n".join(headers) + "\r\n\r\n").encode("latin-1"))
+    if not head_only:
+        writer.write(body)
+    await writer.drain()
+
+def handle_heartbeat(query, headers):
     """提供一個心跳端點，用於確認Web Service是否在運行。"""
     global last_heartbeat
     last_heartbeat = time.time() # 更新心跳時間
-    
-    status = {
-        "status": "running",
-        "timestamp": time.time(),
-        "bots": {}
-    }
-    
-    # 獲取所有正在運行Bot的狀態
-    for name, process in bot_processes.items():
-        status["bots"][name] = {
-            "pid": process.pid,
-            "is_running": process.poll() is None # None表示進程仍在運行
-        }
-    
-    return jsonify(status)
+    return 200, "application/json", f'{{"status": "running", "timestamp": {time.time()}, {status_snapshot}}}'
 
-# --- 主程序入口 ---
-if __name__ == "__main__":
-    # 步驟 1: 啟動所有 Discord Bot
-    print("[Main] 啟動所有 Discord Bot 執行緒...")
-    start_bots_in_threads()
+def handle_ready(query, headers):
+    """供平台健康檢查使用：所有Bot都就緒時返回 200，否則返回 503。"""
+    all_ready = all(state.ready for state in bot_states.values())
+    return json_response(200 if all_ready else 503, {"ready": all_ready})
+
+def handle_metrics(query, headers):
+    """以 Prometheus 文本格式提供每個Bot的資源指標 (返回定時刷新的快取快照)。"""
+    return 200, "text/plain; version=0.0.4", metrics_snapshot
+
+def check_admin(headers):
+    """管理端點的驗證：未設定 RUNNER_ADMIN_TOKEN 時返回 404，token 不符時返回 401，通過時返回 None。"""
+    if not RUNNER_ADMIN_TOKEN:
+        return json_response(404, {"error": "not enabled"})
+    if headers.get("authorization") != f"Bearer {RUNNER_ADMIN_TOKEN}":
+        return json_response(401, {"error": "unauthorized"})
+    return None
+
+def handle_restart(query, headers):
+    """排空並重新啟動指定的Bot (需設定 RUNNER_ADMIN_TOKEN，並以 Bearer token 驗證)。"""
+    denied = check_admin(headers)
+    if denied is not None:
+        return denied
+    name = query.get("bot")
+    if name not in bot_states:
+        return json_response(404, {"error": "unknown bot", "bots": list(bot_states)})
+    task = asyncio.create_task(restart_bot(name))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return json_response(202, {"restarting": name})
+
+# SSE 的換行：行內的 \r 或 \n 會提早結束 data 欄位，所以每一段都要各自成為一個 data: 行
+SSE_LINE_BREAK = re.compile(r"\r\n|\r|\n")
+
+async def stream_logs(writer, query, headers, head_only):
+    """
+    以 Server-Sent Events 提供某個Bot最近的輸出，例如 /logs?bot=MusicBot&follow=1。
+    lines: 先送出的最近行數 (預設 200)；follow=1: 持續推送新輸出；支援 Last-Event-ID 斷線續傳。
+    輸出包含使用者的訊息和錯誤追蹤，和 /restart 一樣需要 RUNNER_ADMIN_TOKEN。
+    """
+    denied = check_admin(headers)
+    if denied is not None:
+        await send_response(writer, *denied, head_only)
+        return
+    name = query.get("bot")
+    if name not in bot_logs:
+        await send_response(writer, *json_response(404, {"error": "unknown bot", "bots": list(bot_logs)}), head_only)
+        return
+    buffer = bot_logs[name]
+    follow = query.get("follow") == "1"
+    last_event_id = headers.get("last-event-id")
+    if last_event_id and last_event_id.isdigit():
+        seq = int(last_event_id) + 1
+    else:
+        lines = query.get("lines", "200")
+        seq = buffer.tail_seq(int(lines) if lines.isdigit() else 200)
+
+    # 串流回應沒有 Content-Length，以關閉連線表示結束
+    writer.write(
+        b"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\n"
+        b"Cache-Control: no-cache\r\nConnection: close\r\n\r\n"
+    )
+    if head_only:
+        await writer.drain()
+        return
+    while True:
+        entries, seq = await buffer.read_since(seq, timeout=LOG_KEEPALIVE_SECONDS if follow else 0)
+        for entry_seq, _, text in entries:
+            data = "".join(f"data: {piece}\n" for piece in SSE_LINE_BREAK.split(text))
+            writer.write(f"id: {entry_seq}\n{data}\n".encode("utf-8"))
+        if not entries and follow:
+            writer.write(b": keepalive\n\n")
+        await writer.drain() # 客戶端斷線時會拋出 ConnectionError，結束串流
+        if not follow:
+            break
+
+HTTP_ROUTES = {
+    "/heartbeat": ("GET", handle_heartbeat),
+    "/ready": ("GET", handle_ready),
+    "/metrics": ("GET", handle_metrics),
+    "/restart": ("POST", handle_restart),
+}
 
-    # 步驟 2: 啟動一個獨立執行緒來監控Bot進程和Web Service的心跳
-    print("[Main] 啟動 Bot 監控執行緒...")
-    monitor_thread = threading.Thread(target=monitor_bots_and_heartbeat)
-    monitor_thread.daemon = True
-    monitor_thread.start()
+async def handle_http(reader, writer):
+    """處理一個 HTTP 連線 (每個連線只處理一個請求)。"""
+    try:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), HTTP_REQUEST_TIMEOUT_SECONDS)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), HTTP_REQUEST_TIMEOUT_SECONDS)
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                key, _, value = line.decode("latin-1").partition(":")
+                headers[key.strip().lower()] = value.strip()
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+        except (asyncio.TimeoutError, ValueError):
+            return # 逾時、標頭過長或格式錯誤的請求直接關閉連線
+        url = urlsplit(target)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        head_only = method == "HEAD" # uptime 探測常用 HEAD，視為不帶內容的 GET
+        if url.path == "/logs":
+            await stream_logs(writer, query, headers, head_only)
+            return
+        route = HTTP_ROUTES.get(url.path)
+        if route is None:
+            await send_response(writer, *json_response(404, {"error": "not found"}), head_only)
+        elif method != route[0] and not (head_only and route[0] == "GET"):
+            await send_response(writer, *json_response(405, {"error": "method not allowed"}), head_only, (f"Allow: {route[0]}",))
+        else:
+            await send_response(writer, *route[1](query, headers), head_only)
+    except ConnectionError:
+        pass
+    finally:
+        writer.close()
 
-    print("[Main] 所有 Bot 和監控執行緒已啟動。")
-    print("[Main] 準備啟動 Flask Web Service...")
+async def main(port):
+    """在同一個事件迴圈中啟動狀態伺服器和Bot監督者。"""
+    publish_status()
+    server = await asyncio.start_server(handle_http, "0.0.0.0", port)
+    print(f"[Main] 狀態伺服器已在 0.0.0.0:{port} 上監聽。")
+    async with server:
+        await supervise_all()
 
-    # 步驟 3: 啟動 Flask Web Service
+# --- 主程序入口 ---
+if __name__ == "__main__":
     # Render 會提供一個 PORT 環境變數，我們的服務應該監聽這個端口
     port = int(os.environ.get("PORT", 5000)) # 默認為 5000，但在 Render 通常是 10000+
-
+    print("[Main] 啟動 Bot 監督者...")
     try:
-        # 嘗試從 gunicorn 庫導入 BaseApplication
-        from gunicorn.app.base import BaseApplication
-
-        class FlaskGunicornApp(BaseApplication):
-            def __init__(self, app, options=None):
-                self.options = options or {}
-                self.application = app
-                super().__init__()
-
-            def load_config(self):
-                # 遍歷選項並將它們設置到 Gunicorn 配置中
-                for key, value in self.options.items():
-                    if key in self.cfg.settings and value is not None:
-                        self.cfg.set(key.lower(), value)
-
-            def load(self):
-                # 返回 Flask 應用實例
-                return self.application
-
-        # Gunicorn 配置選項
-        gunicorn_options = {
-            'bind': f'0.0.0.0:{port}',  # 監聽所有網絡接口和指定的端口
-            'workers': 1,               # 通常一個 worker 對於單個 Flask 應用就足夠了
-            'timeout': 120,             # 增加請求超時時間 (秒)
-            'loglevel': 'info',         # 日誌級別
-            'capture_output': True,     # 捕獲並打印 worker 的 stdout/stderr
-            'enable_stdio_inheritance': True, # 允許 worker 繼承主進程的 stdout/stderr
-        }
-        
-        print(f"[Main] 正在使用 Gunicorn 啟動 Flask 應用在 0.0.0.0:{port}...")
-        FlaskGunicornApp(app, gunicorn_options).run()
-
-    except ImportError:
-        # 如果 Gunicorn 未安裝，則回退到 Flask 自帶的開發伺服器
-        # 不推薦在生產環境使用
-        print("[Main] Gunicorn 未安裝，回退到 Flask 自帶開發伺服器。此不適用於生產環境！")
-        app.run(host='0.0.0.0', port=port, debug=False) # 關閉 debug 模式
\ No newline at end of file
+        asyncio.run(main(port))
+    except KeyboardInterrupt:
+        pass
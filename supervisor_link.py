@@ -0,0 +1,126 @@
+import asyncio
+import inspect
+import json
+import math
+import os
+
+# Bot 子進程與 runner 監督者之間的連結。
+# 由 runner 啟動時：
+# - 環境變數 RUNNER_READY_FD 指向一個繼承的管道，Bot 完成 Discord 登入 (on_ready) 後呼叫
+#   notify_ready() 寫入 "READY"，監督者據此記錄冷啟動時間。
+# - 環境變數 RUNNER_CONTROL_SOCKET 指定一個 unix domain socket 路徑，Bot 呼叫
+#   start_control_server() 在該路徑上提供控制通道 (stats / drain / shutdown 等指令)。
+# 單獨運行 (沒有 runner) 時這些函數都不做任何事。
+# Bot 以 `try: import supervisor_link except ImportError: supervisor_link = None` 匯入，
+# runner 會把專案根目錄加入子進程的 PYTHONPATH。
+
+READY_FD_ENV = "RUNNER_READY_FD"
+CONTROL_SOCKET_ENV = "RUNNER_CONTROL_SOCKET"
+
+_ready_sent = False
+_control_server = None
+# 指令名稱 -> 處理函數列表 (可以是同步或 async 函數，接收請求中的 args 字典)
+# 合併模式下多個子系統可以註冊同一個指令 (例如 drain)，收到指令時會依序全部執行
+_commands = {}
+# 提供 stats 指令內容的函數列表，每個返回一個字典
+_stats_providers = []
+# 本進程中的 discord Client (合併模式下可能有多個)
+_clients = []
+
+def notify_ready():
+    """通知監督者本進程已就緒；只會送出一次 (on_ready 在重新連線後可能再次觸發)。"""
+    global _ready_sent
+    fd = os.environ.get(READY_FD_ENV)
+    if _ready_sent or not fd:
+        return
+    _ready_sent = True
+    try:
+        os.write(int(fd), b"READY\n")
+        os.close(int(fd))
+    except (OSError, ValueError) as e:
+        print(f"[supervisor_link] 無法回報就緒狀態: {e}")
+
+def register_command(name, handler):
+    """註冊一個控制指令。handler(args) 的返回值會作為回應的 result (多個處理函數時為列表)。"""
+    _commands.setdefault(name, []).append(handler)
+
+def register_stats(provider):
+    """註冊一個 stats 提供者。provider() 返回數值字典；多個提供者的結果會合併，busy 取邏輯或。"""
+    _stats_providers.append(provider)
+
+def register_client(client):
+    """註冊一個 discord Client：stats 會包含其 gateway 延遲和伺服器數量，shutdown 指令會關閉它。"""
+    _clients.append(client)
+
+def _client_stats():
+    latencies = [client.latency for client in _clients if math.isfinite(client.latency)]
+    stats = {"guilds": sum(len(client.guilds) for client in _clients)}
+    if latencies:
+        stats["gateway_latency_seconds"] = max(latencies)
+    return stats
+
+async def _shutdown(args):
+    # 先回覆監督者，再關閉連線；Client 關閉後 bot.run()/start() 返回，進程正常結束
+    for client in _clients:
+        asyncio.get_running_loop().call_soon(asyncio.ensure_future, client.close())
+    return {"closing": len(_clients)}
+
+def collect_stats():
+    stats = {"pid": os.getpid(), "busy": False}
+    if _clients:
+        stats.update(_client_stats())
+    for provider in _stats_providers:
+        result = provider()
+        busy = stats["busy"] or bool(result.pop("busy", False))
+        stats.update(result)
+        stats["busy"] = busy
+    return stats
+
+async def _run_command(name, args):
+    if name == "stats":
+        return collect_stats()
+    if name == "ping":
+        return "pong"
+    if name == "shutdown" and "shutdown" not in _commands:
+        return await _shutdown(args)
+    handlers = _commands.get(name)
+    if not handlers:
+        raise KeyError(f"未知的指令: {name}")
+    results = []
+    for handler in handlers:
+        result = handler(args)
+        if inspect.isawaitable(result):
+            result = await result
+        results.append(result)
+    return results[0] if len(results) == 1 else results
+
+async def _handle_connection(reader, writer):
+    # 協定：每行一個 JSON 請求 {"command": "...", "args": {...}}，每行一個 JSON 回應
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            try:
+                request = json.loads(line)
+                result = await _run_command(request.get("command"), request.get("args") or {})
+                response = {"ok": True, "result": result}
+            except Exception as e:
+                response = {"ok": False, "error": str(e)}
+            writer.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+            await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+async def start_control_server():
+    """在 RUNNER_CONTROL_SOCKET 指定的路徑上啟動控制通道；重複呼叫或單獨運行時不做任何事。"""
+    global _control_server
+    path = os.environ.get(CONTROL_SOCKET_ENV)
+    if _control_server is not None or not path:
+        return
+    if os.path.exists(path):
+        os.unlink(path)
+    _control_server = await asyncio.start_unix_server(_handle_connection, path=path)
+    print(f"[supervisor_link] 控制通道已在 {path} 上啟動。")